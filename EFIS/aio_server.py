@@ -3,7 +3,7 @@
 
 import asyncio
 import json
-import struct
+import logging
 import time
 import datetime
 import signal
@@ -13,28 +13,68 @@ import aiohttp #pylint: disable=import-error
 import can #pylint: disable=import-error
 
 from enum import Enum
-from flightplan import FlightPlan, compute_navigation
-
+from flightplan import FlightPlan, compute_navigation, compute_route_table
+from flightplan_watcher import FlightPlanWatcher
+from flightplan_cache import FlightPlanCache
+from can_reader import SocketCANReader, count_frames_by_id, read_interface_rx_packets
+from can_schema import CAN_MESSAGE_SCHEMA, CAN_SCHEMA_BY_ID, build_handlers
+from message_timeouts import MessageGroup, MessageTimeoutMonitor
+from encoder_poller import EncoderPoller
+from websocket_delta import DeltaEncoder
+from binary_frame import BINARY_FIELD_NAMES, BinaryFrameEncoder, split_snapshot
+from push_scheduler import PushGroup, PushScheduler
+from websocket_hub import BroadcastHub
+from avionics_data import ALL_GROUPS, GROUP_BITS, AvionicsData, group_mask
+from can_recorder import CanRecorder
+from metrics import PrometheusText
+from loop_monitor import LoopMonitor
+import efis_log
+
+# Hardware libraries are optional so the server (and can_replay.py) also
+# runs on a machine without the encoder or the Pi backlight
 #import board #pylint: disable=import-error
-from adafruit_extended_bus import ExtendedI2C as I2C
-from adafruit_seesaw import seesaw, rotaryio, digitalio #pylint: disable=import-error
-
-from rpi_backlight import Backlight
+try:
+    from adafruit_extended_bus import ExtendedI2C as I2C #pylint: disable=import-error
+    from adafruit_seesaw import seesaw, rotaryio, digitalio #pylint: disable=import-error
+except ImportError:
+    I2C = seesaw = rotaryio = digitalio = None
+
+try:
+    from rpi_backlight import Backlight #pylint: disable=import-error
+except ImportError:
+    Backlight = None
 import os
 
 # =============================================================================
 # DEBUGGING CONSTANTS
 # =============================================================================
-DEBUG = False
-DEBUG_CAN = False
-DEBUG_JSON = False
-DEBUG_QNH = False
-DEBUG_GPS_TIME = False
-DEBUG_BRIGHTNESS = False
 DEBUG_DISABLE_ENCODER = False
 DEBUG_DISABLE_CAN = False
-DEBUG_WEBSOCKET = False
-DEBUG_NAV = False
+
+# =============================================================================
+# LOGGING CONFIGURATION
+# =============================================================================
+# Log records are written by a background thread (efis_log.py). Levels per
+# category can be changed while running: GET /log lists them and
+# POST /log?can=DEBUG sets them (the former DEBUG_* flags)
+LOG_LEVEL = 'INFO'
+LOG_CATEGORY_LEVELS = {}    # e.g. {'can': 'DEBUG', 'websocket': 'DEBUG'}
+LOG_QUEUE_SIZE = 10000      # records waiting for the writer before new ones are dropped
+LOG_JSON_LINES = False      # one JSON object per line instead of text
+LOG_RATE_LIMIT_INTERVAL = 10.0  # seconds between repeats of the same error
+
+log = efis_log.get_logger('server')
+can_log = efis_log.get_logger('can')
+json_log = efis_log.get_logger('json')
+websocket_log = efis_log.get_logger('websocket')
+qnh_log = efis_log.get_logger('qnh')
+brightness_log = efis_log.get_logger('brightness')
+gps_time_log = efis_log.get_logger('gps_time')
+nav_log = efis_log.get_logger('nav')
+encoder_log = efis_log.get_logger('encoder')
+timeouts_log = efis_log.get_logger('timeouts')
+# repeated errors (bad client messages, CAN send failures, ...)
+error_limiter = efis_log.RateLimiter(LOG_RATE_LIMIT_INTERVAL)
 
 # =============================================================================
 # CAN BUS CONFIGURATION
@@ -43,11 +83,43 @@ CAN_QNH_PERIOD = 1000  # ms between messages (1 second between transmitting qnh)
 CAN_BITRATE = 250000
 CAN_CHANNEL = 'can0'
 CAN_TIMEOUT = 0.1
+# CAN ingest backend:
+#   'notifier' - can.Notifier thread feeding a can.AsyncBufferedReader
+#   'native'   - SocketCANReader reading the socket on the event loop
+CAN_READER_BACKEND = 'notifier'
+CAN_READ_BATCH = 64  # max frames read per socket wakeup (native backend)
+# Batched drain: process everything queued in one pass and yield once per
+# batch instead of once per frame
+CAN_BATCH_DRAIN = True
+CAN_MAX_DRAIN = 256  # max frames processed per pass (bounds time between yields)
+# Handler time is measured on one frame in this many (prime, so it does not
+# lock onto the bus schedule) to keep the timer calls off most frames
+CAN_HANDLER_TIMING_SAMPLE = 17
+# Kernel acceptance filters built from CAN_MESSAGE_HANDLERS - frames for IDs
+# without a handler are dropped by SocketCAN before they reach Python
+CAN_KERNEL_FILTERS = True
+# Filter audit: count the traffic the kernel filters are rejecting from the
+# interface's rx counter (0 disables the audit)
+CAN_FILTER_AUDIT_INTERVAL = 60.0  # seconds between audits
+# Debugging only: also sample the unfiltered bus to count rejected frames per
+# ID. Each sample opens a second, unfiltered socket, so for the window the
+# whole bus is copied to user space again - the load the filters remove.
+CAN_FILTER_AUDIT_BY_ID = False
+CAN_FILTER_AUDIT_WINDOW = 1.0  # seconds per sample
+# Flight data recorder (can_recorder.py) - every received frame is appended
+# to rotating binary logs. Disk writes happen on the recorder's own thread.
+CAN_RECORDER_ENABLED = False
+CAN_RECORD_DIR = Path.home() / 'canlogs'
+CAN_RECORD_FILE_BYTES = 64 * 1024 * 1024      # start a new file at this size
+CAN_RECORD_TOTAL_BYTES = 1024 * 1024 * 1024   # delete the oldest files beyond this
+CAN_RECORD_FSYNC_INTERVAL = 30.0              # seconds between fsync calls
+CAN_RECORD_INDEX = True                       # sidecar time index per file (can_index.py)
 
 # CAN message IDs - using enum for type safety
 class CAN_MSG_ID(Enum):
     """CAN message ID enumeration"""
     ALTITUDE_AIRSPEED_VSI = 0x28
+    AOA = 0x29
     OAT = 0x2A
     QNH = 0x2E
     STATIC_PRESSURE = 0x2B
@@ -62,6 +134,40 @@ class CAN_MSG_ID(Enum):
     MAGZ = 0x83
     TIME_SYNC = 0x19
 
+# Pure state messages - each frame replaces the previous value completely, so
+# when several are queued only the newest per ID needs to be processed.
+# Event-like messages (QNH, TIME_SYNC) are always processed in order. GPS1
+# only feeds the navigation task, which uses the newest position anyway.
+CAN_COALESCE_IDS = frozenset({
+    CAN_MSG_ID.ALTITUDE_AIRSPEED_VSI.value,
+    CAN_MSG_ID.AOA.value,
+    CAN_MSG_ID.OAT.value,
+    CAN_MSG_ID.STATIC_PRESSURE.value,
+    CAN_MSG_ID.AHRS_ORIENT.value,
+    CAN_MSG_ID.AHRS_ACCEL.value,
+    CAN_MSG_ID.GPS1.value,
+    CAN_MSG_ID.GPS2.value,
+    CAN_MSG_ID.GPS3.value,
+    CAN_MSG_ID.MAGX.value,
+    CAN_MSG_ID.MAGY.value,
+    CAN_MSG_ID.MAGZ.value,
+})
+
+# Message groups monitored for timeouts - when a group stops arriving its
+# fields (from CAN_MESSAGE_SCHEMA) are cleared. Timeouts are set in
+# MESSAGE_GROUP_TIMEOUTS.
+MESSAGE_GROUP_IDS = {
+    'air_data': (CAN_MSG_ID.ALTITUDE_AIRSPEED_VSI, CAN_MSG_ID.STATIC_PRESSURE),
+    'aoa': (CAN_MSG_ID.AOA,),
+    'oat': (CAN_MSG_ID.OAT,),
+    'ahrs_orient': (CAN_MSG_ID.AHRS_ORIENT,),
+    'ahrs_accel': (CAN_MSG_ID.AHRS_ACCEL,),
+    'gps1': (CAN_MSG_ID.GPS1,),
+    'gps2': (CAN_MSG_ID.GPS2,),
+    'gps3': (CAN_MSG_ID.GPS3,),
+    'magnetometer': (CAN_MSG_ID.MAGX, CAN_MSG_ID.MAGY, CAN_MSG_ID.MAGZ),
+}
+
 # =============================================================================
 # HARDWARE CONFIGURATION
 # =============================================================================
@@ -76,18 +182,109 @@ ENCODER_I2C_ADDRESS = 0x36  # Default I2C address for rotary encoder
 ENCODER_THRESHOLD = 100  # Minimum change in encoder position to register
 ENCODER_BUTTON_PIN = 24  # GPIO pin for encoder button
 SEESAW_EXPECTED_PRODUCT_ID = 4991  # Expected product ID for seesaw encoder
+ENCODER_POLL_RATE = 100  # Hz - encoder/button polling rate of the poller thread
+# Seesaw INT line - when wired, the poller thread reads the encoder only when
+# the seesaw signals a change. None = poll at ENCODER_POLL_RATE.
+ENCODER_INTERRUPT_CHIP = '/dev/gpiochip0'
+ENCODER_INTERRUPT_GPIO = None  # line offset (BCM number) of the seesaw INT pin
 
 # =============================================================================
 # TIMEOUT AND RATE CONFIGURATION
 # =============================================================================
-MESSAGE_TIMEOUT = 0.2  # seconds
+MESSAGE_TIMEOUT = 0.2  # seconds (AHRS groups, sent every 100 ms)
+# Seconds without a frame before a message group's fields are cleared
+# (sender periods: air data 100 ms, AOA/OAT/raw 200 ms, magnetometer 250 ms,
+# GPS 1 s)
+MESSAGE_GROUP_TIMEOUTS = {
+    'air_data': 0.5,
+    'aoa': 1.0,
+    'oat': 1.0,
+    'ahrs_orient': MESSAGE_TIMEOUT,
+    'ahrs_accel': MESSAGE_TIMEOUT,
+    'gps1': 3.0,
+    'gps2': 3.0,
+    'gps3': 3.0,
+    'magnetometer': 1.0,
+}
+# Fields cleared when a group times out, where not every field of the group's
+# messages should be. The AHRS groups keep the set the display has always
+# blanked: turn_rate and calib hold their last value. Groups not listed clear
+# all of their fields.
+MESSAGE_GROUP_CLEARED_ATTRS = {
+    'ahrs_orient': ('yaw', 'pitch', 'roll'),
+    'ahrs_accel': ('accx', 'accy', 'accz'),
+}
 JSON_UPDATE_RATE = 0.05  # seconds between JSON updates (20Hz = 50ms)
+# Delta mode: send a full keyframe on connect and every
+# WEBSOCKET_KEYFRAME_INTERVAL seconds, and only the changed fields in between
+WEBSOCKET_DELTA_MODE = True
+WEBSOCKET_KEYFRAME_INTERVAL = 5.0  # seconds
+# Minimum change before a field counts as changed in delta mode (display
+# precision). Fields not listed are sent on any change.
+WEBSOCKET_DELTA_DEADBANDS = {
+    'vsi': 10,          # ft/min
+    'magx': 1.0,
+    'magy': 1.0,
+    'magz': 1.0,
+}
+# Allow clients to opt into binary frames for the high-rate fields by sending
+# "ready binary" (see binary_frame.py). The remaining fields stay JSON.
+WEBSOCKET_BINARY_FRAMES = True
+# Updates held per websocket client; a slow client drops its oldest update
+# rather than holding up the others (websocket_hub.py)
+WEBSOCKET_CLIENT_QUEUE = 8
+# Change-driven updates (push_scheduler.py): send_json wakes when CAN frames
+# mark a field group dirty instead of every JSON_UPDATE_RATE seconds
+WEBSOCKET_PUSH_SCHEDULER = True
+PUSH_COALESCE_WINDOW = 0.002  # seconds to gather frames that arrive together
+# Field groups pushed to the display: (CAN messages that update them, max rate Hz)
+PUSH_GROUPS = {
+    'attitude': ((CAN_MSG_ID.AHRS_ORIENT, CAN_MSG_ID.AHRS_ACCEL), 50),
+    'air_data': ((CAN_MSG_ID.ALTITUDE_AIRSPEED_VSI, CAN_MSG_ID.STATIC_PRESSURE,
+                  CAN_MSG_ID.AOA, CAN_MSG_ID.OAT, CAN_MSG_ID.QNH), 20),
+    'gps': ((CAN_MSG_ID.GPS1, CAN_MSG_ID.GPS2), 5),
+    'gps_status': ((CAN_MSG_ID.GPS3, CAN_MSG_ID.TIME_SYNC), 2),
+    'magnetometer': ((CAN_MSG_ID.MAGX, CAN_MSG_ID.MAGY, CAN_MSG_ID.MAGZ), 5),
+}
+# Fields set by the navigation task (run_navigation), pushed as their own
+# group at NAV_UPDATE_RATE
+PUSH_NAVIGATION_FIELDS = ('dtk', 'bearing', 'xtrack', 'dist', 'to_from', 'wpt_id',
+                          'route_name', 'active_leg', 'direct_to_active', 'nav_time')
+# Everything else (flight plan, encoder) is sent at this rate when changed
+PUSH_OTHER_RATE = 2  # Hz
+
+# =============================================================================
+# EVENT LOOP MONITORING CONFIGURATION
+# =============================================================================
+# Lag probe, per-task step timing and stack capture of blocking callbacks
+# (loop_monitor.py), served at /loop and /metrics and summarized at shutdown
+LOOP_MONITOR_ENABLED = True
+LOOP_LAG_INTERVAL = 0.1      # seconds between lag probes
+LOOP_SLOW_STEP = 0.02        # task steps longer than this (seconds) count as slow
+LOOP_STACK_THRESHOLD = 0.1   # capture the loop's stack when blocked this long (seconds)
 
 # =============================================================================
 # FLIGHT PLAN CONFIGURATION
 # =============================================================================
 FLIGHTPLAN_DIR = Path.home() / 'flightplans'
-FLIGHTPLAN_POLL_INTERVAL = 5.0  # seconds between checking for new .fpl files
+# The directory is watched with inotify where available; a new or rewritten
+# .fpl file is loaded once no further write arrived for FLIGHTPLAN_DEBOUNCE
+FLIGHTPLAN_INOTIFY = True
+FLIGHTPLAN_DEBOUNCE = 0.05  # seconds
+FLIGHTPLAN_POLL_INTERVAL = 5.0  # seconds between scans without inotify
+# Parsed plans (flightplan_cache.py): the last FLIGHTPLAN_CACHE_SIZE are kept
+# in memory, every one is kept in FLIGHTPLAN_CACHE_DIR (None: memory only) so
+# switching plans or restarting does not parse the XML again. Clients select
+# a plan by file name with json{"select_plan": "<name>.fpl"}
+FLIGHTPLAN_CACHE_SIZE = 8
+FLIGHTPLAN_CACHE_DIR = Path.home() / '.cache' / 'efis' / 'flightplans'
+# Navigation is computed by its own task from the newest GPS position (older
+# positions received in between are skipped) at up to this rate
+NAV_UPDATE_RATE = 5  # Hz
+# Route progress (distance, bearing, ETE/ETA to every remaining waypoint) for
+# the clients that send "ready route", computed by the navigation task for
+# each GPS position it consumes; needs numpy
+ROUTE_PROGRESS_ENABLED = True
 
 # =============================================================================
 # DATA CONVERSION AND SCALING FACTORS
@@ -98,71 +295,60 @@ QNH_TO_HPA_CONVERSION = 2.95299875  # 1 inHg = 2.95299875 hPa (hectopascals)
 QNH_MIN_INHG_X_100 = 2800  # Minimum QNH in inHg × 100 format (28.00 inHg)
 QNH_MAX_INHG_X_100 = 3100  # Maximum QNH in inHg × 100 format (31.00 inHg)
 QNH_DEFAULT_INHG_X_100 = 2992  # Default QNH: 29.92 inHg × 100
-QNH_ACCURACY_MULTIPLIER = 4  # QNH is multiplied by 4 to create inHg × 400 for accuracy preservation in short int
-
-# AHRS scaling factor - AHRS values are sent as 10x actual value
-AHRS_SCALING_FACTOR = 10
+# QNH_ACCURACY_MULTIPLIER (QNH sent as inHg × 400) and AHRS_SCALING_FACTOR
+# (AHRS values sent as 10x actual value) are defined with the message layouts
+# in can_schema.py
 # *****************************************************************************
-# *** CLASS for Avionics Data                                               ***
+# *** CLASS for CAN ingest statistics                                       ***
 # *****************************************************************************
 
-class AvionicsData:
-    """Class to store all the avionics data received over the CAN bus."""
-    # An instance of this class will be used to share the data between the
-    # process_can_messages and send_json functions
+class CanStatistics:
+    """Counters describing how CAN frames were handled by process_can_messages."""
     def __init__(self):
-        # Initialize default values for all data attributes
-        self.altitude = None
-        self.airspeed = None
-        self.vsi = None
-        self.static_pressure = None
-        self.temperature = None
-        self.differential_pressure = None
-        self.oat = None             # Outside Air Temperature (°C, from MAX31865 RTD)
-        self.can_qnh = None
-        self.can_qnh_hpa = None
-        self.yaw = None
-        self.pitch = None
-        self.roll = None
-        self.turn_rate = None
-        self.accx = None
-        self.accy = None
-        self.accz = None
-        self.calib = None
-        self.latitude = None
-        self.longitude = None
-        self.gps_speed = None
-        self.gps_altitude = None
-        self.true_track = None
-        self.gps_fix_quality = None  # 0=No fix, 1=GPS, 2=DGPS (WAAS)
-        self.gps_fix_3d = None       # 1=No fix, 2=2D, 3=3D
-        self.gps_satellites = None   # Number of satellites in use
-        self.gps_hdop = None         # Horizontal dilution of precision
-        self.gps_vdop = None         # Vertical dilution of precision
-        self.magx = None
-        self.magy = None
-        self.magz = None
-        self.tm_year = None
-        self.tm_mon = None
-        self.tm_mday = None
-        self.tm_hour = None
-        self.tm_min = None
-        self.tm_sec = None
-        self.position = None
-        self.pressed = None
-        # Navigation (computed from flight plan + GPS position)
-        self.dtk = None         # desired track (degrees)
-        self.bearing = None     # bearing to active waypoint (degrees)
-        self.xtrack = None      # cross-track error (NM, +right/-left)
-        self.dist = None        # distance to active waypoint (NM)
-        self.to_from = None     # 'TO' or 'FROM'
-        self.wpt_id = None      # active waypoint identifier
-        self.route_name = None  # flight plan route name
-        self.route_waypoints = None  # list of {id, type} dicts for route display
-        self.active_leg = None       # index of active waypoint in route
-        self.direct_to_active = False  # True when Direct-To navigation is active
-        # Internal (not serialized to JSON)
-        self._flight_plan = None  # FlightPlan instance
+        self.frames_received = 0    # frames taken from the reader
+        self.frames_processed = 0   # frames dispatched after coalescing
+        self.frames_coalesced = 0   # frames dropped because a newer one was queued
+        self.batches = 0            # drain passes
+        self.max_batch = 0          # largest number of frames drained in one pass
+        self.coalesced_by_id = {}   # arbitration ID -> frames coalesced
+        self.frames_by_id = {}      # arbitration ID -> frames received
+        self.rejected_total = 0     # frames dropped by the kernel filters
+        self.rejected_by_id = {}    # arbitration ID -> rejected frames seen by the filter audit
+        self.decode_errors_by_id = {}   # arbitration ID -> frames a handler failed to decode
+        self.unhandled_by_id = {}   # arbitration ID -> frames without a handler
+        self.dispatch_seconds = 0.0     # time spent running handlers
+        self.handler_seconds_by_id = {}     # arbitration ID -> timed handler seconds (sampled)
+        self.handler_samples_by_id = {}     # arbitration ID -> timed handler runs
+
+    def record_handler_time(self, msg_id, seconds):
+        """Add one sampled handler run time."""
+        self.handler_seconds_by_id[msg_id] = self.handler_seconds_by_id.get(msg_id, 0.0) + seconds
+        self.handler_samples_by_id[msg_id] = self.handler_samples_by_id.get(msg_id, 0) + 1
+
+    def as_dict(self):
+        """Return the counters as a JSON-serializable dict."""
+        return {
+            'frames_received': self.frames_received,
+            'frames_processed': self.frames_processed,
+            'frames_coalesced': self.frames_coalesced,
+            'batches': self.batches,
+            'max_batch': self.max_batch,
+            'coalesced_by_id': {f"0x{k:02X}": v
+                                for k, v in self.coalesced_by_id.items()},
+            'frames_by_id': {f"0x{k:02X}": v
+                             for k, v in self.frames_by_id.items()},
+            'rejected_total': self.rejected_total,
+            'rejected_by_id': {f"0x{k:02X}": v
+                               for k, v in self.rejected_by_id.items()},
+            'decode_errors_by_id': {f"0x{k:02X}": v
+                                    for k, v in self.decode_errors_by_id.items()},
+            'unhandled_by_id': {f"0x{k:02X}": v
+                                for k, v in self.unhandled_by_id.items()},
+            'dispatch_seconds': round(self.dispatch_seconds, 6),
+            'handler_mean_us_by_id': {
+                f"0x{k:02X}": round(v / self.handler_samples_by_id[k] * 1e6, 2)
+                for k, v in self.handler_seconds_by_id.items()},
+        }
 
 # *****************************************************************************
 
@@ -173,113 +359,213 @@ class AvionicsData:
 # *****************************************************************************
 
 class MyWebSocketResponse:
-    """Class to handle websocket responses"""
-    def __init__(self):
-        self._ws = None
+    """Class to handle websocket responses
+    
+    Args:
+        clock: function returning monotonic seconds, used for the QNH send
+            period (can_replay.py passes the replay clock)
+    """
+    def __init__(self, clock=time.monotonic):
+        # Every connected display client (PFD kiosk, MFD, maintenance laptop)
+        self.hub = BroadcastHub(queue_size=WEBSOCKET_CLIENT_QUEUE)
         self.can_bus = None
         self.data = None
         self.last_qnh = None
-        self.can_qnh_timestamp = int(time.monotonic_ns() / 1000000)
+        self.clock = clock
+        self.can_qnh_timestamp = int(clock() * 1000)
+        # Keyframe/delta encoder for send_json (delta mode), shared by all
+        # JSON clients so each update is serialized once
+        self.delta_encoder = DeltaEncoder(keyframe_interval=WEBSOCKET_KEYFRAME_INTERVAL,
+                                          deadbands=WEBSOCKET_DELTA_DEADBANDS)
+        # Encoders for the clients that asked for binary frames: the binary
+        # frame and a keyframe/delta encoder for the remaining JSON fields
+        self.binary_encoder = BinaryFrameEncoder()
+        self.binary_delta_encoder = DeltaEncoder(
+            keyframe_interval=WEBSOCKET_KEYFRAME_INTERVAL,
+            deadbands=WEBSOCKET_DELTA_DEADBANDS)
+        # Change-driven scheduler for send_json (set by main, may be None)
+        self.push_scheduler = None
+        # Reported at /metrics and /loop (set by main, may be None)
+        self.can_stats = None
+        self.recorder = None
+        self.loop_monitor = None
+        # Log queue statistics for /log (set by main, may be None)
+        self.log_pipeline = None
+        # Parsed flight plans for "select_plan" (set by main, may be None)
+        self.flight_plan_cache = None
+        self._select_plan_task = None
         # Initialize backlight with error handling
         self.backlight = None
         self.last_brightness = None
         try:
             # Check if the backlight path exists
-            if not os.path.exists(BACKLIGHT_PATH):
-                print(f"Warning: Backlight path {BACKLIGHT_PATH} does not exist.")
-                print("Available backlight devices:")
+            if Backlight is None:
+                brightness_log.warning("rpi_backlight is not installed. "
+                                       "Continuing without backlight control.")
+            elif not os.path.exists(BACKLIGHT_PATH):
                 if os.path.exists(BACKLIGHT_DIR):
-                    for item in os.listdir(BACKLIGHT_DIR):
-                        print(f"  - {os.path.join(BACKLIGHT_DIR, item)}")
+                    devices = [os.path.join(BACKLIGHT_DIR, item)
+                               for item in os.listdir(BACKLIGHT_DIR)]
                 else:
-                    print(f"  Backlight directory {BACKLIGHT_DIR} does not exist")
-                print("Continuing without backlight control.")
+                    devices = f"{BACKLIGHT_DIR} does not exist"
+                brightness_log.warning("Backlight path %s does not exist. "
+                                       "Continuing without backlight control.", BACKLIGHT_PATH,
+                                       extra=efis_log.fields(available=devices))
             else:
                 self.backlight = Backlight(backlight_sysfs_path=BACKLIGHT_PATH)
                 # Test if backlight is accessible
                 current_brightness = self.backlight.brightness
-                print(f"Backlight initialized successfully. Current brightness: {current_brightness}%")
+                brightness_log.info("Backlight initialized successfully. Current brightness: %s%%",
+                                    current_brightness)
         except PermissionError as e:
-            print(f"Permission error accessing backlight: {e}")
-            print("You may need to create a udev rule:")
-            print("  echo 'SUBSYSTEM==\"backlight\",RUN+=\"/bin/chmod 666 /sys/class/backlight/%k/brightness /sys/class/backlight/%k/bl_power\"' | sudo tee -a /etc/udev/rules.d/backlight-permissions.rules")
-            print("Then reboot or run: sudo udevadm control --reload-rules && sudo udevadm trigger")
-            print("Continuing without backlight control.")
+            brightness_log.warning(
+                "Permission error accessing backlight: %s. Continuing without backlight "
+                "control. You may need to create a udev rule:\n"
+                "  echo 'SUBSYSTEM==\"backlight\",RUN+=\"/bin/chmod 666 /sys/class/backlight/%%k/brightness /sys/class/backlight/%%k/bl_power\"' | sudo tee -a /etc/udev/rules.d/backlight-permissions.rules\n"
+                "Then reboot or run: sudo udevadm control --reload-rules && sudo udevadm trigger", e)
         except Exception as e:
-            print(f"Warning: Could not initialize backlight: {e}")
-            print("Continuing without backlight control.")
+            brightness_log.warning("Could not initialize backlight: %s. "
+                                   "Continuing without backlight control.", e)
             self.backlight = None
 
-    @property
-    def web_socket(self):
-        """Returns the web socket once it has been created"""
-        return self._ws
+    async def metrics_handler(self, request):
+        """Serve the statistics at /metrics in the Prometheus text format"""
+        return web.Response(body=format_metrics(self).encode('utf-8'),
+                            headers={'Content-Type': PrometheusText.CONTENT_TYPE})
+
+    async def loop_handler(self, request):
+        """Serve the event loop lag, task and blocked stack statistics as JSON"""
+        if self.loop_monitor is None:
+            return web.Response(status=404, text="loop monitor disabled")
+        return web.json_response(self.loop_monitor.stats())
+
+    async def log_handler(self, request):
+        """Show (GET) or set (POST) the log levels per category
+        
+        POST /log?can=DEBUG&websocket=INFO sets levels; an empty level makes
+        a category follow the 'all' level again. The reply lists the levels,
+        the categories and the log queue statistics.
+        """
+        if request.method == 'POST':
+            try:
+                for category, level in request.query.items():
+                    efis_log.set_level(category, level or None)
+            except ValueError as e:
+                return web.json_response({'error': str(e)}, status=400)
+            log.info("Log levels changed", extra=efis_log.fields(**request.query))
+        return web.json_response({
+            'levels': efis_log.levels(),
+            'categories': efis_log.CATEGORIES,
+            'queue': self.log_pipeline.stats() if self.log_pipeline is not None else None,
+        })
+
+    def request_keyframe(self, binary):
+        """Send a full keyframe to the JSON or binary clients on the next update"""
+        if binary:
+            self.binary_delta_encoder.request_keyframe()
+        else:
+            self.delta_encoder.request_keyframe()
+        if self.push_scheduler is not None:
+            self.push_scheduler.request_flush()
+
+    def send_client_keyframe(self, client):
+        """Send a keyframe to one client that saw a gap in the delta
+        sequence numbers, leaving the other clients on deltas
+        
+        The keyframe holds the state the deltas sent so far left the clients
+        of its mode in (DeltaEncoder.client_keyframe), so the client follows
+        the next delta. Before the first update it falls back to a keyframe
+        for every client of the mode.
+        """
+        encoder = self.binary_delta_encoder if client.binary else self.delta_encoder
+        text = encoder.client_keyframe() if WEBSOCKET_DELTA_MODE else None
+        if text is None:
+            self.request_keyframe(client.binary)
+            return
+        client.keyframes += 1
+        self.hub.publish(text, client=client)
 
     # Function that is called when a request to create a websocket is received
     async def handler(self, request):
         """Handler to process web socket requests"""
-        if DEBUG_QNH:
-            print("handler called")
-        # close an existing web socket if it exists and is not already closing/closed
-        if self._ws is not None and not self._ws.closed:
-            # Check if websocket is in closing state (if available) before attempting to close
-            if hasattr(self._ws, 'closing') and self._ws.closing:
-                # Already closing, wait for it to complete
-                pass
-            else:
-                await self._ws.close()
+        websocket_log.debug("handler called for %s", request.remote)
         # Create a websocket response object and prepare it for use
         web_socket = web.WebSocketResponse()
         await web_socket.prepare(request)
 
-        # save the request now that it is prepared
-        # this allows us to use the object elsewhere
-        self._ws = web_socket
+        # register the client with the hub - existing clients stay connected.
+        # A new client gets JSON until it asks for binary frames, starting
+        # from a full keyframe
+        client = self.hub.add(web_socket, name=str(request.remote))
+        self.request_keyframe(binary=False)
         try:
             # Iterate over the messages (msg) return by the Web Socket (web_socket)
             # I expect we should sit in this loop until told to close the socket
             async for msg in web_socket:
-                if DEBUG_WEBSOCKET:
-                    print("websocket message received")
+                websocket_log.debug("websocket message received")
                 if msg.type == aiohttp.WSMsgType.TEXT:
                     # Check message length before slicing to avoid IndexError
                     if len(msg.data) >= 5 and msg.data[0:5] == 'close':
-                        if DEBUG_WEBSOCKET:
-                            print("websocket close message")
+                        websocket_log.debug("websocket close message")
                         await web_socket.close()
                     elif len(msg.data) >= 5 and msg.data[0:5] == 'ready':
-                        # do nothing really other than recognize that ready
-                        # was sent
-                        if DEBUG_WEBSOCKET:
-                            print("websocket ready message")
+                        # the client is ready for data - start it with a
+                        # full keyframe. "ready binary" opts into binary
+                        # frames, "ready route" into route progress updates
+                        options = msg.data[5:].split()
+                        client.binary = WEBSOCKET_BINARY_FRAMES and 'binary' in options
+                        if ROUTE_PROGRESS_ENABLED and 'route' in options:
+                            client.topics.add('route')
+                        websocket_log.debug("websocket ready message (binary=%s, topics=%s)",
+                                            client.binary, client.topics)
+                        self.request_keyframe(client.binary)
+                    # The client saw a gap in the delta sequence numbers -
+                    # resend the state to this client only
+                    elif len(msg.data) >= 8 and msg.data[0:8] == 'keyframe':
+                        websocket_log.debug("websocket keyframe request")
+                        self.send_client_keyframe(client)
                     # The efis-display.js will send json data prefixed with 'json'
                     elif len(msg.data) >= 4 and msg.data[0:4] == 'json':
-                        if DEBUG_WEBSOCKET:
-                            print("json message")
+                        websocket_log.debug("json message")
                         # process the json send from the efis-display.js
                         self.process_json_data(msg)
                 elif msg.type == aiohttp.WSMsgType.ERROR:
-                    if DEBUG_WEBSOCKET:
-                        print('ws connection closed with exception %s' % web_socket.exception())
-            if DEBUG_WEBSOCKET:
-                print('websocket connection closed')
+                    websocket_log.debug("ws connection closed with exception %s",
+                                        web_socket.exception())
+            websocket_log.debug("websocket connection closed")
         finally:
             # Always execute this code
             # Close the web socket
-            if DEBUG_WEBSOCKET:
-                print('websocket connection closed in finally')
+            websocket_log.debug("websocket connection closed in finally")
             await web_socket.close()
+            await self.hub.remove(client)
+            if websocket_log.isEnabledFor(logging.DEBUG):
+                websocket_log.debug("websocket client statistics",
+                                    extra=efis_log.fields(**client.stats()))
 
         # Return the websocket response object - required by aiohttp's API
         # The framework uses this return value to manage the websocket connection lifecycle
-        # Note: The websocket is also stored in self._ws for access via the web_socket property
         return web_socket
 
+    def send_input_event(self, position, pressed):
+        """Push an encoder/button change to every client immediately
+        
+        Args:
+            position: encoder position
+            pressed: True while the button is pressed
+        """
+        if self.hub.clients:
+            self.hub.publish(json.dumps({'input': {'position': position,
+                                                   'pressed': pressed}}))
+
+    def route_hub(self):
+        """Return the hub if route progress tables are sent, else None."""
+        return self.hub if ROUTE_PROGRESS_ENABLED else None
+
     def process_json_data(self, web_socket_message):
         """Process any json that is contained in the web socket message"""
 
-        if DEBUG_CAN:
-            print("websocket message with json received")
+        websocket_log.debug("websocket message with json received")
 
         # decode the json
         try:
@@ -294,8 +580,8 @@ class MyWebSocketResponse:
                 qnh = int(qnh)
                 qnh = max(QNH_MIN_INHG_X_100, min(QNH_MAX_INHG_X_100, qnh))
                 
-                if DEBUG_QNH:
-                    print(f"QNH from json= {qnh} (clamped to range {QNH_MIN_INHG_X_100}-{QNH_MAX_INHG_X_100})")
+                qnh_log.debug("QNH from json= %s (clamped to range %s-%s)",
+                              qnh, QNH_MIN_INHG_X_100, QNH_MAX_INHG_X_100)
                 
                 # Process QNH (qnh is in inHg × 100 format)
                 self.process_qnh(qnh)
@@ -303,8 +589,7 @@ class MyWebSocketResponse:
                 # Process brightness if provided
                 brightness = dict_object.get('brightness', None)
                 if brightness is not None:
-                    if DEBUG_BRIGHTNESS:
-                        print(f'Brightness received from client: {brightness}')
+                    brightness_log.debug("Brightness received from client: %s", brightness)
                     
                     if self.backlight is not None:
                         try:
@@ -314,13 +599,13 @@ class MyWebSocketResponse:
                             if brightness != self.last_brightness:
                                 self.backlight.brightness = brightness
                                 self.last_brightness = brightness
-                                if DEBUG_BRIGHTNESS:
-                                    print(f'Backlight brightness set to: {brightness}%')
+                                brightness_log.debug("Backlight brightness set to: %s%%",
+                                                     brightness)
                         except (ValueError, TypeError, AttributeError) as e:
-                            print(f"Error setting backlight brightness: {e}")
+                            error_limiter.log(brightness_log, logging.ERROR, 'backlight',
+                                              "Error setting backlight brightness: %s", e)
                     else:
-                        if DEBUG_BRIGHTNESS:
-                            print("Backlight not available, skipping brightness update")
+                        brightness_log.debug("Backlight not available, skipping brightness update")
 
                 # Process active_leg selection (leg mode from route overlay)
                 active_leg = dict_object.get('active_leg', None)
@@ -330,9 +615,8 @@ class MyWebSocketResponse:
                     if 1 <= active_leg < len(fp.waypoints):
                         fp.active_leg = active_leg
                         fp.direct_to_origin = None  # clear any Direct-To
-                        self.data.active_leg = active_leg
-                        self.data.direct_to_active = False
-                        print(f"Leg selected: {fp.active_waypoint_id} (leg {active_leg})")
+                        navigation_changed(self.data, self.push_scheduler, self.route_hub())
+                        nav_log.info("Leg selected: %s (leg %d)", fp.active_waypoint_id, active_leg)
 
                 # Process Direct-To command
                 direct_to = dict_object.get('direct_to', None)
@@ -343,22 +627,28 @@ class MyWebSocketResponse:
                         lat = self.data.latitude / 1_000_000
                         lon = self.data.longitude / 1_000_000
                         if fp.activate_direct_to(index, lat, lon):
-                            self.data.active_leg = fp.active_leg
-                            self.data.direct_to_active = True
+                            navigation_changed(self.data, self.push_scheduler, self.route_hub())
 
                 # Process Cancel Direct-To command
                 if dict_object.get('cancel_direct_to', False) and self.data._flight_plan is not None:
                     self.data._flight_plan.cancel_direct_to()
-                    self.data.direct_to_active = False
+                    navigation_changed(self.data, self.push_scheduler, self.route_hub())
+
+                # Process flight plan selection (a file in FLIGHTPLAN_DIR)
+                select_plan = dict_object.get('select_plan', None)
+                if select_plan is not None and self.flight_plan_cache is not None:
+                    self._select_plan_task = asyncio.get_running_loop().create_task(
+                        select_flight_plan(self.data, self.flight_plan_cache,
+                                           str(select_plan), self.push_scheduler))
 
             except (KeyError, ValueError, TypeError) as e:
                 # Data not received or invalid format, ignore it
-                if DEBUG:
-                    print(f"Error processing JSON data: {e}")
+                error_limiter.log(websocket_log, logging.DEBUG, 'json data',
+                                  "Error processing JSON data: %s", e)
         except (json.JSONDecodeError, IndexError, AttributeError) as e:
             # If we didn't get valid JSON data, just ignore it
-            if DEBUG:
-                print(f"Error decoding JSON message: {e}")
+            error_limiter.log(websocket_log, logging.DEBUG, 'json decode',
+                              "Error decoding JSON message: %s", e)
 
     def process_qnh(self, qnh):
         """Determine if qnh needs to be sent on the can bus based on
@@ -372,36 +662,26 @@ class MyWebSocketResponse:
             QNH is sent on CAN bus if it has changed from the last sent value
             or if CAN_QNH_PERIOD milliseconds have elapsed since the last send.
         """
-        current_time_millis = int(time.monotonic_ns() / 1000000)
+        current_time_millis = int(self.clock() * 1000)
         if (qnh != self.last_qnh or
             current_time_millis > self.can_qnh_timestamp + CAN_QNH_PERIOD):
 
-            if DEBUG_CAN:
-                print("prepare to send QNH on CAN")
-                print(f"qnh = {qnh}")
-            if DEBUG_QNH:
-                print(", sending via CAN")
+            qnh_log.debug("qnh = %s, sending via CAN", qnh)
 
             message = self.pack_can_qnh_msg(qnh)
             self.can_qnh_timestamp = current_time_millis
             self.last_qnh = qnh
-            #print(f"QNH: {qnh}, Last QNH:{self.last_qnh}")
-            #print(f"Sending can message {message}")
-
-            if DEBUG_CAN:
-                print(self.can_bus)
 
             # Check if CAN bus is available before sending
             if self.can_bus is not None:
                 try:
                     self.can_bus.send(message)
-                    if DEBUG_CAN:
-                        print(f"Message sent on {self.can_bus.channel_info}")
+                    can_log.debug("Message sent on %s", self.can_bus.channel_info)
                 except Exception as e:
-                    print(f"Error sending CAN message: {e}")
+                    error_limiter.log(can_log, logging.ERROR, 'qnh send',
+                                      "Error sending CAN message: %s", e)
             else:
-                if DEBUG_CAN:
-                    print("CAN bus not available, cannot send QNH message")
+                can_log.debug("CAN bus not available, cannot send QNH message")
 
     def pack_can_qnh_msg(self, qnh):
         """ Pack the qnh value into a message for sending on the CAN bus.
@@ -414,16 +694,14 @@ class MyWebSocketResponse:
         """
         # Convert from inHg × 100 to hPa (qnh is in inHg × 100, so divide by conversion factor)
         qnh_hpa = int(qnh / QNH_TO_HPA_CONVERSION)
-        # qnh is in inHg × 100, so qnh*QNH_ACCURACY_MULTIPLIER gives inHg × 400 for accuracy preservation
-        qnh_message = struct.pack("<hhBBBB",
-                                    qnh_hpa,
-                                    int(qnh * QNH_ACCURACY_MULTIPLIER),
-                                    0,0,0,0)
+        # The QNH schema entry sends qnh × QNH_ACCURACY_MULTIPLIER (inHg × 400)
+        # for accuracy preservation
+        qnh_message = CAN_SCHEMA_BY_ID[CAN_MSG_ID.QNH.value].encode(
+            {'can_qnh_hpa': qnh_hpa, 'can_qnh': qnh})
         message = can.Message(arbitration_id=CAN_MSG_ID.QNH.value,
                               data=qnh_message,
                               is_extended_id=False)
-        if DEBUG_CAN:
-            print(message)
+        can_log.debug("%s", message)
         return message
     
 # *****************************************************************************
@@ -433,9 +711,11 @@ class MyWebSocketResponse:
 # -----------------------------------------------------------------------------
 # --- handler = the response handler to be used for the websocket serve     ---
 # -----------------------------------------------------------------------------
-async def create_servers(websocket_handler):
+async def create_servers(websocket_handler, metrics_handler=None, loop_handler=None,
+                         log_handler=None):
     """Create web server to handle requests for both the web page and the
-        websocket"""
+        websocket, and the /metrics, /loop and /log pages when their
+        handlers are given"""
 
     # -------------------------------------------------------------------------
     # --- Create the web server                                             ---
@@ -452,6 +732,12 @@ async def create_servers(websocket_handler):
     server.add_routes([web.get('/', get_index),
                        web.static('/support/','./support/'),
                        web.get('/ws', websocket_handler)])
+    if metrics_handler is not None:
+        server.add_routes([web.get('/metrics', metrics_handler)])
+    if loop_handler is not None:
+        server.add_routes([web.get('/loop', loop_handler)])
+    if log_handler is not None:
+        server.add_routes([web.get('/log', log_handler), web.post('/log', log_handler)])
 
     # Create the application runner
     runner = web.AppRunner(server)
@@ -467,7 +753,7 @@ async def create_servers(websocket_handler):
     # Start the Site
     await site.start()
 
-    print("aio-Server.py has started the web server.")
+    log.info("aio-Server.py has started the web server.")
 
 # -----------------------------------------------------------------------------
 # --- handler for get_index                                                ---
@@ -487,18 +773,16 @@ async def get_index(request):
             resolved_path = index_path.resolve()
             script_dir_resolved = script_dir.resolve()
             if not str(resolved_path).startswith(str(script_dir_resolved)):
-                if DEBUG:
-                    print(f"Security warning: index.html path outside script directory: {resolved_path}")
+                log.warning("Security warning: index.html path outside script directory: %s",
+                            resolved_path)
                 return web.Response(status=403, text="Access denied")
         except (OSError, ValueError) as e:
-            if DEBUG:
-                print(f"Error resolving path: {e}")
+            log.error("Error resolving path: %s", e)
             return web.Response(status=500, text="Error resolving file path")
         
         # Check if file exists before trying to open it
         if not index_path.exists():
-            if DEBUG:
-                print(f"Warning: index.html not found at {index_path}")
+            log.warning("index.html not found at %s", index_path)
             return web.Response(status=404, text="index.html not found")
         
         # Use context manager to ensure file is properly closed
@@ -507,640 +791,914 @@ async def get_index(request):
                 index_content = index_file.read()
             return web.Response(text=index_content, content_type="text/html")
         except (IOError, OSError) as e:
-            if DEBUG:
-                print(f"Error reading index.html: {e}")
+            log.error("Error reading index.html: %s", e)
             return web.Response(status=500, text="Error reading index.html")
     return web.Response(status=404)
 
-
-
-
 # -----------------------------------------------------------------------------
-# --- CAN Message Processing Helper Functions                                 ---
+# --- handler for /metrics                                                  ---
 # -----------------------------------------------------------------------------
 
-def validate_message_length(msg, expected_length, message_name):
-    """Validate CAN message data length
+def _id_label(msg_id):
+    return {'id': f"0x{msg_id:02X}"}
+
+def format_metrics(web_socket_response):
+    """Render the server statistics in the Prometheus text format
+    
+    Only reads counters the hot paths already keep, so a scrape costs
+    nothing between scrapes. Frame rates per ID are the rate() of
+    efis_can_frames_total.
     
     Args:
-        msg: CAN message object
-        expected_length: Expected minimum data length in bytes
-        message_name: Name of message type for error messages
+        web_socket_response (MyWebSocketResponse): holds the hub, the push
+            scheduler, the CAN statistics and the recorder
         
     Returns:
-        bool: True if valid, False otherwise
+        str: exposition text
     """
-    if len(msg.data) < expected_length:
-        if DEBUG_CAN:
-            print(f"Invalid data length for {message_name} message: {len(msg.data)} bytes, expected {expected_length}")
-        return False
-    return True
+    out = PrometheusText()
+    can_stats = web_socket_response.can_stats
+    if can_stats is not None:
+        out.counter('efis_can_frames_received_total', "CAN frames taken from the reader",
+                    can_stats.frames_received)
+        out.counter('efis_can_frames_processed_total', "CAN frames dispatched after coalescing",
+                    can_stats.frames_processed)
+        out.counter('efis_can_frames_coalesced_total', "CAN frames dropped for a newer frame",
+                    can_stats.frames_coalesced)
+        out.counter('efis_can_batches_total', "CAN drain passes", can_stats.batches)
+        out.gauge('efis_can_max_batch', "Largest number of frames drained in one pass",
+                  can_stats.max_batch)
+        out.counter('efis_can_dispatch_seconds_total', "Time spent running CAN handlers",
+                    can_stats.dispatch_seconds)
+        out.counter('efis_can_rejected_frames_total', "Frames dropped by the kernel filters",
+                    can_stats.rejected_total)
+        for msg_id, count in sorted(can_stats.frames_by_id.items()):
+            out.counter('efis_can_frames_total', "CAN frames received per ID",
+                        count, _id_label(msg_id))
+        for msg_id, count in sorted(can_stats.decode_errors_by_id.items()):
+            out.counter('efis_can_decode_errors_total', "CAN frames a handler failed to decode",
+                        count, _id_label(msg_id))
+        for msg_id, count in sorted(can_stats.unhandled_by_id.items()):
+            out.counter('efis_can_unhandled_frames_total', "CAN frames without a handler",
+                        count, _id_label(msg_id))
+        for msg_id, seconds in sorted(can_stats.handler_seconds_by_id.items()):
+            out.summary('efis_can_handler_seconds',
+                        f"CAN handler run time (1 in {CAN_HANDLER_TIMING_SAMPLE} frames timed)",
+                        seconds, can_stats.handler_samples_by_id[msg_id], _id_label(msg_id))
+
+    hub = web_socket_response.hub
+    out.gauge('efis_websocket_clients', "Connected websocket clients", len(hub.clients))
+    out.counter('efis_websocket_published_total', "Updates published to the clients",
+                hub.published)
+    for binary, histogram in hub.data_age.items():
+        out.histogram('efis_websocket_data_age_seconds',
+                      "CAN receive to websocket send complete",
+                      histogram, {'mode': 'binary' if binary else 'json'})
+    for client in hub.clients:
+        labels = {'client': client.name}
+        out.counter('efis_websocket_client_sent_total', "Updates sent per client",
+                    client.sent, labels)
+        out.counter('efis_websocket_client_dropped_total', "Updates dropped for a full queue",
+                    client.dropped, labels)
+
+    scheduler = web_socket_response.push_scheduler
+    if scheduler is not None:
+        for name, group in scheduler.groups.items():
+            out.histogram('efis_push_latency_seconds',
+                          "CAN receive to update publish per field group",
+                          group.latency, {'group': name})
+
+    loop_monitor = web_socket_response.loop_monitor
+    if loop_monitor is not None:
+        loop_monitor.write_metrics(out)
+
+    recorder = web_socket_response.recorder
+    if recorder is not None:
+        out.counter('efis_recorder_frames_written_total', "Frames written to the CAN log",
+                    recorder.frames_written)
+        out.counter('efis_recorder_frames_dropped_total', "Frames the CAN log writer lost",
+                    recorder.frames_dropped)
+    return out.text()
+
+
+
 
 # -----------------------------------------------------------------------------
-# --- Individual CAN Message Handler Functions                                ---
+# --- CAN Message Post-Decode Hooks                                          ---
 # -----------------------------------------------------------------------------
+# The field decoding for every message is generated from CAN_MESSAGE_SCHEMA
+# (can_schema.py). These hooks run after the fields have been stored, for the
+# messages that need more than unpacking and scaling.
 
-async def process_altitude_message(msg, data, last_received_times):
-    """Process altitude/airspeed/VSI message
+def note_position(msg, data):
+    """GPS1 hook - hand the new position to the navigation task
+    
+    Only the receive time is noted; run_navigation computes navigation
+    from the newest position at up to NAV_UPDATE_RATE, outside the CAN
+    dispatch.
     
     Args:
         msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
+        data: AvionicsData instance (latitude/longitude already updated)
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True (the position itself was decoded successfully)
     """
-    if not validate_message_length(msg, 8, "altitude"):
-        return False
-    
-    # Calculate altitude manually (may be used for validation/debugging)
-    data.altitude = msg.data[2] | (msg.data[3]<<8) | (msg.data[4]<<16) | (msg.data[5]<<24)
-    
-    try:
-        # struct.unpack for altitude is here - unpacks airspeed (h), altitude (l), vsi (h)
-        (data.airspeed, data.altitude, data.vsi) = struct.unpack("<hlh", msg.data)
-        if DEBUG:
-            print(data.vsi, data.airspeed)
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking altitude message: {e}")
-        return False
+    data.mark_position(msg.timestamp)
+    return True
 
-async def process_static_pressure_message(msg, data, last_received_times):
-    """Process static pressure and temperature message
+def check_gps_time(msg, data):
+    """TIME_SYNC hook - validate the GPS date/time fields
     
     Args:
         msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
+        data: AvionicsData instance (tm_* fields already updated)
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if the fields form a valid date/time, False otherwise
     """
-    if not validate_message_length(msg, 8, "static pressure"):
-        return False
-    
     try:
-        (static_pressure, temperature, differential_pressure, _, _, _) = (
-            struct.unpack("<hbhbbb", msg.data)
+        gps_datetime = datetime.datetime(
+            data.tm_year,
+            data.tm_mon,
+            data.tm_mday,
+            data.tm_hour,
+            data.tm_min,
+            data.tm_sec,
+            tzinfo=None
         )
-        data.static_pressure = static_pressure
-        data.temperature = temperature
-        data.differential_pressure = differential_pressure
+        gps_time_log.debug("%s", gps_datetime)
         return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking static pressure message: {e}")
-        return False
-
-async def process_oat_message(msg, data, last_received_times):
-    """Process OAT (Outside Air Temperature) message from MAX31865 RTD sensor"""
-    if not validate_message_length(msg, 8, "OAT"):
-        return False
-    try:
-        (oat_raw, humidity, _, _, _, _, _) = struct.unpack("<hBBBBBB", msg.data)
-        data.oat = oat_raw / 10.0  # Convert from °C × 10 to °C
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking OAT message: {e}")
+    except (ValueError, TypeError) as e:
+        error_limiter.log(gps_time_log, logging.DEBUG, 'gps datetime',
+                          "Error creating GPS datetime: %s", e)
         return False
 
-async def process_qnh_message(msg, data, last_received_times):
-    """Process QNH message
-    
-    Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
-        
-    Returns:
-        bool: True if successful, False otherwise
-    """
-    if not validate_message_length(msg, 8, "QNH"):
-        return False
-    
-    try:
-        (qnh_hpa, qnhx4, dummy_3, dummy_4, dummy_5, dummy_6) = (
-            struct.unpack("<hhBBBB", msg.data))
-        # qnhx4 is inHg × 400, divide by QNH_ACCURACY_MULTIPLIER to convert to inHg
-        data.can_qnh = qnhx4 / QNH_ACCURACY_MULTIPLIER
-        data.can_qnh_hpa = qnh_hpa
-        if DEBUG_JSON:
-            print(data.can_qnh)
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking QNH message: {e}")
-        return False
+# -----------------------------------------------------------------------------
+# --- CAN Message Handler Dispatch Table                                      ---
+# -----------------------------------------------------------------------------
 
-async def process_ahrs_orient_message(msg, data, last_received_times):
-    """Process AHRS orientation message (roll, pitch, yaw)
+# Message handler dispatch table - maps CAN message IDs to decoder functions
+# generated from CAN_MESSAGE_SCHEMA. All handlers have the signature
+# handler(msg, data, last_received_times) -> bool
+CAN_MESSAGE_HANDLERS = build_handlers(CAN_MESSAGE_SCHEMA, post_hooks={
+    CAN_MSG_ID.GPS1.value: note_position,
+    CAN_MSG_ID.TIME_SYNC.value: check_gps_time,
+})
+# AvionicsData field groups (changed-groups mask) each handler writes
+CAN_HANDLER_GROUPS = {entry.msg_id: group_mask(entry.attrs)
+                      for entry in CAN_MESSAGE_SCHEMA}
+
+def build_can_filters(handlers=None):
+    """Build SocketCAN acceptance filters from the handler table
     
     Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp
+        handlers: dict of message ID -> handler (default: CAN_MESSAGE_HANDLERS)
         
     Returns:
-        bool: True if successful, False otherwise
+        list: python-can filter dicts, one exact standard-ID match per handler
     """
-    if DEBUG_CAN:
-        print("orient")
-    
-    if not validate_message_length(msg, 8, "AHRS orient"):
-        return False
-    
-    try:
-        (data.yaw, data.pitch, data.roll, data.turn_rate) = (
-            struct.unpack("<hhhh", msg.data)
-        )
-        # Data received from Arduino already converted from sensor native frame (NWU)
-        # to aircraft standard (NED). Only scaling needed here.
-        # AHRS values are sent as 10x actual value, divide by AHRS_SCALING_FACTOR
-        data.yaw = data.yaw / AHRS_SCALING_FACTOR
-        data.pitch = data.pitch / AHRS_SCALING_FACTOR
-        data.roll = data.roll / AHRS_SCALING_FACTOR
-        data.turn_rate = data.turn_rate / AHRS_SCALING_FACTOR
-        last_received_times[CAN_MSG_ID.AHRS_ORIENT.value] = time.time()
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking AHRS orient message: {e}")
-        return False
+    if handlers is None:
+        handlers = CAN_MESSAGE_HANDLERS
+    return [{'can_id': msg_id, 'can_mask': 0x7FF, 'extended': False}
+            for msg_id in sorted(handlers)]
 
-async def process_ahrs_accel_message(msg, data, last_received_times):
-    """Process AHRS accelerometer message
+def apply_can_filters(bus=None):
+    """Load the filters for the current handler table into the kernel
     
     Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp
-        
-    Returns:
-        bool: True if successful, False otherwise
+        bus: python-can bus (default: the bus opened by main)
     """
-    if DEBUG_CAN:
-        print("accel")
-    
-    if not validate_message_length(msg, 8, "AHRS accel"):
-        return False
-    
+    if bus is None:
+        bus = _can_bus
+    if bus is None or not CAN_KERNEL_FILTERS:
+        return
     try:
-        (data.accx, data.accy, data.accz, data.calib) = (
-            struct.unpack("<hhhh", msg.data)
-        )
-        last_received_times[CAN_MSG_ID.AHRS_ACCEL.value] = time.time()
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking AHRS accel message: {e}")
-        return False
-
-async def process_gps1_message(msg, data, last_received_times):
-    """Process GPS1 message (latitude, longitude)
+        bus.set_filters(build_can_filters())
+        if can_log.isEnabledFor(logging.DEBUG):
+            can_log.debug("CAN filters set for IDs: %s",
+                          ', '.join(f'0x{i:02X}' for i in sorted(CAN_MESSAGE_HANDLERS)))
+    except Exception as e:
+        can_log.error("Error setting CAN filters: %s", e)
+
+def register_can_handler(msg_id, handler, groups=ALL_GROUPS):
+    """Add or replace the handler for a CAN message ID and accept it in the
+    kernel filters
     
     Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
-        
-    Returns:
-        bool: True if successful, False otherwise
+        msg_id: CAN arbitration ID
+        handler: function(msg, data, last_received_times) -> bool
+        groups: AvionicsData changed-groups mask of the fields the handler
+            writes (avionics_data.group_mask); by default every group
     """
-    if not validate_message_length(msg, 8, "GPS1"):
-        return False
-    
-    try:
-        (latitude, longitude) = struct.unpack("<ll", msg.data)
-        #TODO: Check if we are carrying enough significant digits
-        #       in the following calculations
-        data.latitude = latitude  # / 10^6
-        data.longitude = longitude  # / 10^6
-
-        # Compute flight plan navigation if a plan is loaded
-        if data._flight_plan is not None:
-            nav = compute_navigation(latitude, longitude, data._flight_plan)
-            if nav:
-                data.dtk = nav['dtk']
-                data.bearing = nav['bearing']
-                data.xtrack = nav['xtrack']
-                data.dist = nav['dist']
-                data.to_from = nav['to_from']
-                data.wpt_id = nav['wpt_id']
-                data.route_name = nav['route_name']
-                # Keep active_leg and direct-to state in sync
-                data.active_leg = data._flight_plan.active_leg
-                data.direct_to_active = data._flight_plan.direct_to_active
-                if DEBUG_NAV:
-                    print(f"Nav: {nav['wpt_id']} DTK={nav['dtk']} "
-                          f"BRG={nav['bearing']} XTK={nav['xtrack']} "
-                          f"DST={nav['dist']} {nav['to_from']}")
-            else:
-                data.dtk = data.bearing = data.xtrack = None
-                data.dist = data.to_from = data.wpt_id = data.route_name = None
+    CAN_MESSAGE_HANDLERS[msg_id] = handler
+    CAN_HANDLER_GROUPS[msg_id] = groups
+    apply_can_filters()
 
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking GPS1 message: {e}")
-        return False
-
-async def process_gps2_message(msg, data, last_received_times):
-    """Process GPS2 message (speed, altitude, track)
+def unregister_can_handler(msg_id):
+    """Remove the handler for a CAN message ID and stop accepting it in the
+    kernel filters
     
     Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
-        
-    Returns:
-        bool: True if successful, False otherwise
+        msg_id: CAN arbitration ID
     """
-    if not validate_message_length(msg, 8, "GPS2"):
-        return False
-    
-    try:
-        (data.gps_speed, data.gps_altitude, data.true_track, _) = (
-            struct.unpack("<hhhh", msg.data)
-        )
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking GPS2 message: {e}")
-        return False
-
-async def process_gps3_message(msg, data, last_received_times):
-    """Process GPS3 message (GPS status: fix quality, satellites, HDOP, VDOP)
+    CAN_HANDLER_GROUPS.pop(msg_id, None)
+    if CAN_MESSAGE_HANDLERS.pop(msg_id, None) is not None:
+        apply_can_filters()
 
-    Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
+# -----------------------------------------------------------------------------
+# --- Asynchronous process to get a message from the CAN bus buffer and      ---
+# --- process it.                                                           ---
+# -----------------------------------------------------------------------------
 
-    Returns:
-        bool: True if successful, False otherwise
-    """
-    if not validate_message_length(msg, 8, "GPS3"):
-        return False
+def coalesce_can_batch(batch, can_stats=None):
+    """Keep only the newest frame per ID for pure state messages.
 
-    try:
-        (fq, fq3d, sats, _, hdop_raw, vdop_raw) = (
-            struct.unpack("<BBBBhh", msg.data)
-        )
-        data.gps_fix_quality = fq
-        data.gps_fix_3d = fq3d
-        data.gps_satellites = sats
-        data.gps_hdop = round(hdop_raw / 100.0, 1)
-        data.gps_vdop = round(vdop_raw / 100.0, 1)
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking GPS3 message: {e}")
-        return False
+    Frames for IDs in CAN_COALESCE_IDS are dropped when a newer frame with
+    the same ID is later in the batch. All other frames are kept. Relative
+    order of the kept frames is preserved.
 
-async def process_magx_message(msg, data, last_received_times):
-    """Process magnetometer X message
-    
     Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
-        
-    Returns:
-        bool: True if successful, False otherwise
-    """
-    if not validate_message_length(msg, 4, "MAGX"):
-        return False
-    
-    try:
-        # keep only the first element of the tuple returned
-        data.magx = struct.unpack("<f", msg.data)[0]
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking MAGX message: {e}")
-        return False
+        batch: list of CAN messages in arrival order
+        can_stats: optional CanStatistics to count coalesced frames in
 
-async def process_magy_message(msg, data, last_received_times):
-    """Process magnetometer Y message
-    
-    Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
-        
     Returns:
-        bool: True if successful, False otherwise
+        list: the frames to process
     """
-    if not validate_message_length(msg, 4, "MAGY"):
-        return False
-    
-    try:
-        # keep only the first element of the tuple returned
-        data.magy = struct.unpack("<f", msg.data)[0]
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking MAGY message: {e}")
-        return False
-
-async def process_magz_message(msg, data, last_received_times):
-    """Process magnetometer Z message
+    if len(batch) < 2:
+        return batch
+
+    # index of the newest frame for each coalescable ID
+    newest = {}
+    for index, msg in enumerate(batch):
+        if msg.arbitration_id in CAN_COALESCE_IDS:
+            newest[msg.arbitration_id] = index
+
+    if not newest:
+        return batch
+
+    kept = []
+    for index, msg in enumerate(batch):
+        newest_index = newest.get(msg.arbitration_id)
+        if newest_index is None or newest_index == index:
+            kept.append(msg)
+        elif can_stats is not None:
+            can_stats.coalesced_by_id[msg.arbitration_id] = (
+                can_stats.coalesced_by_id.get(msg.arbitration_id, 0) + 1)
+
+    if can_stats is not None:
+        can_stats.frames_coalesced += len(batch) - len(kept)
+    return kept
+
+def dispatch_can_message(msg, data, last_received_times, can_stats=None):
+    """Look up the handler for a CAN message and run it
     
     Args:
         msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
+        data: AvionicsData instance to update with received data
+        last_received_times: Dictionary mapping message IDs to the event loop
+            time (loop.time(), not time.time()) of the last frame received;
+            written by the timeout monitor only
+        can_stats: optional CanStatistics to count decode errors and
+            unhandled IDs in
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if a handler processed the message successfully
     """
-    if not validate_message_length(msg, 4, "MAGZ"):
-        return False
+    # Look up handler for this message type
+    handler = CAN_MESSAGE_HANDLERS.get(msg.arbitration_id)
     
-    try:
-        # keep only the first element of the tuple returned
-        data.magz = struct.unpack("<f", msg.data)[0]
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking MAGZ message: {e}")
-        return False
-
-async def process_time_sync_message(msg, data, last_received_times):
-    """Process time sync message
+    if handler:
+        try:
+            # All handlers have the same signature: (msg, data, last_received_times).
+            # The decoders store plain slot values; the groups of the
+            # message's fields are marked changed once per message
+            decoded = handler(msg, data, last_received_times)
+            data.mark_changed(CAN_HANDLER_GROUPS.get(msg.arbitration_id, ALL_GROUPS))
+            if decoded:
+                return True
+        except Exception as e:
+            error_limiter.log(can_log, logging.DEBUG, ('handler', msg.arbitration_id),
+                              "Error processing CAN message 0x%02X: %s", msg.arbitration_id, e)
+        if can_stats is not None:
+            errors = can_stats.decode_errors_by_id
+            errors[msg.arbitration_id] = errors.get(msg.arbitration_id, 0) + 1
+    else:
+        can_log.debug("Unknown CAN message ID: 0x%02X", msg.arbitration_id)
+        if can_stats is not None:
+            unhandled = can_stats.unhandled_by_id
+            unhandled[msg.arbitration_id] = unhandled.get(msg.arbitration_id, 0) + 1
+    return False
+
+async def process_can_messages(reader, data, last_received_times, can_stats=None,
+                               timeout_monitor=None, push_scheduler=None, recorder=None):
+    """Process the CAN messages when they are received
     
-    Args:
-        msg: CAN message object
-        data: AvionicsData instance to update
-        last_received_times: Dictionary to update with receive timestamp (unused here)
-        
-    Returns:
-        bool: True if successful, False otherwise
-    """
-    if not validate_message_length(msg, 8, "TIME_SYNC"):
-        return False
+    When CAN_BATCH_DRAIN is set, everything already queued in the reader
+    (up to CAN_MAX_DRAIN frames) is drained in one pass, state messages are
+    coalesced to the newest frame per ID, and the loop yields once per
+    batch rather than once per frame.
     
-    try:
-        (data.tm_year, data.tm_mon, data.tm_mday,
-         data.tm_hour, data.tm_min, data.tm_sec, _, _) = (
-            struct.unpack("<bbbbbbbb", msg.data)
-        )
-        data.tm_year = 2000 + data.tm_year
-        
-        gps_datetime = datetime.datetime(
-            data.tm_year,
-            data.tm_mon,
-            data.tm_mday,
-            data.tm_hour,
-            data.tm_min,
-            data.tm_sec,
-            tzinfo=None
-        )
-        if DEBUG_GPS_TIME:
-            print(f"{gps_datetime}")
-        return True
-    except struct.error as e:
-        if DEBUG_CAN:
-            print(f"Error unpacking TIME_SYNC message: {e}")
-        return False
-    except (ValueError, TypeError) as e:
-        if DEBUG_GPS_TIME:
-            print(f"Error creating GPS datetime: {e}")
-        return False
-
-# -----------------------------------------------------------------------------
-# --- CAN Message Handler Dispatch Table                                      ---
-# -----------------------------------------------------------------------------
-
-# Message handler dispatch table - maps CAN message IDs to handler functions
-# Note: Some handlers require last_received_times parameter, handled in process_can_messages
-CAN_MESSAGE_HANDLERS = {
-    CAN_MSG_ID.ALTITUDE_AIRSPEED_VSI.value: process_altitude_message,
-    CAN_MSG_ID.OAT.value: process_oat_message,
-    CAN_MSG_ID.STATIC_PRESSURE.value: process_static_pressure_message,
-    CAN_MSG_ID.QNH.value: process_qnh_message,
-    CAN_MSG_ID.AHRS_ORIENT.value: process_ahrs_orient_message,
-    CAN_MSG_ID.AHRS_ACCEL.value: process_ahrs_accel_message,
-    CAN_MSG_ID.GPS1.value: process_gps1_message,
-    CAN_MSG_ID.GPS2.value: process_gps2_message,
-    CAN_MSG_ID.GPS3.value: process_gps3_message,
-    CAN_MSG_ID.MAGX.value: process_magx_message,
-    CAN_MSG_ID.MAGY.value: process_magy_message,
-    CAN_MSG_ID.MAGZ.value: process_magz_message,
-    CAN_MSG_ID.TIME_SYNC.value: process_time_sync_message,
-}
-
-# -----------------------------------------------------------------------------
-# --- Asynchronous process to get a message from the CAN bus buffer and      ---
-# --- process it.                                                           ---
-# -----------------------------------------------------------------------------
-
-async def process_can_messages(reader, data, last_received_times):
-    """Process the CAN messages when they are received
+    The receive timestamp of the oldest decoded frame is noted in data
+    (AvionicsData.mark_received) so send_json can report how old the data
+    is when it reaches the clients. Handler time is measured per batch and,
+    on one frame in CAN_HANDLER_TIMING_SAMPLE, per ID.
     
     Args:
-        reader: CAN bus AsyncBufferedReader
+        reader: CAN bus AsyncBufferedReader or SocketCANReader
         data: AvionicsData instance to update with received data
-        last_received_times: Dictionary mapping message IDs to last receive timestamp
+        last_received_times: Dictionary mapping message IDs to the event loop
+            time (loop.time(), not time.time()) of the last frame received;
+            written by the timeout monitor only
+        can_stats: optional CanStatistics instance to update
+        timeout_monitor: optional MessageTimeoutMonitor told about every
+            successfully decoded frame
+        push_scheduler: optional PushScheduler whose field groups are marked
+            dirty by every successfully decoded frame
+        recorder: optional CanRecorder that receives every frame before
+            coalescing
     """
+    if can_stats is None:
+        can_stats = CanStatistics()
+    timing_countdown = CAN_HANDLER_TIMING_SAMPLE
+    perf_counter = time.perf_counter
+
     while True:  # loop here forever - keep processing messages
-        if DEBUG_CAN:
-            print("Looking for CAN msg")
-        
         try:
             msg = await reader.get_message()
         except Exception as e:
             # Handle errors reading from CAN bus (connection lost, bus error, etc.)
-            if DEBUG_CAN:
-                print(f"Error reading CAN message: {e}")
+            error_limiter.log(can_log, logging.ERROR, 'read', "Error reading CAN message: %s", e)
             # Wait a bit before retrying to avoid tight error loop
             await asyncio.sleep(0.1)
             continue
-        
-        if DEBUG_CAN:
-            print("got msg")
-        
-        # Look up handler for this message type
-        handler = CAN_MESSAGE_HANDLERS.get(msg.arbitration_id)
-        
-        if handler:
-            try:
-                # All handlers have the same signature: (msg, data, last_received_times)
-                success = await handler(msg, data, last_received_times)
-                
-                # Update last received time for messages that don't update it themselves
-                # (AHRS_ORIENT and AHRS_ACCEL update it in their handlers)
-                if success and msg.arbitration_id not in [CAN_MSG_ID.AHRS_ORIENT.value, CAN_MSG_ID.AHRS_ACCEL.value]:
-                    last_received_times[msg.arbitration_id] = time.time()
-            except Exception as e:
-                if DEBUG_CAN:
-                    print(f"Error processing CAN message 0x{msg.arbitration_id:02X}: {e}")
+
+        if CAN_BATCH_DRAIN:
+            # Take everything else that is already waiting without yielding
+            batch = [msg]
+            buffer = reader.buffer
+            while len(batch) < CAN_MAX_DRAIN:
+                try:
+                    batch.append(buffer.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            can_stats.frames_received += len(batch)
+            can_stats.batches += 1
+            if len(batch) > can_stats.max_batch:
+                can_stats.max_batch = len(batch)
         else:
-            if DEBUG_CAN:
-                print(f"Unknown CAN message ID: 0x{msg.arbitration_id:02X}")
+            batch = [msg]
+            can_stats.frames_received += 1
+            can_stats.batches += 1
+
+        frames_by_id = can_stats.frames_by_id
+        for msg in batch:
+            frames_by_id[msg.arbitration_id] = frames_by_id.get(msg.arbitration_id, 0) + 1
+
+        if recorder is not None:
+            recorder.record_batch(batch)
+
+        if CAN_BATCH_DRAIN:
+            batch = coalesce_can_batch(batch, can_stats)
+
+        # one level check per batch - the records are written by the log thread
+        debug = can_log.isEnabledFor(logging.DEBUG)
+        batch_start = perf_counter()
+        received_at = None
+        for msg in batch:
+            timing_countdown -= 1
+            if timing_countdown:
+                decoded = dispatch_can_message(msg, data, last_received_times, can_stats)
+            else:
+                timing_countdown = CAN_HANDLER_TIMING_SAMPLE
+                start = perf_counter()
+                decoded = dispatch_can_message(msg, data, last_received_times, can_stats)
+                can_stats.record_handler_time(msg.arbitration_id, perf_counter() - start)
+            if debug:
+                can_log.debug("0x%02X %s %s", msg.arbitration_id, msg.data.hex(),
+                              "decoded" if decoded else "not decoded")
+            if decoded:
+                if received_at is None:
+                    received_at = msg.timestamp
+                if timeout_monitor is not None:
+                    timeout_monitor.received(msg.arbitration_id)
+                if push_scheduler is not None:
+                    push_scheduler.mark_dirty_id(msg.arbitration_id, msg.timestamp)
+        if received_at is not None:
+            data.mark_received(received_at)
+        can_stats.dispatch_seconds += perf_counter() - batch_start
+        can_stats.frames_processed += len(batch)
         
         await asyncio.sleep(0)  # let another process run
     
-async def monitor_timeout(data, last_received_times):
-    """Monitor CAN message timeouts and clear stale data.
+async def audit_can_filters(can_stats, channel=CAN_CHANNEL):
+    """Measure the traffic rejected by the kernel acceptance filters.
+    
+    Every CAN_FILTER_AUDIT_INTERVAL seconds the total is taken from the
+    interface's rx_packets counter less the frames that reached
+    process_can_messages. Only with CAN_FILTER_AUDIT_BY_ID are per-ID counts
+    also sampled from the unfiltered bus for CAN_FILTER_AUDIT_WINDOW seconds.
     
     Args:
-        data: AvionicsData instance to update
-        last_received_times: Dictionary mapping message IDs to last receive time
+        can_stats: CanStatistics instance to update
+        channel: CAN interface name
     """
-    timeout = MESSAGE_TIMEOUT
+    last_rx = read_interface_rx_packets(channel)
+    last_received = can_stats.frames_received
 
     while True:
+        await asyncio.sleep(CAN_FILTER_AUDIT_INTERVAL)
+
+        rx_packets = read_interface_rx_packets(channel)
+        if rx_packets is not None and last_rx is not None:
+            rejected = ((rx_packets - last_rx) -
+                        (can_stats.frames_received - last_received))
+            can_stats.rejected_total += max(0, rejected)
+        last_rx = rx_packets
+        last_received = can_stats.frames_received
+        if not CAN_FILTER_AUDIT_BY_ID:
+            continue
 
-        current_time = time.time()
-        for message_id in list(last_received_times.keys()):
-            if current_time - last_received_times[message_id] > timeout:
-                if message_id == CAN_MSG_ID.AHRS_ORIENT.value:
-                    if DEBUG_CAN:
-                        print(f"time.time function: {time.time}")
-                        print(f"current_time: {current_time}")
-                        print(f"last_received_times[{message_id}]: {last_received_times[message_id]}")
-                    data.yaw = None
-                    data.pitch = None
-                    data.roll = None
-                if message_id == CAN_MSG_ID.AHRS_ACCEL.value:
-                    data.accx = None
-                    data.accy = None
-                    data.accz = None
-                
-        await asyncio.sleep(0)  #let another process run
+        try:
+            counts = await count_frames_by_id(channel, CAN_FILTER_AUDIT_WINDOW)
+        except OSError as e:
+            error_limiter.log(can_log, logging.WARNING, 'filter audit',
+                              "CAN filter audit failed: %s", e)
+            continue
+        for msg_id, count in counts.items():
+            if msg_id not in CAN_MESSAGE_HANDLERS:
+                can_stats.rejected_by_id[msg_id] = (
+                    can_stats.rejected_by_id.get(msg_id, 0) + count)
+        if can_log.isEnabledFor(logging.DEBUG):
+            can_log.debug("CAN filter audit: %d rejected", can_stats.rejected_total,
+                          extra=efis_log.fields(by_id=can_stats.as_dict()['rejected_by_id']))
+
+def create_timeout_monitor(data, last_received_times, loop=None, push_scheduler=None):
+    """Create the MessageTimeoutMonitor for the configured message groups
+    
+    Args:
+        data: AvionicsData instance whose fields are cleared on timeout
+        last_received_times: Dictionary the monitor updates with message ID ->
+            event loop time of the last frame received
+        loop: clock/timer source with time() and call_at() (default: the
+            running event loop; can_replay.py passes a ReplayClock)
+        push_scheduler: optional PushScheduler - the push groups of the
+            cleared fields are marked dirty, so a lost source reaches the
+            display in the next update
+        
+    Returns:
+        MessageTimeoutMonitor
+    """
+    groups = []
+    for name, msg_ids in MESSAGE_GROUP_IDS.items():
+        attrs = MESSAGE_GROUP_CLEARED_ATTRS.get(name)
+        if attrs is None:
+            attrs = [attr for msg_id in msg_ids
+                     for attr in CAN_SCHEMA_BY_ID[msg_id.value].attrs]
+        groups.append(MessageGroup(name, [msg_id.value for msg_id in msg_ids],
+                                   attrs, MESSAGE_GROUP_TIMEOUTS[name]))
+    on_expire = None
+    if push_scheduler is not None:
+        on_expire = lambda group: push_scheduler.mark_fields(group.attrs)
+    return MessageTimeoutMonitor(data, groups, loop=loop,
+                                 last_received_times=last_received_times,
+                                 on_expire=on_expire)
+
+async def monitor_timeout(timeout_monitor):
+    """Keep the CAN message timeout monitor running.
+    
+    The monitor's work is done by event loop timers that are armed when
+    frames arrive (see message_timeouts.py), so this task only waits and
+    cancels the pending timers on shutdown.
+    
+    Args:
+        timeout_monitor: MessageTimeoutMonitor instance
+    """
+    try:
+        await asyncio.get_running_loop().create_future()  # wait until cancelled
+    finally:
+        timeout_monitor.stop()
+        timeouts_log.info("Message group timeouts: %s", ", ".join(
+            f"{group.name}={group.expirations}"
+            for group in timeout_monitor.groups.values()))
+
+def create_push_scheduler():
+    """Create the PushScheduler for the configured field groups
+    
+    Each group's fields come from the CAN schema of its messages. A periodic
+    catch-all group covers the fields that are not set from CAN frames.
+    
+    Returns:
+        PushScheduler
+    """
+    groups = []
+    for name, (msg_ids, rate) in PUSH_GROUPS.items():
+        fields = [attr for msg_id in msg_ids
+                  for attr in CAN_SCHEMA_BY_ID[msg_id.value].attrs]
+        groups.append(PushGroup(name, fields, rate,
+                                msg_ids=[msg_id.value for msg_id in msg_ids]))
+    # marked dirty by run_navigation
+    groups.append(PushGroup('navigation', PUSH_NAVIGATION_FIELDS, NAV_UPDATE_RATE))
+    groups.append(PushGroup('other', None, PUSH_OTHER_RATE, periodic=True))
+    return PushScheduler(groups, coalesce_window=PUSH_COALESCE_WINDOW)
 
 # -----------------------------------------------------------------------------
 # --- Send regular updates to the client using json                         ---
 # -----------------------------------------------------------------------------
+def publish_update(web_socket_response, data, fields=None, received_at=None):
+    """Serialize one update for each client mode and publish it to the hub.
+    
+    Args:
+        web_socket_response (MyWebSocketResponse): holds the client hub and
+            the encoders
+        data (AvionicsData): the avionics data to send
+        fields: fields that may go out in a delta (None = all)
+        received_at: receive timestamp of the oldest CAN frame in the
+            update; the hub records the data age when each send completes
+    """
+    hub = web_socket_response.hub
+    # cached snapshot - only the fields changed since the last update are
+    # refreshed (read-only, see avionics_data.py)
+    d = data.snapshot()
+    if hub.has_clients(binary=True):
+        if fields is None or not BINARY_FIELD_NAMES.isdisjoint(fields):
+            hub.publish(web_socket_response.binary_encoder.encode(d), binary=True,
+                        received_at=received_at)
+        text = web_socket_response.binary_delta_encoder.encode(split_snapshot(d), fields)
+        if text is not None:
+            hub.publish(text, binary=True, received_at=received_at)
+    if hub.has_clients(binary=False):
+        if WEBSOCKET_DELTA_MODE:
+            text = web_socket_response.delta_encoder.encode(d, fields)
+        else:
+            text = data.snapshot_json()
+        if text is not None:
+            hub.publish(text, binary=False, received_at=received_at)
+
 async def send_json(web_socket_response, data):
     """
     Coroutine to send the data object as json to the web socket handler.
     
-    Continuously sends avionics data to connected websocket clients at a
-    rate-limited interval. The send rate is controlled by JSON_UPDATE_RATE
-    constant (default: 0.05 seconds = 20Hz).
+    Continuously sends avionics data to connected websocket clients. With a
+    push scheduler (web_socket_response.push_scheduler) an update is sent
+    as soon as CAN frames change a field group, within the group's maximum
+    rate, and only that group's fields go out in a delta. Without one the
+    send rate is controlled by JSON_UPDATE_RATE constant (default: 0.05
+    seconds = 20Hz).
+    
+    In delta mode (WEBSOCKET_DELTA_MODE) each update is a keyframe or a delta
+    holding only the changed fields, tagged with a sequence number (see
+    websocket_delta.py). Otherwise the whole data object is sent every time.
+    
+    Clients that opted into binary frames get the high-rate fields as a
+    binary frame every update (binary_frame.py) and the remaining fields as
+    keyframes/deltas.
+    
+    Each update is serialized once per client mode (JSON or binary) by
+    publish_update and published to every client through the broadcast hub
+    (websocket_hub.py), which queues it per client; send_json never waits on
+    a client. Each update carries the receive timestamp of its oldest CAN
+    frame, so the hub can record the age of the data at the websocket write.
     
     Args:
         web_socket_response (MyWebSocketResponse): The websocket response handler
-            that contains the websocket connection
+            that holds the client hub and the encoders
         data (AvionicsData): The avionics data object containing all sensor
             and flight data to be sent to clients
     
     Note:
         This function runs indefinitely until the program is stopped.
-        It only sends data when a websocket connection exists and is not closed.
+        It only sends data when at least one client is connected.
         The send rate is limited to prevent flooding the websocket connection.
+        An update that fails to serialize is logged (rate-limited) and
+        skipped.
     """
 
+    scheduler = web_socket_response.push_scheduler
     while True: # Loop here forever
-        if DEBUG:
-            print("Json Loop")
-            print (f"Web Socket response :{web_socket_response.web_socket}")
-            if web_socket_response.web_socket is not None:
-                print(f"Web Socket Closed: {web_socket_response.web_socket.closed}")
-        # Send json data only when a WebSocket exists and is not closed
-        if (web_socket_response.web_socket is not None and
-            not web_socket_response.web_socket.closed):
-            if DEBUG_JSON:
-                print("Send Json")
-                print("Json Send qnh = ",data.can_qnh)
-                #print("Json qnhx4 = ", data.qnhx4) 
-                print("Json Alt = ", data.altitude)
-            # use an exception handler as the socket could be closed inadvertently
+        fields = None  # fields that may go out in a delta (None = all)
+        if scheduler is not None:
+            groups = await scheduler.next_update()
+        hub = web_socket_response.hub
+        json_log.debug("Json Loop: %d websocket clients", len(hub.clients))
+        # Send json data only when a client is connected
+        received_at = data.take_received_at()
+        if scheduler is not None:
+            received_at = scheduler.oldest_change(groups)
+        if hub.has_clients():
+            json_log.debug("Send Json: qnh = %s, alt = %s", data.can_qnh, data.altitude)
+            if scheduler is not None:
+                fields = scheduler.fields_of(groups, data.snapshot())
             try:
-                d = {k: v for k, v in data.__dict__.items() if not k.startswith('_')}
-                await web_socket_response.web_socket.send_json(d)
-            except (ConnectionResetError, ConnectionAbortedError, 
-                    aiohttp.ClientError, RuntimeError) as e:
-                if DEBUG:
-                    print(f"Error sending JSON to websocket: {e}")
-                # Socket is likely closed, will be handled by outer check
-        # Rate limit: wait before next send to prevent flooding the websocket
-        await asyncio.sleep(JSON_UPDATE_RATE)
+                publish_update(web_socket_response, data, fields, received_at)
+            except Exception as e:
+                # Keep the loop running; a bad value must not stop the display
+                error_limiter.log(json_log, logging.ERROR, 'publish',
+                                  "Error publishing update: %s", e)
+        if scheduler is not None:
+            # Start the groups' rate limit intervals and record the latency
+            scheduler.sent(groups, record=fields is not None)
+        else:
+            # Rate limit: wait before next send to prevent flooding the websocket
+            await asyncio.sleep(JSON_UPDATE_RATE)
+
+
+def update_navigation(data, position_at=None):
+    """Compute flight plan navigation from the current position and store
+    every navigation field in one step
+    
+    Args:
+        data: AvionicsData instance
+        position_at: receive timestamp of the GPS position (nav_time)
+    """
+    fp = data._flight_plan
+    nav = None
+    if fp is not None and data.latitude is not None and data.longitude is not None:
+        nav = compute_navigation(data.latitude, data.longitude, fp)
+    # no await below - clients never see a partly updated result
+    if nav:
+        data.dtk = nav['dtk']
+        data.bearing = nav['bearing']
+        data.xtrack = nav['xtrack']
+        data.dist = nav['dist']
+        data.to_from = nav['to_from']
+        data.wpt_id = nav['wpt_id']
+        data.route_name = nav['route_name']
+        data.nav_time = position_at
+        nav_log.debug("Nav: %s DTK=%s BRG=%s XTK=%s DST=%s %s", nav['wpt_id'], nav['dtk'],
+                      nav['bearing'], nav['xtrack'], nav['dist'], nav['to_from'])
+    elif fp is not None:
+        data.dtk = data.bearing = data.xtrack = None
+        data.dist = data.to_from = data.wpt_id = data.route_name = None
+        data.nav_time = position_at
+    if fp is not None:
+        # Keep active_leg and direct-to state in sync
+        data.active_leg = fp.active_leg
+        data.direct_to_active = fp.direct_to_active
+        data.mark_changed(GROUP_BITS['navigation'])
+
+def navigation_changed(data, push_scheduler=None, hub=None):
+    """Recompute and push navigation after the plan, the leg or Direct-To
+    changed outside the navigation task
+    
+    Navigation is computed again from the last position navigated (or
+    cleared without one), so dtk / bearing / xtrack / dist describe the new
+    leg in the same step that changes active_leg, even when no GPS fix
+    arrives. The navigation fields are a push group of their own that only
+    navigation_step marks otherwise, so without this the change would reach
+    the clients only with the next GPS fix (or keyframe).
+    
+    Args:
+        data: AvionicsData instance
+        push_scheduler: optional PushScheduler - the 'navigation' group is
+            marked dirty
+        hub: optional BroadcastHub - the route progress table is published
+            again to its 'route' clients
+    """
+    if data._flight_plan is not None:
+        update_navigation(data, data.nav_time)
+    else:
+        data.dtk = data.bearing = data.xtrack = None
+        data.dist = data.to_from = data.wpt_id = data.route_name = None
+        data.direct_to_active = None
+    data.mark_changed(GROUP_BITS['navigation'])
+    if push_scheduler is not None:
+        push_scheduler.mark_dirty('navigation')
+    if hub is not None:
+        publish_route_progress(hub, data)
+
+def navigation_step(data, push_scheduler=None, hub=None):
+    """Navigate from the newest GPS position if one arrived since the last step
+    
+    Args:
+        data: AvionicsData instance
+        push_scheduler: optional PushScheduler - the 'navigation' group is
+            marked dirty with the position's receive time
+        hub: optional BroadcastHub - the route progress table of the new
+            position is published to its 'route' clients
+        
+    Returns:
+        bool: True if a new position was processed
+    """
+    position_at = data.take_position()
+    if position_at is None:
+        return False
+    update_navigation(data, position_at)
+    if push_scheduler is not None:
+        push_scheduler.mark_dirty('navigation', position_at)
+    if hub is not None:
+        publish_route_progress(hub, data)
+    return True
+
+async def run_navigation(data, push_scheduler=None, hub=None):
+    """Navigation task - compute navigation at up to NAV_UPDATE_RATE
+    
+    The GPS1 hook only notes that a position arrived, so the cost of
+    navigation (and auto-sequencing) is never paid inside CAN dispatch;
+    positions that arrive faster than NAV_UPDATE_RATE are coalesced to the
+    newest.
+    
+    Args:
+        data: AvionicsData instance
+        push_scheduler: optional PushScheduler to wake send_json
+        hub: optional BroadcastHub that receives the route progress tables
+    """
+    interval = 1.0 / NAV_UPDATE_RATE
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            navigation_step(data, push_scheduler, hub)
+        except Exception as e: #pylint: disable=broad-except
+            error_limiter.log(nav_log, logging.ERROR, 'navigation',
+                              "Error computing navigation: %s", e)
+
+def publish_route_progress(hub, data):
+    """Send the route progress table to the clients that asked for it.
+
+    Called by navigation_step for every GPS position it consumes. While a
+    client subscribed to 'route' is connected and a flight plan and GPS
+    position are available, the distance, bearing and ETE/ETA to every
+    remaining waypoint is computed (flightplan.compute_route_table) and
+    published as {"route_progress": {...}}.
+
+    Args:
+        hub (BroadcastHub): the websocket client hub
+        data (AvionicsData): the avionics data (position, ground speed and
+            flight plan)
+    """
+    fp = data._flight_plan
+    if (fp is None or data.latitude is None or data.longitude is None
+            or not hub.has_clients(topic='route')):
+        return
+    try:
+        table = compute_route_table(data.latitude, data.longitude, data.gps_speed,
+                                    fp, time.time())
+    except Exception as e: #pylint: disable=broad-except
+        error_limiter.log(nav_log, logging.ERROR, 'route progress',
+                          "Error computing route progress: %s", e)
+        return
+    if table is not None:
+        hub.publish(json.dumps({'route_progress': table}), topic='route')
 
 
 # -----------------------------------------------------------------------------
 # --- Monitor flight plan directory for new/changed .fpl files              ---
 # -----------------------------------------------------------------------------
-async def monitor_flight_plan(data):
-    """Monitor ~/flightplans for new/changed .fpl files and load the newest."""
+def set_flight_plan(data, fp, push_scheduler=None):
+    """Make a FlightPlan the active plan, or clear it when fp is None
+    
+    Args:
+        data: AvionicsData instance
+        fp: loaded FlightPlan, or None
+        push_scheduler: optional PushScheduler to push the new plan's
+            navigation fields
+    """
+    data._flight_plan = fp
+    if fp is None:
+        data.route_waypoints = None
+        data.active_leg = None
+    else:
+        data.route_waypoints = [{'id': w['id'], 'type': w['type']}
+                                for w in fp.waypoints]
+        data.active_leg = fp.active_leg
+    navigation_changed(data, push_scheduler)
+
+async def load_flight_plan(path, cache=None):
+    """Load a flight plan in a worker thread
+    
+    Parsing (and the geometry precomputation) runs off the event loop; the
+    caller swaps the finished plan in with set_flight_plan, so navigation
+    keeps using the previous plan until the new one is complete. A plan
+    already in the cache's memory is returned without leaving the loop.
+    
+    Args:
+        path: .fpl file
+        cache: FlightPlanCache, or None to always parse the file
+        
+    Returns:
+        FlightPlan, or None if the file could not be loaded
+    """
+    loop = asyncio.get_running_loop()
+    if cache is not None:
+        fp = cache.cached(path)
+        if fp is None:
+            fp = await loop.run_in_executor(None, cache.load, path)
+        return fp
     fp = FlightPlan()
-    last_loaded_file = None
-    last_mtime = 0
+    if await loop.run_in_executor(None, fp.load, path):
+        return fp
+    return None
 
+async def select_flight_plan(data, cache, name, push_scheduler=None):
+    """Make a plan of FLIGHTPLAN_DIR the active plan on a client's request
+
+    The newest file is loaded again by monitor_flight_plan when it changes.
+
+    Args:
+        data: AvionicsData instance
+        cache: FlightPlanCache
+        name: file name of the plan (any directory part is ignored)
+        push_scheduler: optional PushScheduler to push the new plan's
+            navigation fields
+    """
+    path = FLIGHTPLAN_DIR / Path(name).name
+    if path.suffix != '.fpl':
+        nav_log.warning("Not a flight plan: %s", name)
+        return
+    fp = await load_flight_plan(path, cache)
+    if fp is None:
+        nav_log.warning("Could not select flight plan %s", name)
+        return
+    set_flight_plan(data, fp, push_scheduler)
+    data.flight_plans = cache.catalog(FLIGHTPLAN_DIR)
+    data.mark_changed(GROUP_BITS['navigation'])
+    nav_log.info("Flight plan selected: %s (%s)", fp.route_name, path.name)
+
+async def monitor_flight_plan(data, cache=None, push_scheduler=None):
+    """Monitor ~/flightplans for new/changed .fpl files and load the newest.
+
+    The directory is watched with inotify where available (a plan is loaded
+    FLIGHTPLAN_DEBOUNCE seconds after its last write), otherwise it is
+    scanned every FLIGHTPLAN_POLL_INTERVAL seconds.
+
+    Args:
+        data: AvionicsData instance
+        cache: FlightPlanCache, or None to parse every plan loaded
+        push_scheduler: optional PushScheduler to push the navigation fields
+            of a new plan
+    """
+    if cache is not None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, cache.read_index)
+        except Exception as e:
+            error_limiter.log(nav_log, logging.ERROR, 'flight plan cache',
+                              "Error reading the flight plan cache: %s", e)
+        data.flight_plans = cache.catalog(FLIGHTPLAN_DIR)
+        data.mark_changed(GROUP_BITS['navigation'])
+    loaded = False
     while True:
+        watcher = FlightPlanWatcher(FLIGHTPLAN_DIR, debounce=FLIGHTPLAN_DEBOUNCE,
+                                    poll_interval=FLIGHTPLAN_POLL_INTERVAL,
+                                    use_inotify=FLIGHTPLAN_INOTIFY)
         try:
-            if FLIGHTPLAN_DIR.exists():
-                fpl_files = sorted(
-                    FLIGHTPLAN_DIR.glob('*.fpl'),
-                    key=lambda f: f.stat().st_mtime,
-                    reverse=True
-                )
-                if fpl_files:
-                    newest = fpl_files[0]
-                    mtime = newest.stat().st_mtime
-                    if newest != last_loaded_file or mtime != last_mtime:
-                        if fp.load(newest):
-                            data._flight_plan = fp
-                            data.route_waypoints = [
-                                {'id': w['id'], 'type': w['type']}
-                                for w in fp.waypoints
-                            ]
-                            data.active_leg = fp.active_leg
-                            last_loaded_file = newest
-                            last_mtime = mtime
-                        else:
-                            data._flight_plan = None
-                            data.route_waypoints = None
-                            data.active_leg = None
-                else:
-                    if last_loaded_file is not None:
-                        print("No flight plan files found")
-                        data._flight_plan = None
-                        data.route_waypoints = None
-                        data.active_leg = None
-                        last_loaded_file = None
+            async for newest in watcher.changes():
+                if newest is None:
+                    if loaded:
+                        nav_log.info("No flight plan files found")
+                        set_flight_plan(data, None, push_scheduler)
+                        loaded = False
+                    continue
+                fp = await load_flight_plan(newest[0], cache)
+                set_flight_plan(data, fp, push_scheduler)
+                loaded = fp is not None
+                if cache is not None:
+                    data.flight_plans = cache.catalog(FLIGHTPLAN_DIR)
+                    data.mark_changed(GROUP_BITS['navigation'])
         except Exception as e:
-            print(f"Error checking flight plans: {e}")
-
+            error_limiter.log(nav_log, logging.ERROR, 'flight plans',
+                              "Error checking flight plans: %s", e)
+        finally:
+            watcher.close()
         await asyncio.sleep(FLIGHTPLAN_POLL_INTERVAL)
 
 
-async def read_input(encoder, button, data):
+async def read_input(encoder, button, data, web_socket_response=None):
     """
     Read the rotary encoder position and button status and store them in the
     data object.
 
+    The blocking I2C reads are done by an EncoderPoller thread; this
+    coroutine only receives the changes. Each change is also pushed to the
+    client straight away as an input event rather than waiting for the next
+    send_json update.
+
     Should be called by run or gather
 
     Keyword arguments:
     encoder -- an adafruit rotaryio object
     button -- an adafruit digitalio object
     data -- an object in which the data can be stored
+    web_socket_response -- MyWebSocketResponse used to push input events
     """
-    last_encoder_position = -encoder.position
-    error_count = 0
-    while True:
-        try:
-            new_encoder_position = -encoder.position
-            if abs(new_encoder_position - last_encoder_position) < ENCODER_THRESHOLD:
-                data.position = new_encoder_position
-                last_encoder_position = new_encoder_position
-            data.pressed = not button.value
-            error_count = 0  # Reset error count on successful read
-        except Exception as e:
-            error_count += 1
-            if DEBUG and error_count % 100 == 0:  # Only print every 100 errors to avoid spam
-                print(f"Error reading encoder: {e}")
-            # Keep the last known good values
-            await asyncio.sleep(0.1)  # Add a small delay when errors occur
-            continue
-        await asyncio.sleep(0)
+    poller = EncoderPoller(encoder, button, asyncio.get_running_loop(),
+                           rate_hz=ENCODER_POLL_RATE,
+                           interrupt_chip=ENCODER_INTERRUPT_CHIP,
+                           interrupt_offset=ENCODER_INTERRUPT_GPIO,
+                           threshold=ENCODER_THRESHOLD)
+    poller.start()
+    try:
+        while True:
+            event = await poller.events.get()
+            data.position = event.position
+            data.pressed = event.pressed
+            data.mark_changed(GROUP_BITS['input'])
+            if web_socket_response is not None:
+                web_socket_response.send_input_event(event.position,
+                                                     event.pressed)
+    finally:
+        poller.stop()
+        encoder_log.info("Encoder poller stopped: %d reads, %d errors",
+                         poller.reads, poller.errors)
 
 def connect_to_rotary_encoder(addr=ENCODER_I2C_ADDRESS):
     """
@@ -1155,24 +1713,32 @@ def connect_to_rotary_encoder(addr=ENCODER_I2C_ADDRESS):
     """
     # create seesaw connection to I2C
     #my_seesaw = seesaw.Seesaw(board.I2C(), addr)
-    print(f"connect_to_rotary_encoder(): bus={ENCODER_I2C_BUS} addr=0x{addr:02X}")
+    encoder_log.info("connect_to_rotary_encoder(): bus=%s addr=0x%02X", ENCODER_I2C_BUS, addr)
+    if seesaw is None:
+        encoder_log.warning("adafruit_seesaw is not installed. "
+                            "Continuing without rotary encoder support.")
+        return (None, None)
     try:
         my_seesaw = seesaw.Seesaw(I2C(ENCODER_I2C_BUS), addr)
 
         seesaw_product = (my_seesaw.get_version() >> 16) & 0xFFFF
-        if DEBUG:
-            print("Found product {}".format(seesaw_product))
+        encoder_log.debug("Found product %s", seesaw_product)
         if seesaw_product != SEESAW_EXPECTED_PRODUCT_ID:
-            print(f"Wrong firmware loaded?  Expected {SEESAW_EXPECTED_PRODUCT_ID}")
+            encoder_log.warning("Wrong firmware loaded?  Expected %s, found %s",
+                                SEESAW_EXPECTED_PRODUCT_ID, seesaw_product)
 
         my_seesaw.pin_mode(ENCODER_BUTTON_PIN, my_seesaw.INPUT_PULLUP)
+        if ENCODER_INTERRUPT_GPIO is not None:
+            # Signal encoder movement and button changes on the INT line
+            my_seesaw.enable_encoder_interrupt()
+            my_seesaw.set_GPIO_interrupts(1 << ENCODER_BUTTON_PIN, True)
         button = digitalio.DigitalIO(my_seesaw, 24)
         encoder = rotaryio.IncrementalEncoder(my_seesaw)
 
         return(encoder, button)
     except (OSError, ValueError) as e:
-        print(f"Warning: Could not connect to rotary encoder at 0x{addr:02X}: {e}")
-        print("Continuing without rotary encoder support.")
+        encoder_log.warning("Could not connect to rotary encoder at 0x%02X: %s. "
+                            "Continuing without rotary encoder support.", addr, e)
         return (None, None)
 
 # -----------------------------------------------------------------------------
@@ -1182,35 +1748,47 @@ def connect_to_rotary_encoder(addr=ENCODER_I2C_ADDRESS):
 # Global variables to hold CAN bus resources for cleanup
 _can_bus = None
 _can_notifier = None
+_can_reader = None
+_can_recorder = None
 
 def cleanup_can_resources():
-    """Clean up CAN bus resources (notifier and bus)"""
-    global _can_bus, _can_notifier
+    """Clean up CAN bus resources (notifier or native reader, recorder and bus)"""
+    global _can_bus, _can_notifier, _can_reader, _can_recorder
     
     notifier = _can_notifier
+    native_reader = _can_reader
+    recorder = _can_recorder
     bus = _can_bus
     
     # Clear globals first to prevent double cleanup
     _can_notifier = None
+    _can_reader = None
+    _can_recorder = None
     _can_bus = None
     
+    if native_reader is not None:
+        # Unregister from the event loop before the bus closes the socket
+        native_reader.stop()
+        can_log.debug("CAN native reader stopped")
+
+    if recorder is not None:
+        # Write out the buffered frames and fsync
+        recorder.stop()
+        can_log.info("CAN recorder stopped", extra=efis_log.fields(**recorder.stats()))
+
     if notifier is not None:
         try:
             notifier.stop()
-            if DEBUG_CAN:
-                print("CAN notifier stopped")
+            can_log.debug("CAN notifier stopped")
         except Exception as e:
-            if DEBUG_CAN:
-                print(f"Error stopping CAN notifier: {e}")
+            can_log.error("Error stopping CAN notifier: %s", e)
     
     if bus is not None:
         try:
             bus.shutdown()
-            if DEBUG_CAN:
-                print("CAN bus closed")
+            can_log.debug("CAN bus closed")
         except Exception as e:
-            if DEBUG_CAN:
-                print(f"Error closing CAN bus: {e}")
+            can_log.error("Error closing CAN bus: %s", e)
 
 # Global variable to store running tasks for cancellation
 _running_tasks = None
@@ -1226,21 +1804,24 @@ async def main():
     """
     global _running_tasks
     
+    # Log records are written by a background thread from here on
+    log_pipeline = efis_log.start_logging(LOG_LEVEL, LOG_CATEGORY_LEVELS,
+                                          queue_size=LOG_QUEUE_SIZE,
+                                          json_lines=LOG_JSON_LINES)
+    
     # Set up async signal handlers for graceful shutdown
     loop = asyncio.get_event_loop()
     
     def shutdown_handler():
         """Async signal handler for graceful shutdown"""
-        if DEBUG:
-            print("Shutdown requested, cancelling tasks...")
+        log.info("Shutdown requested, cancelling tasks...")
         # Cancel all running tasks (they should be Task objects now)
         if _running_tasks is not None:
             for task in _running_tasks:
                 # Check if it's a Task object (has .done() method)
                 if hasattr(task, 'done') and not task.done():
                     task.cancel()
-                    if DEBUG:
-                        print(f"Cancelled task: {task.get_name()}")
+                    log.debug("Cancelled task: %s", task.get_name())
         # Cleanup CAN resources
         cleanup_can_resources()
     
@@ -1267,7 +1848,7 @@ async def main():
     # --- Create an instance of the AvionicsData class to store the data in
     # This object is used to store avionics data and is passed to:
     # - process_can_messages() to update data from CAN bus
-    # - monitor_timeout() to check for stale data
+    # - the timeout monitor to clear stale data
     # - send_json() to send data to websocket clients
     # - read_input() to store encoder/button input
     # - web_socket_response.data to make data accessible to websocket handler
@@ -1281,7 +1862,9 @@ async def main():
     # --- Create the html and web socket servers and provide the web_socket
     # --- handler. Once the servers are started they will call
     # --- the MyWebSocketResponse.handler when ever a request comes in
-    await create_servers(web_socket_response.handler)
+    web_socket_response.log_pipeline = log_pipeline
+    await create_servers(web_socket_response.handler, web_socket_response.metrics_handler,
+                         web_socket_response.loop_handler, web_socket_response.log_handler)
 
     # -------------------------------------------------------------------------
     # --- create can bus interface
@@ -1289,22 +1872,44 @@ async def main():
 
     reader = None
     bus = None
+    recorder = None
     if not DEBUG_DISABLE_CAN:
-        bus = can.Bus(interface='socketcan', channel=CAN_CHANNEL, bitrate=CAN_BITRATE)
+        # Only IDs with a handler are passed up from the kernel
+        can_filters = build_can_filters() if CAN_KERNEL_FILTERS else None
+        bus = can.Bus(interface='socketcan', channel=CAN_CHANNEL, bitrate=CAN_BITRATE,
+                      can_filters=can_filters)
         # Store bus globally for cleanup handler
-        global _can_bus, _can_notifier
+        global _can_bus, _can_notifier, _can_reader, _can_recorder
         _can_bus = bus
         
-        # create a buffered reader
-        reader = can.AsyncBufferedReader()
-        # create a listener on the can bus
-        listeners = [reader]
         # get the event loop
         loop = asyncio.get_event_loop()
-        # create a notifier to let us know when messages arrive
-        # Store notifier globally for cleanup handler
-        _can_notifier = can.Notifier(bus=bus, listeners=listeners, timeout=CAN_TIMEOUT,
-                                     loop=loop)
+        if CAN_READER_BACKEND == 'native':
+            # read frames straight from the bus socket on the event loop
+            # Store reader globally for cleanup handler
+            reader = SocketCANReader.from_bus(bus, loop=loop,
+                                              batch_size=CAN_READ_BATCH)
+            reader.start()
+            _can_reader = reader
+        else:
+            # create a buffered reader
+            reader = can.AsyncBufferedReader()
+            # create a listener on the can bus
+            listeners = [reader]
+            # create a notifier to let us know when messages arrive
+            # Store notifier globally for cleanup handler
+            _can_notifier = can.Notifier(bus=bus, listeners=listeners, timeout=CAN_TIMEOUT,
+                                         loop=loop)
+
+        if CAN_RECORDER_ENABLED:
+            # record every received frame - Store recorder globally for cleanup handler
+            recorder = CanRecorder(CAN_RECORD_DIR,
+                                   max_file_bytes=CAN_RECORD_FILE_BYTES,
+                                   max_total_bytes=CAN_RECORD_TOTAL_BYTES,
+                                   fsync_interval=CAN_RECORD_FSYNC_INTERVAL,
+                                   index=CAN_RECORD_INDEX)
+            recorder.start(loop)
+            _can_recorder = recorder
 
         # --- update the web socket response handler so that it can communicate
         # --- with the CAN bus and see the avionics data
@@ -1320,26 +1925,58 @@ async def main():
 
     last_received_times = {}
 
+    # --- counters for the CAN ingest path
+    can_stats = CanStatistics()
+
+    # --- wakes send_json when CAN frames change the data
+    push_scheduler = create_push_scheduler() if WEBSOCKET_PUSH_SCHEDULER else None
+
+    # --- clears data for message groups that stop arriving (and pushes the
+    # --- cleared fields)
+    timeout_monitor = create_timeout_monitor(avionics_data, last_received_times,
+                                             push_scheduler=push_scheduler)
+    web_socket_response.push_scheduler = push_scheduler
+    web_socket_response.can_stats = can_stats
+    web_socket_response.recorder = recorder
+
+    # --- parsed flight plans, shared by the directory monitor and "select_plan"
+    flight_plan_cache = FlightPlanCache(FLIGHTPLAN_CACHE_DIR, capacity=FLIGHTPLAN_CACHE_SIZE)
+    web_socket_response.flight_plan_cache = flight_plan_cache
+
     # -------------------------------------------------------------------------
 
     # We should now be able to use the reader to get messages
     # Build the list of coroutines to run based on what's enabled
     coroutines = [
     #    process_can_messages(reader, avionics_data, last_received_times),
-        monitor_timeout(avionics_data, last_received_times),
+        monitor_timeout(timeout_monitor),
         send_json(web_socket_response, avionics_data),
-        monitor_flight_plan(avionics_data),
+        monitor_flight_plan(avionics_data, flight_plan_cache, push_scheduler),
     #    read_input(encoder, button, avionics_data)
     ]
+    coroutines.append(run_navigation(avionics_data, push_scheduler,
+                                     web_socket_response.route_hub()))
     
     if not DEBUG_DISABLE_CAN and reader is not None:
-        coroutines.append(process_can_messages(reader, avionics_data, last_received_times))
+        coroutines.append(process_can_messages(reader, avionics_data, last_received_times,
+                                               can_stats, timeout_monitor, push_scheduler,
+                                               recorder))
+        if CAN_KERNEL_FILTERS and CAN_FILTER_AUDIT_INTERVAL > 0:
+            coroutines.append(audit_can_filters(can_stats))
     
     if encoder is not None and button is not None:
         # handle the case here we were not able to connect to the encoder
-        coroutines.append(read_input(encoder, button, avionics_data))
+        coroutines.append(read_input(encoder, button, avionics_data, web_socket_response))
    
     # Create Task objects from coroutines so they can be cancelled
+    # With the loop monitor every task's steps are timed under its name
+    loop_monitor = None
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor = LoopMonitor(interval=LOOP_LAG_INTERVAL, slow_threshold=LOOP_SLOW_STEP,
+                                   stack_threshold=LOOP_STACK_THRESHOLD)
+        web_socket_response.loop_monitor = loop_monitor
+        coroutines = [loop_monitor.track(coro) for coro in coroutines]
+        coroutines.append(loop_monitor.run())
     tasks = [asyncio.create_task(coro) for coro in coroutines]
     
     # Store tasks globally so signal handler can cancel them
@@ -1351,8 +1988,7 @@ async def main():
     try:
         await asyncio.gather(*tasks, return_exceptions=True)
     except (KeyboardInterrupt, asyncio.CancelledError):
-        if DEBUG:
-            print("Tasks cancelled, cleaning up...")
+        log.debug("Tasks cancelled, cleaning up...")
     finally:
         # Cancel any remaining tasks
         for task in tasks:
@@ -1364,6 +2000,10 @@ async def main():
         # Clean up CAN bus resources on shutdown
         cleanup_can_resources()
         _running_tasks = None
+        if loop_monitor is not None:
+            log.info("%s", loop_monitor.summary())
+        # write out the queued records before the process exits
+        log_pipeline.stop()
 
 # -----------------------------------------------------------------------------
 # --- This Python Script starts here.                                       ---
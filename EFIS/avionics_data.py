@@ -0,0 +1,259 @@
+"""Shared avionics data store with a cached snapshot.
+
+AvionicsData holds every value received over the CAN bus (plus navigation
+and encoder input) in ``__slots__``. Field writes are plain slot stores, so
+the CAN decode path pays nothing per field. Whoever writes fields calls
+``mark_changed(groups)`` once afterwards with the bitmask of the field
+groups written (dispatch_can_message once per decoded message with the
+groups of the message's schema fields, the navigation task once per step,
+...). That bumps ``version`` and the version of each group, and sets the
+groups' bits in the dirty mask.
+
+``snapshot()`` returns a preallocated dict that is refreshed only for the
+groups changed since the previous call, and ``snapshot_json()`` caches the
+serialized form until the next change.
+
+The push groups of the websocket updates are tracked separately, by the
+PushScheduler (push_scheduler.py): they follow the CAN messages and rate
+limits of the display, not these storage groups.
+"""
+
+import json
+import operator
+
+# Field groups in field order
+FIELD_GROUPS = {
+    'air_data': (
+        'altitude',
+        'airspeed',
+        'vsi',
+        'static_pressure',
+        'temperature',
+        'differential_pressure',
+        'aoa',                  # Angle of attack (degrees, from AIR_Module)
+        'oat',                  # Outside Air Temperature (°C, from MAX31865 RTD)
+        'can_qnh',
+        'can_qnh_hpa',
+    ),
+    'attitude': (
+        'yaw',
+        'pitch',
+        'roll',
+        'turn_rate',
+        'accx',
+        'accy',
+        'accz',
+        'calib',
+    ),
+    'gps': (
+        'latitude',
+        'longitude',
+        'gps_speed',
+        'gps_altitude',
+        'true_track',
+    ),
+    'gps_status': (
+        'gps_fix_quality',      # 0=No fix, 1=GPS, 2=DGPS (WAAS)
+        'gps_fix_3d',           # 1=No fix, 2=2D, 3=3D
+        'gps_satellites',       # Number of satellites in use
+        'gps_hdop',             # Horizontal dilution of precision
+        'gps_vdop',             # Vertical dilution of precision
+    ),
+    'magnetometer': (
+        'magx',
+        'magy',
+        'magz',
+    ),
+    'time': (
+        'tm_year',
+        'tm_mon',
+        'tm_mday',
+        'tm_hour',
+        'tm_min',
+        'tm_sec',
+    ),
+    'input': (
+        'position',
+        'pressed',
+    ),
+    # Navigation (computed from flight plan + GPS position)
+    'navigation': (
+        'dtk',                  # desired track (degrees)
+        'bearing',              # bearing to active waypoint (degrees)
+        'xtrack',               # cross-track error (NM, +right/-left)
+        'dist',                 # distance to active waypoint (NM)
+        'to_from',              # 'TO' or 'FROM'
+        'wpt_id',               # active waypoint identifier
+        'route_name',           # flight plan route name
+        'route_waypoints',      # list of {id, type} dicts for route display
+        'flight_plans',         # cached plans: list of {file, route_name, waypoints} dicts
+        'active_leg',           # index of active waypoint in route
+        'direct_to_active',     # True when Direct-To navigation is active
+        'nav_time',             # receive time of the GPS fix the above were computed from
+    ),
+}
+
+FIELDS = tuple(field for fields in FIELD_GROUPS.values() for field in fields)
+
+# Bit of each field group in the changed-groups masks
+GROUP_BITS = {name: 1 << index for index, name in enumerate(FIELD_GROUPS)}
+ALL_GROUPS = (1 << len(FIELD_GROUPS)) - 1
+_GROUP_OF_FIELD = {field: name
+                   for name, fields in FIELD_GROUPS.items() for field in fields}
+
+# Reads every field in FIELDS order in one call
+_GET_FIELDS = operator.attrgetter(*FIELDS)
+# (fields, getter returning them as a tuple) of each group, in bit order
+_GROUP_READERS = tuple(
+    (fields, operator.attrgetter(*fields) if len(fields) > 1
+     else lambda data, _field=fields[0]: (getattr(data, _field),))
+    for fields in FIELD_GROUPS.values())
+# Group indexes set in each possible mask
+_MASK_INDEXES = tuple(tuple(index for index in range(len(FIELD_GROUPS)) if mask >> index & 1)
+                      for mask in range(ALL_GROUPS + 1))
+
+# Initial values other than None
+_DEFAULTS = {'direct_to_active': False}
+
+
+def group_mask(fields):
+    """Return the changed-groups mask covering the given fields.
+
+    Raises:
+        KeyError: a field is not an AvionicsData field
+    """
+    mask = 0
+    for field in fields:
+        mask |= GROUP_BITS[_GROUP_OF_FIELD[field]]
+    return mask
+
+
+class AvionicsData:
+    """Class to store all the avionics data received over the CAN bus."""
+    # An instance of this class will be used to share the data between the
+    # process_can_messages and send_json functions
+    __slots__ = FIELDS + (
+        '_flight_plan',     # FlightPlan instance (internal, not serialized)
+        '_version',         # number of mark_changed() calls
+        '_group_versions',  # per group: version of its last change
+        '_dirty',           # mask of the groups changed since take_dirty()
+        '_snapshot',        # preallocated snapshot dict
+        '_snapshot_dirty',  # mask of the groups changed since the last snapshot()
+        '_json',            # (version, serialized snapshot) or None
+        '_received_at',     # CAN timestamp of the oldest frame not yet sent
+        '_position_at',     # CAN timestamp of the newest GPS fix not yet navigated
+    )
+
+    def __init__(self):
+        # Initialize default values for all data attributes
+        for field in FIELDS:
+            setattr(self, field, _DEFAULTS.get(field))
+        self._flight_plan = None
+        self._version = 0
+        self._group_versions = [0] * len(FIELD_GROUPS)
+        self._dirty = 0
+        self._snapshot = {field: _DEFAULTS.get(field) for field in FIELDS}
+        self._snapshot_dirty = 0
+        self._json = None
+        self._received_at = None
+        self._position_at = None
+
+    # --- change tracking ----------------------------------------------------
+
+    def mark_changed(self, groups=ALL_GROUPS):
+        """Note that fields were written: the next snapshot() re-reads them.
+        Called once per decoded message / update, not once per field.
+
+        Args:
+            groups: mask (GROUP_BITS, group_mask()) of the field groups
+                written; by default every group
+        """
+        version = self._version + 1
+        self._version = version
+        self._dirty |= groups
+        self._snapshot_dirty |= groups
+        group_versions = self._group_versions
+        for index in _MASK_INDEXES[groups]:
+            group_versions[index] = version
+
+    @property
+    def version(self):
+        """Number of mark_changed() calls since creation (monotonic)."""
+        return self._version
+
+    def group_version(self, name):
+        """Return the version of the last change to a field group (0 if it
+        never changed). Monotonic, comparable with ``version``."""
+        return self._group_versions[GROUP_BITS[name].bit_length() - 1]
+
+    @property
+    def dirty(self):
+        """Mask of the groups changed since the last take_dirty()."""
+        return self._dirty
+
+    def take_dirty(self):
+        """Return the mask of the groups changed since the last call and
+        clear it."""
+        dirty = self._dirty
+        self._dirty = 0
+        return dirty
+
+    # --- data age -----------------------------------------------------------
+
+    def mark_received(self, timestamp):
+        """Note the receive timestamp (time.time() clock, e.g. msg.timestamp)
+        of decoded CAN data. The oldest one since take_received_at() is kept."""
+        if self._received_at is None:
+            self._received_at = timestamp
+
+    def take_received_at(self):
+        """Return the receive timestamp of the oldest data not yet sent (None
+        if nothing was received since the last call) and clear it."""
+        timestamp = self._received_at
+        self._received_at = None
+        return timestamp
+
+    def mark_position(self, timestamp):
+        """Note the receive timestamp of a new GPS position (the newest one
+        since take_position() is kept)."""
+        self._position_at = timestamp
+
+    def take_position(self):
+        """Return the receive timestamp of the newest GPS position not yet
+        taken (None if there was none since the last call) and clear it."""
+        timestamp = self._position_at
+        self._position_at = None
+        return timestamp
+
+    # --- serialization ------------------------------------------------------
+
+    def snapshot(self):
+        """Return a dict of every field.
+
+        The same dict object is returned on every call and only the groups
+        marked by mark_changed() since the previous call are refreshed, so it
+        must be treated as read-only and copied if it is kept across updates.
+        """
+        dirty = self._snapshot_dirty
+        if dirty:
+            snapshot = self._snapshot
+            if dirty == ALL_GROUPS:
+                snapshot.update(zip(FIELDS, _GET_FIELDS(self)))
+            else:
+                for index in _MASK_INDEXES[dirty]:
+                    fields, get_fields = _GROUP_READERS[index]
+                    snapshot.update(zip(fields, get_fields(self)))
+            self._snapshot_dirty = 0
+        return self._snapshot
+
+    def snapshot_json(self):
+        """Return the snapshot serialized as JSON, cached until the next
+        mark_changed()."""
+        cached = self._json
+        version = self._version
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        text = json.dumps(self.snapshot())
+        self._json = (version, text)
+        return text
+
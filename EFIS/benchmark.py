@@ -0,0 +1,1659 @@
+"""Benchmarks of the EFIS server hot paths, with regression baselines.
+
+Runs on any Linux box - no CAN interface, encoder or backlight is needed.
+Frames are generated for every CAN_MSG_ID from CAN_MESSAGE_SCHEMA with
+plausible engineering values, and flight plans are generated as Garmin FPL
+files.
+
+Measured (nanoseconds per operation, best of several runs):
+
+    decode.<MESSAGE>            generated decoder, per frame
+    dispatch.unknown_id         a frame without a handler (ENCODER)
+    process_can_messages        mixed bus traffic through the batched drain,
+                                timeout monitor and push scheduler, per frame
+    publish_update.*            send_json serialization per update (delta,
+                                binary frame, full snapshot JSON)
+    navigation.*                compute_navigation, cross_track_distance,
+                                compute_route_table of a 500 waypoint plan,
+                                GPS1 decode with a plan loaded and one step
+                                of the navigation task
+    flightplan.load_<N>         FlightPlan.load of an N waypoint plan
+    flightplan.load_table_<N>   FlightPlan.load of a 100 waypoint route with
+                                an N entry waypoint table
+
+    python benchmark.py                    run and compare with the baseline
+    python benchmark.py --save             run and store the new baseline
+    python benchmark.py --filter decode    run matching benchmarks only
+    python benchmark.py --vcan vcan0       frames through a virtual CAN bus
+                                           (see vcan_benchmarks)
+    python benchmark.py --compare          the former implementations against
+                                           the current ones (see COMPARISONS)
+
+The baseline (BASELINE_FILE by default) is machine specific. A benchmark
+that is slower than its baseline by more than --threshold (a fraction)
+fails the run with exit status 1.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+import xml.etree.ElementTree as ET
+from functools import partial
+from pathlib import Path
+
+import aio_server
+import can_index
+import efis_log
+from aio_server import CAN_MSG_ID
+from avionics_data import FIELDS, GROUP_BITS, AvionicsData
+from can_reader import CanFrame, SocketCANReader
+from can_recorder import (FILE_HEADER, LOG_MAGIC, LOG_SUFFIX, LOG_VERSION, RECORD, CanRecorder,
+                          iter_records, log_files)
+from can_replay import CanReplay, load_frames
+from can_schema import CAN_MESSAGE_SCHEMA, CAN_SCHEMA_BY_ID, CAN_SCHEMA_BY_NAME
+from encoder_poller import EncoderPoller
+from flightplan import (FPL_NS, FlightPlan, LegGeometry, PointGeometry, compute_navigation,
+                        compute_route_table, cross_track_distance, haversine_distance,
+                        initial_bearing, parse_fpl)
+from flightplan_cache import FlightPlanCache
+from flightplan_watcher import FlightPlanWatcher
+from loop_monitor import LoopMonitor
+from metrics import LatencyHistogram
+from push_scheduler import PushGroup, PushScheduler
+from websocket_delta import DeltaEncoder
+from websocket_hub import BroadcastHub
+
+BASELINE_FILE = Path(__file__).with_name('benchmark_baseline.json')
+DEFAULT_THRESHOLD = 0.25    # fail when 25% slower than the baseline
+MIN_RUN_TIME = 0.2          # seconds per timing run
+REPEAT = 5                  # timing runs per benchmark (the best is kept)
+
+# Engineering value ranges of the generated frames (attributes not listed
+# use 0..100)
+VALUE_RANGES = {
+    'yaw': (0.0, 359.9), 'pitch': (-30.0, 30.0), 'roll': (-60.0, 60.0),
+    'turn_rate': (-10.0, 10.0),
+    'accx': (-2000, 2000), 'accy': (-2000, 2000), 'accz': (-2000, 2000), 'calib': (0, 3),
+    'airspeed': (0, 200), 'altitude': (-1000, 18000), 'vsi': (-3000, 3000),
+    'static_pressure': (5000, 10500), 'temperature': (-40, 50),
+    'differential_pressure': (0, 3000), 'aoa': (-5, 20), 'oat': (-40.0, 50.0),
+    'can_qnh_hpa': (950, 1050), 'can_qnh': (2800, 3100),
+    'latitude': (42_000_000, 44_000_000), 'longitude': (-81_000_000, -79_000_000),
+    'gps_speed': (0, 200), 'gps_altitude': (0, 18000), 'true_track': (0, 359),
+    'gps_fix_quality': (0, 2), 'gps_fix_3d': (1, 3), 'gps_satellites': (0, 12),
+    'gps_hdop': (0.5, 5.0), 'gps_vdop': (0.5, 5.0),
+    'magx': (-60.0, 60.0), 'magy': (-60.0, 60.0), 'magz': (-60.0, 60.0),
+    'tm_year': (2024, 2030), 'tm_mon': (1, 12), 'tm_mday': (1, 28),
+    'tm_hour': (0, 23), 'tm_min': (0, 59), 'tm_sec': (0, 59),
+}
+
+# Frames per second of each message on the bus
+TRAFFIC_RATES = {
+    CAN_MSG_ID.AHRS_ORIENT: 50, CAN_MSG_ID.AHRS_ACCEL: 50,
+    CAN_MSG_ID.ALTITUDE_AIRSPEED_VSI: 10, CAN_MSG_ID.STATIC_PRESSURE: 10,
+    CAN_MSG_ID.AOA: 5, CAN_MSG_ID.OAT: 5, CAN_MSG_ID.QNH: 1,
+    CAN_MSG_ID.GPS1: 1, CAN_MSG_ID.GPS2: 1, CAN_MSG_ID.GPS3: 1,
+    CAN_MSG_ID.MAGX: 4, CAN_MSG_ID.MAGY: 4, CAN_MSG_ID.MAGZ: 4,
+    CAN_MSG_ID.TIME_SYNC: 1, CAN_MSG_ID.ENCODER: 10,
+}
+
+
+# =============================================================================
+# Synthetic data
+# =============================================================================
+
+def synthetic_payload(msg_id, rng):
+    """Return a payload for a CAN message ID with random plausible values.
+    IDs without a schema entry get 8 random bytes."""
+    entry = CAN_SCHEMA_BY_ID.get(msg_id)
+    if entry is None:
+        return bytes(rng.getrandbits(8) for _ in range(8))
+    values = {}
+    for field in entry.fields:
+        if field is not None:
+            low, high = VALUE_RANGES.get(field.attr, (0, 100))
+            values[field.attr] = (rng.randint(low, high) if isinstance(low, int)
+                                  else rng.uniform(low, high))
+    return entry.encode(values)
+
+
+def synthetic_frames(msg_id, count, start=0.0, rate=100.0, seed=0):
+    """Return count CanFrames for one message ID at rate frames per second.
+
+    Args:
+        msg_id: CAN arbitration ID (int or CAN_MSG_ID)
+        count: number of frames
+        start: timestamp of the first frame
+        rate: frames per second
+        seed: random seed (the same seed gives the same frames)
+    """
+    msg_id = getattr(msg_id, 'value', msg_id)
+    rng = random.Random(f"{msg_id}-{seed}")
+    frames = []
+    for index in range(count):
+        payload = synthetic_payload(msg_id, rng)
+        frames.append(CanFrame(start + index / rate, msg_id, False, False, False,
+                               len(payload), payload))
+    return frames
+
+
+def synthetic_traffic(seconds, rates=None, start=0.0, seed=0):
+    """Return the mixed bus traffic of every message in rates (default
+    TRAFFIC_RATES) over the given seconds, in timestamp order."""
+    rates = TRAFFIC_RATES if rates is None else rates
+    frames = []
+    for msg_id, rate in rates.items():
+        frames.extend(synthetic_frames(msg_id, int(seconds * rate), start, rate, seed))
+    frames.sort(key=lambda frame: frame.timestamp)
+    return frames
+
+
+def synthetic_flight_plan(path, waypoints, start=(43.0, -80.0), spacing=0.05,
+                          table_size=None, encoding='utf-8'):
+    """Write a Garmin FPL file with the given number of route waypoints,
+    heading north-east from start.
+
+    Args:
+        table_size: waypoint table entries (default: just the route's);
+            the route uses every (table_size // waypoints)th entry
+        encoding: file encoding ('utf-16' writes a BOM)
+    """
+    table_size = max(table_size or waypoints, waypoints)
+    step = table_size // waypoints
+    table = []
+    route = []
+    for index in range(table_size):
+        name = f"W{index:04d}"
+        lat = start[0] + index * spacing / step
+        lon = start[1] + index * spacing / step / 2
+        table.append(f"    <waypoint><identifier>{name}</identifier>"
+                     f"<type>USER WAYPOINT</type><lat>{lat:.6f}</lat><lon>{lon:.6f}</lon>"
+                     f"<altitude-ft>{3000 + index}</altitude-ft></waypoint>")
+        if index % step == 0 and len(route) < waypoints:
+            route.append(f"    <route-point><waypoint-identifier>{name}</waypoint-identifier>"
+                         f"<waypoint-type>USER WAYPOINT</waypoint-type></route-point>")
+    Path(path).write_text(
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<flight-plan xmlns="http://www8.garmin.com/xmlschemas/FlightPlan/v1">\n'
+        '  <waypoint-table>\n' + '\n'.join(table) + '\n  </waypoint-table>\n'
+        '  <route>\n    <route-name>BENCHMARK</route-name>\n' + '\n'.join(route) +
+        '\n  </route>\n</flight-plan>\n', encoding=encoding)
+
+
+def synthetic_snapshots(ticks, rate=20):
+    """Yield AvionicsData-like dicts for a cruise flight at the JSON rate
+    (the same dict, updated in place each tick)."""
+    rng = random.Random(1)
+    snapshot = {name: None for name in (
+        'altitude', 'airspeed', 'vsi', 'static_pressure', 'temperature',
+        'differential_pressure', 'aoa', 'oat', 'can_qnh', 'can_qnh_hpa', 'yaw',
+        'pitch', 'roll', 'turn_rate', 'accx', 'accy', 'accz', 'calib',
+        'latitude', 'longitude', 'gps_speed', 'gps_altitude', 'true_track',
+        'gps_fix_quality', 'gps_fix_3d', 'gps_satellites', 'gps_hdop',
+        'gps_vdop', 'magx', 'magy', 'magz', 'tm_year', 'tm_mon', 'tm_mday',
+        'tm_hour', 'tm_min', 'tm_sec', 'position', 'pressed', 'dtk',
+        'bearing', 'xtrack', 'dist', 'to_from', 'wpt_id', 'route_name',
+        'route_waypoints', 'active_leg', 'direct_to_active')}
+    snapshot.update(can_qnh=2992.0, can_qnh_hpa=1013, calib=255, gps_fix_quality=2,
+                    gps_fix_3d=3, gps_satellites=9, tm_year=2026, tm_mon=10,
+                    tm_mday=17, position=0, pressed=False, to_from='TO',
+                    wpt_id='KBUF', route_name='CYKF TO KBUF', active_leg=3,
+                    direct_to_active=False, static_pressure=9500, temperature=12,
+                    route_waypoints=[{'id': f"WPT{i:02d}", 'type': 'USER WAYPOINT'}
+                                     for i in range(30)])
+    for tick in range(ticks):
+        t = tick / rate
+        snapshot['yaw'] = round(90 + 2 * math.sin(t / 7), 1)
+        snapshot['pitch'] = round(2 + 0.5 * math.sin(t / 3), 1)
+        snapshot['roll'] = round(5 * math.sin(t / 5), 1)
+        snapshot['turn_rate'] = round(0.3 * math.sin(t / 5), 1)
+        snapshot['accx'] = rng.randint(-5, 5)
+        snapshot['accy'] = rng.randint(-5, 5)
+        snapshot['accz'] = 980 + rng.randint(-5, 5)
+        snapshot['magx'] = 20 + rng.random()
+        snapshot['magy'] = -5 + rng.random()
+        snapshot['magz'] = 40 + rng.random()
+        snapshot['airspeed'] = 120 + rng.randint(-1, 1)
+        snapshot['altitude'] = 5500 + rng.randint(-3, 3)
+        snapshot['vsi'] = rng.randint(-30, 30)
+        snapshot['differential_pressure'] = 600 + rng.randint(-3, 3)
+        if tick % rate == 0:  # 1 Hz GPS and time
+            snapshot['latitude'] = 43_130_000 + tick * 5
+            snapshot['longitude'] = -80_340_000 + tick * 5
+            snapshot['gps_speed'] = 125
+            snapshot['gps_altitude'] = 5480
+            snapshot['true_track'] = 91
+            snapshot['gps_hdop'] = 0.9
+            snapshot['gps_vdop'] = 1.2
+            snapshot['tm_sec'] = (tick // rate) % 60
+            snapshot['tm_min'] = 30
+            snapshot['tm_hour'] = 14
+            snapshot['dist'] = round(40 - tick * 0.002, 1)
+            snapshot['bearing'] = 91.2
+            snapshot['dtk'] = 91.0
+            snapshot['xtrack'] = 0.12
+        yield snapshot
+
+
+class SimulatedSocket:
+    """Stand-in for a WebSocketResponse with a fixed per-send delay."""
+
+    def __init__(self, send_delay):
+        self.closed = False
+        self._send_delay = send_delay
+        self.received = 0
+
+    async def _send(self):
+        await asyncio.sleep(self._send_delay)
+        self.received += 1
+
+    async def send_str(self, _payload):
+        await self._send()
+
+    async def send_bytes(self, _payload):
+        await self._send()
+
+    async def close(self):
+        self.closed = True
+
+
+async def simulate_clients(client_count, seconds=2.0, rate=50, slow_clients=1):
+    """Publish one serialized update per tick to client_count clients.
+
+    Returns (serializations, serialize seconds, publish seconds, client
+    statistics, sockets)."""
+    snapshot = {f"field{i}": i * 1.5 for i in range(50)}
+    hub = BroadcastHub()
+    sockets = []
+    for index in range(client_count):
+        slow = index < slow_clients
+        web_socket = SimulatedSocket(0.2 if slow else 0.0005)
+        sockets.append(web_socket)
+        hub.add(web_socket, name=f"{'slow' if slow else 'client'}{index}")
+
+    serializations = 0
+    serialize_time = publish_time = 0.0
+    loop = asyncio.get_running_loop()
+    period = 1.0 / rate
+    next_tick = loop.time()
+    for tick in range(int(seconds * rate)):
+        start = time.perf_counter()
+        snapshot['field0'] = tick
+        payload = json.dumps(snapshot)   # serialized once for every client
+        serializations += 1
+        middle = time.perf_counter()
+        hub.publish(payload)
+        end = time.perf_counter()
+        serialize_time += middle - start
+        publish_time += end - middle
+        next_tick += period
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+    await asyncio.sleep(0.05)  # let the fast clients drain
+    client_stats = hub.stats()
+    await hub.close()
+    return serializations, serialize_time, publish_time, client_stats, sockets
+
+
+
+# =============================================================================
+# Benchmarks - each returns nanoseconds per operation
+# =============================================================================
+
+def _per_operation(function, operations):
+    """Best time of REPEAT runs of function (autoranged to MIN_RUN_TIME),
+    in ns per operation (function performs `operations` operations)."""
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        if timer.timeit(number) >= MIN_RUN_TIME:
+            break
+        number *= 2
+    best = min(timer.repeat(repeat=REPEAT, number=number))
+    return best / (number * operations) * 1e9
+
+
+def bench_decoders():
+    results = {}
+    handlers = aio_server.CAN_MESSAGE_HANDLERS
+    for msg_id in CAN_MSG_ID:
+        frames = synthetic_frames(msg_id, 256)
+        data = AvionicsData()
+        last_received_times = {}
+        handler = handlers.get(msg_id.value)
+        if handler is None:
+            dispatch = aio_server.dispatch_can_message
+
+            def run(frames=frames, data=data):
+                for msg in frames:
+                    dispatch(msg, data, last_received_times)
+            results['dispatch.unknown_id'] = _per_operation(run, len(frames))
+        else:
+            def run(frames=frames, data=data, handler=handler):
+                for msg in frames:
+                    handler(msg, data, last_received_times)
+            results[f'decode.{msg_id.name}'] = _per_operation(run, len(frames))
+    return results
+
+
+class _QueueReader:
+    """Reader with the interface of can.AsyncBufferedReader."""
+
+    def __init__(self):
+        self.buffer = asyncio.Queue()
+
+    async def get_message(self):
+        return await self.buffer.get()
+
+
+async def _process(frames):
+    """Run frames through process_can_messages; returns elapsed seconds."""
+    data = AvionicsData()
+    last_received_times = {}
+    can_stats = aio_server.CanStatistics()
+    push_scheduler = aio_server.create_push_scheduler()
+    timeout_monitor = aio_server.create_timeout_monitor(data, last_received_times,
+                                                        push_scheduler=push_scheduler)
+    reader = _QueueReader()
+    for msg in frames:
+        reader.buffer.put_nowait(msg)
+    start = time.perf_counter()
+    task = asyncio.ensure_future(aio_server.process_can_messages(
+        reader, data, last_received_times, can_stats, timeout_monitor, push_scheduler))
+    while can_stats.frames_received < len(frames):
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    timeout_monitor.stop()
+    return elapsed
+
+
+def bench_process_can_messages():
+    frames = synthetic_traffic(60.0)
+    best = min(asyncio.run(_process(frames)) for _ in range(REPEAT))
+    return {'process_can_messages': best / len(frames) * 1e9}
+
+
+class _DiscardSocket:
+    """Websocket that is never sent to (the hub's sender tasks do not get
+    to run); the drop-oldest client queue keeps it bounded."""
+    closed = False
+
+
+def bench_decoders_single(handler, frames, data):
+    """ns per frame of one handler over frames."""
+    def run():
+        for msg in frames:
+            handler(msg, data, None)
+    return _per_operation(run, len(frames))
+
+
+async def _publish_benchmarks():
+    web_socket_response = aio_server.MyWebSocketResponse()
+    web_socket_response.hub = BroadcastHub(queue_size=4)
+    json_client = web_socket_response.hub.add(_DiscardSocket(), 'json')
+    binary_client = web_socket_response.hub.add(_DiscardSocket(), 'binary')
+    binary_client.binary = True
+
+    data = AvionicsData()
+    handlers = aio_server.CAN_MESSAGE_HANDLERS
+    for msg in synthetic_traffic(2.0, {msg_id: 1 for msg_id in CAN_MSG_ID}):
+        aio_server.dispatch_can_message(msg, data, {})
+    ahrs = synthetic_frames(CAN_MSG_ID.AHRS_ORIENT, 256)
+    ahrs_handler = handlers[CAN_MSG_ID.AHRS_ORIENT.value]
+
+    def decode_ahrs(msg, data, last_received_times):
+        # as dispatch_can_message: decode, then mark the snapshot stale
+        ahrs_handler(msg, data, last_received_times)
+        data.mark_changed()
+    attitude = set(CAN_SCHEMA_BY_ID[CAN_MSG_ID.AHRS_ORIENT.value].attrs)
+    publish = aio_server.publish_update
+    results = {}
+
+    def updates(clients, fields):
+        def run():
+            for msg in ahrs:
+                decode_ahrs(msg, data, None)
+                publish(web_socket_response, data, fields)
+        hub_clients = web_socket_response.hub.clients
+        hub_clients[:] = clients
+        result = _per_operation(run, len(ahrs))
+        hub_clients[:] = [json_client, binary_client]
+        return result
+
+    # the cost of the AHRS decode is measured separately - subtract it
+    decode_cost = bench_decoders_single(decode_ahrs, ahrs, data)
+    results['publish_update.json_delta'] = updates([json_client], attitude) - decode_cost
+    results['publish_update.binary'] = updates([binary_client], attitude) - decode_cost
+
+    def snapshot_json():
+        for msg in ahrs:
+            decode_ahrs(msg, data, None)
+            data.snapshot_json()
+    results['publish_update.snapshot_json'] = (_per_operation(snapshot_json, len(ahrs))
+                                               - decode_cost)
+    return results
+
+
+def bench_publish_update():
+    return asyncio.run(_publish_benchmarks())
+
+
+def bench_navigation():
+    plan = FlightPlan()
+    plan.route_name = 'BENCHMARK'
+    plan.waypoints = [{'id': f"W{index}", 'type': 'USER WAYPOINT',
+                       'lat': 43.0 + index * 0.5, 'lon': -80.0, 'alt': None}
+                      for index in range(10)]
+    plan.active_leg = 5
+    # far from the active waypoint, so it never sequences
+    positions = [(int((43.0 + index * 0.0001) * 1_000_000), -80_010_000)
+                 for index in range(256)]
+
+    def navigate():
+        for lat, lon in positions:
+            compute_navigation(lat, lon, plan)
+
+    def cross_track():
+        for lat, lon in positions:
+            cross_track_distance(lat / 1e6, lon / 1e6, 43.0, -80.0, 45.0, -80.0)
+
+    route = FlightPlan()
+    route.waypoints = [{'id': f"W{index}", 'type': 'USER WAYPOINT',
+                        'lat': 43.0 + index * 0.05, 'lon': -80.0, 'alt': None}
+                       for index in range(500)]
+    route.active_leg = 5
+
+    def route_table():
+        for lat, lon in positions[:32]:
+            compute_route_table(lat, lon, 120, route, 1_700_000_000)
+
+    # GPS1 frames with the plan loaded: the handler only notes the fix, the
+    # navigation task pays for navigation_step at NAV_UPDATE_RATE
+    data = AvionicsData()
+    aio_server.set_flight_plan(data, plan)
+    gps1 = synthetic_frames(CAN_MSG_ID.GPS1, 256)
+    gps1_handler = aio_server.CAN_MESSAGE_HANDLERS[CAN_MSG_ID.GPS1.value]
+
+    def gps1_decode():
+        for msg in gps1:
+            gps1_handler(msg, data, None)
+
+    def step():
+        for msg in gps1:
+            data.mark_position(msg.timestamp)
+            aio_server.navigation_step(data)
+
+    return {'navigation.compute_navigation': _per_operation(navigate, len(positions)),
+            'navigation.cross_track_distance': _per_operation(cross_track, len(positions)),
+            'navigation.route_table_500': _per_operation(route_table, 32),
+            'navigation.gps1_decode_with_plan': _per_operation(gps1_decode, len(gps1)),
+            'navigation.step': _per_operation(step, len(gps1))}
+
+
+def bench_flightplan_load(waypoints=1000, table_size=10000):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'benchmark.fpl'
+        synthetic_flight_plan(path, waypoints)
+        results[f'flightplan.load_{waypoints}'] = _per_operation(
+            lambda: FlightPlan().load(path), 1)
+        # a large exported waypoint table behind a short route
+        path = Path(directory) / 'table.fpl'
+        synthetic_flight_plan(path, 100, table_size=table_size)
+        results[f'flightplan.load_table_{table_size}'] = _per_operation(
+            lambda: FlightPlan().load(path), 1)
+        # the same plan from the binary cache directory and from memory
+        cache_dir = Path(directory) / 'cache'
+        FlightPlanCache(cache_dir).load(path)
+        results['flightplan.cache_file_load'] = _per_operation(
+            lambda: FlightPlanCache(cache_dir).load(path), 1)
+        cache = FlightPlanCache(cache_dir)
+        cache.load(path)
+        results['flightplan.cache_memory_load'] = _per_operation(
+            lambda: cache.load(path), 1)
+    return results
+
+
+BENCHMARKS = (
+    ('decode', bench_decoders),
+    ('process_can_messages', bench_process_can_messages),
+    ('publish_update', bench_publish_update),
+    ('navigation', bench_navigation),
+    ('flightplan', bench_flightplan_load),
+)
+
+
+# =============================================================================
+# Virtual CAN benchmarks - not part of the baseline, need a vcan interface
+# =============================================================================
+#
+#   sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+#   python benchmark.py --vcan vcan0
+
+async def _consume(reader, count):
+    """Read count frames, returning (elapsed seconds, latency list)."""
+    latencies = []
+    first = None
+    for _ in range(count):
+        msg = await reader.get_message()
+        now = time.time()
+        if first is None:
+            first = now
+        latencies.append(now - msg.timestamp)
+    return time.time() - first, latencies
+
+
+def _send_frames(channel, count):
+    """Send count frames as fast as the interface accepts them."""
+    import can #pylint: disable=import-error,import-outside-toplevel
+    with can.Bus(interface='socketcan', channel=channel) as tx_bus:
+        msg = can.Message(arbitration_id=0x48, data=bytes(8), is_extended_id=False)
+        for _ in range(count):
+            while True:
+                try:
+                    tx_bus.send(msg)
+                    break
+                except can.CanOperationError:
+                    time.sleep(0.0001)  # tx queue full
+
+
+async def _receive_vcan(channel, backend, count):
+    """Receive count frames through can.Notifier or SocketCANReader and
+    print the rate and the kernel-to-reader latency."""
+    import can #pylint: disable=import-error,import-outside-toplevel
+    loop = asyncio.get_running_loop()
+    bus = can.Bus(interface='socketcan', channel=channel, receive_own_messages=False)
+    notifier = None
+    if backend == 'notifier':
+        reader = can.AsyncBufferedReader()
+        notifier = can.Notifier(bus, [reader], timeout=0.1, loop=loop)
+    else:
+        reader = SocketCANReader.from_bus(bus, loop=loop)
+        reader.start()
+    try:
+        consumer = asyncio.ensure_future(_consume(reader, count))
+        await loop.run_in_executor(None, _send_frames, channel, count)
+        elapsed, latencies = await consumer
+    finally:
+        if notifier is not None:
+            notifier.stop()
+        else:
+            reader.stop()
+        bus.shutdown()
+
+    latencies.sort()
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"reader {backend:>8}: {rate:10.0f} frames/s  "
+          f"latency p50={latencies[len(latencies) // 2] * 1e6:7.0f} us  "
+          f"p99={latencies[int(len(latencies) * 0.99)] * 1e6:7.0f} us  "
+          f"max={latencies[-1] * 1e6:7.0f} us")
+
+
+FULL_LOAD_FRAMES_PER_SECOND = 2200   # 8 byte standard frames at 250 kbit/s
+
+
+async def record_vcan(channel, seconds, directory, with_recorder):
+    """Receive a saturating frame stream on channel through the native
+    reader for seconds, optionally recording it to directory.
+
+    Returns:
+        tuple: (frames received, event loop CPU seconds, CanRecorder or None)
+    """
+    import can #pylint: disable=import-error,import-outside-toplevel
+
+    loop = asyncio.get_running_loop()
+    bus = can.Bus(interface='socketcan', channel=channel)
+    reader = SocketCANReader.from_bus(bus, loop=loop)
+    reader.start()
+    recorder = None
+    if with_recorder:
+        recorder = CanRecorder(directory)
+        recorder.start(loop)
+    stop = threading.Event()
+
+    def send():
+        with can.Bus(interface='socketcan', channel=channel) as tx_bus:
+            msg = can.Message(arbitration_id=0x48, data=bytes(range(8)), is_extended_id=False)
+            while not stop.is_set():
+                try:
+                    tx_bus.send(msg)
+                except can.CanOperationError:
+                    time.sleep(0.0001)  # tx queue full - bus saturated
+
+    sender = threading.Thread(target=send, daemon=True)
+    frames = 0
+    cpu_start = time.thread_time()
+    sender.start()
+    end = loop.time() + seconds
+    try:
+        while loop.time() < end:
+            try:
+                msg = await asyncio.wait_for(reader.get_message(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            batch = [msg]
+            while True:
+                try:
+                    batch.append(reader.buffer.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            frames += len(batch)
+            if recorder is not None:
+                recorder.record_batch(batch)
+    finally:
+        cpu = time.thread_time() - cpu_start
+        stop.set()
+        sender.join()
+        reader.stop()
+        bus.shutdown()
+        if recorder is not None:
+            recorder.stop()
+    return frames, cpu, recorder
+
+
+def _recorder_overhead(channel, seconds=10.0):
+    """Print the event loop CPU with and without the recorder at full bus
+    load; the recorder should add under 1 % of one core."""
+    with tempfile.TemporaryDirectory() as directory:
+        base_frames, base_cpu, _ = asyncio.run(record_vcan(channel, seconds, directory, False))
+        frames, cpu, recorder = asyncio.run(record_vcan(channel, seconds, directory, True))
+        written = sum(1 for path in log_files(directory) for _ in iter_records(path))
+    overhead = ((cpu / frames) - (base_cpu / base_frames)) * (frames / seconds) * 100
+    print(f"recorder off: {base_frames / seconds:8.0f} frames/s  "
+          f"{base_cpu / seconds * 100:5.1f}% CPU")
+    print(f"recorder on:  {frames / seconds:8.0f} frames/s  {cpu / seconds * 100:5.1f}% CPU  "
+          f"(recorder {overhead:+.2f}% at this frame rate)")
+    print(f"recorded {recorder.frames_recorded}, written {written}, "
+          f"dropped {recorder.frames_dropped}, fsyncs {recorder.fsyncs}")
+
+
+def vcan_benchmarks(channel, count=50000):
+    """Compare the can.Notifier and native reader paths on a virtual CAN
+    bus (count frames each), then measure the recorder at full load."""
+    print(f"Receiving {count} frames on {channel}")
+    for backend in ('notifier', 'native'):
+        asyncio.run(_receive_vcan(channel, backend, count))
+    _recorder_overhead(channel)
+
+
+# =============================================================================
+# Comparisons with the former implementations - printed, not part of the
+# baseline
+# =============================================================================
+#
+#   python benchmark.py --compare            all comparisons
+#   python benchmark.py --compare encoder    matching comparisons only
+
+class _SlowEncoder:
+    """Encoder/button stand-in whose reads block like an I2C transaction."""
+
+    def __init__(self, read_time):
+        self._read_time = read_time
+        self._position = 0
+
+    @property
+    def position(self):
+        time.sleep(self._read_time)
+        self._position += 1  # knob being spun
+        return self._position
+
+    @property
+    def value(self):
+        time.sleep(self._read_time)
+        return True
+
+
+async def _inline_read_input(encoder, button, data):
+    """The former read_input loop - blocking reads on the event loop."""
+    last_encoder_position = -encoder.position
+    while True:
+        new_encoder_position = -encoder.position
+        if abs(new_encoder_position - last_encoder_position) < 100:
+            data.position = new_encoder_position
+            last_encoder_position = new_encoder_position
+        data.pressed = not button.value
+        await asyncio.sleep(0)
+
+
+async def _threaded_read_input(encoder, button, data):
+    poller = EncoderPoller(encoder, button, asyncio.get_running_loop())
+    poller.start()
+    try:
+        while True:
+            event = await poller.events.get()
+            data.position = event.position
+            data.pressed = event.pressed
+    finally:
+        poller.stop()
+
+
+async def _loop_lag(reader, seconds=2.0, interval=0.005):
+    """Run reader on a spinning slow encoder; return the p50, p99 and worst
+    lag of a timer on the same loop."""
+    encoder = _SlowEncoder(0.0005)  # ~0.5 ms per I2C read
+    task = asyncio.ensure_future(reader(encoder, encoder, AvionicsData()))
+    lags = []
+    loop = asyncio.get_running_loop()
+    end = loop.time() + seconds
+    while loop.time() < end:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    lags.sort()
+    return lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1]
+
+
+def compare_encoder():
+    """Event loop lag while the knob is spun: reads on the loop against
+    EncoderPoller's thread."""
+    for label, reader in (('inline', _inline_read_input),
+                          ('threaded', _threaded_read_input)):
+        p50, p99, worst = asyncio.run(_loop_lag(reader))
+        print(f"encoder {label:>8}: loop lag p50={p50 * 1e3:6.2f} ms  "
+              f"p99={p99 * 1e3:6.2f} ms  max={worst * 1e3:6.2f} ms")
+
+
+def compare_delta(ticks=20 * 60, rate=20):
+    """Bytes and CPU per tick of one minute at the JSON rate: full JSON
+    every tick against DeltaEncoder."""
+    seconds = ticks / rate
+    full_bytes = 0
+    full_start = time.perf_counter()
+    for snapshot in synthetic_snapshots(ticks, rate):
+        full_bytes += len(json.dumps(snapshot))
+    full_time = time.perf_counter() - full_start
+
+    fake_time = [0.0]
+    encoder = DeltaEncoder(deadbands=aio_server.WEBSOCKET_DELTA_DEADBANDS,
+                           clock=lambda: fake_time[0])
+    for tick, snapshot in enumerate(synthetic_snapshots(ticks, rate)):
+        fake_time[0] = tick / rate
+        encoder.encode(snapshot)
+
+    print(f"delta full JSON: {full_bytes / seconds:9.0f} bytes/s  "
+          f"{full_time / ticks * 1e6:6.1f} us/tick")
+    print(f"delta     delta: {encoder.bytes_sent / seconds:9.0f} bytes/s  "
+          f"{encoder.encode_seconds / ticks * 1e6:6.1f} us/tick  "
+          f"({encoder.messages} messages, {encoder.keyframes} keyframes)")
+
+
+# (group, CAN frame rate in Hz)
+_PUSH_TRAFFIC = (
+    ('attitude', 50),
+    ('air_data', 20),
+    ('gps', 1),
+)
+
+
+async def _produce_pushes(loop, mark, seconds):
+    """Generate CAN arrivals for each simulated group, calling mark(name, timestamp)."""
+    async def stream(name, rate):
+        period = 1.0 / rate
+        next_time = loop.time()
+        end = next_time + seconds
+        while next_time < end:
+            mark(name, time.time())
+            next_time += period
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+    await asyncio.gather(*(stream(name, rate) for name, rate in _PUSH_TRAFFIC))
+
+
+async def _fixed_rate_pushes(seconds, period=0.05):
+    """The former send_json loop: every group is sent every period."""
+    loop = asyncio.get_running_loop()
+    pending = {}
+    histograms = {name: LatencyHistogram() for name, _ in _PUSH_TRAFFIC}
+    counts = {'updates': 0, 'payloads': 0}
+
+    def mark(name, timestamp):
+        pending.setdefault(name, timestamp)
+
+    async def sender():
+        while True:
+            now = time.time()
+            for name, first in pending.items():
+                histograms[name].record(now - first)
+            pending.clear()
+            counts['updates'] += 1
+            counts['payloads'] += len(histograms)
+            await asyncio.sleep(period)
+
+    task = asyncio.ensure_future(sender())
+    await _produce_pushes(loop, mark, seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return counts['updates'], counts['payloads'], histograms
+
+
+async def _scheduled_pushes(seconds, rates):
+    """send_json on a PushScheduler with the given group rates."""
+    loop = asyncio.get_running_loop()
+    scheduler = PushScheduler([PushGroup(name, (name,), rates[name])
+                               for name, _ in _PUSH_TRAFFIC])
+    counts = {'payloads': 0}
+
+    async def sender():
+        while True:
+            groups = await scheduler.next_update()
+            counts['payloads'] += len(groups)
+            scheduler.sent(groups)
+
+    task = asyncio.ensure_future(sender())
+    await _produce_pushes(loop, scheduler.mark_dirty, seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return (scheduler.updates, counts['payloads'],
+            {name: group.latency for name, group in scheduler.groups.items()})
+
+
+def compare_push(seconds=5.0):
+    """Updates per second and CAN-to-send latency: the fixed 20 Hz send
+    loop against the change-driven PushScheduler."""
+    for label, bench in (
+            ('fixed 20 Hz', _fixed_rate_pushes),
+            ('scheduled 50/20/2 Hz',
+             partial(_scheduled_pushes, rates={'attitude': 50, 'air_data': 20, 'gps': 2})),
+            ('scheduled 20/20/2 Hz',
+             partial(_scheduled_pushes, rates={'attitude': 20, 'air_data': 20, 'gps': 2}))):
+        updates, payloads, histograms = asyncio.run(bench(seconds))
+        print(f"push {label}: {updates / seconds:5.1f} updates/s  "
+              f"{payloads / seconds:5.1f} group payloads/s")
+        for name, histogram in histograms.items():
+            print(f"  {name:>9}: {histogram.summary()}")
+
+
+def compare_hub():
+    """Serialization and publish cost per update with 1 and 10 clients (one
+    of them slow)."""
+    for clients in (1, 10):
+        serializations, serialize_time, publish_time, stats, _ = \
+            asyncio.run(simulate_clients(clients))
+        print(f"hub {clients:2d} clients: {serializations} updates, "
+              f"{serializations} serializations, "
+              f"serialize {serialize_time / serializations * 1e6:5.1f} us  "
+              f"publish {publish_time / serializations * 1e6:5.1f} us per update")
+        for client_stats in stats[:2]:
+            print(f"   {client_stats['name']:>8}: sent={client_stats['sent']} "
+                  f"dropped={client_stats['dropped']} "
+                  f"max_queue={client_stats['max_queue']} lag {client_stats['lag']}")
+
+
+class _DictAvionicsData:
+    """The former plain-object AvionicsData."""
+
+    def __init__(self):
+        for field in FIELDS:
+            setattr(self, field, None)
+        self._flight_plan = None
+
+    def mark_changed(self, _groups=None):
+        pass
+
+
+def _snapshot_ticks(label, data, update, serialize, ticks=20000):
+    """Time update + serialize per tick, then measure one tick's allocations."""
+    start = time.perf_counter()
+    for tick in range(ticks):
+        update(data, tick)
+    update_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for tick in range(ticks):
+        update(data, tick)
+        serialize(data)
+    total_time = time.perf_counter() - start
+
+    update(data, ticks)
+    tracemalloc.start()
+    serialize(data)
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"snapshot {label:<38} writes {update_time / ticks * 1e6:5.2f} us  "
+          f"serialize {(total_time - update_time) / ticks * 1e6:6.2f} us  "
+          f"allocated {allocated:5d} B per tick")
+
+
+def _no_update(_data, _tick):
+    pass
+
+
+def _ahrs_update(data, tick):
+    data.yaw = tick % 3600 / 10
+    data.pitch = tick % 100 / 10
+    data.roll = -tick % 100 / 10
+    data.turn_rate = 0.1
+    data.mark_changed(GROUP_BITS['attitude'])     # once per decoded message
+
+
+def _dict_comprehension(data):
+    return {k: v for k, v in data.__dict__.items() if not k.startswith('_')}
+
+
+def compare_snapshot():
+    """Per-tick CPU and allocation of send_json's former dict comprehension
+    over __dict__ against AvionicsData.snapshot() / snapshot_json()."""
+    for label, update in (('no change', _no_update), ('AHRS update', _ahrs_update)):
+        _snapshot_ticks(f"dict comprehension, {label}", _DictAvionicsData(), update,
+                        _dict_comprehension)
+        _snapshot_ticks(f"snapshot(), {label}", AvionicsData(), update,
+                        AvionicsData.snapshot)
+        _snapshot_ticks(f"dict comprehension + json, {label}", _DictAvionicsData(), update,
+                        lambda data: json.dumps(_dict_comprehension(data)))
+        _snapshot_ticks(f"snapshot_json(), {label}", AvionicsData(), update,
+                        AvionicsData.snapshot_json)
+
+
+def record_synthetic(seconds, directory, rate=FULL_LOAD_FRAMES_PER_SECOND):
+    """Record a generated full-load frame stream of the given length.
+
+    Returns:
+        tuple: (frames, event loop CPU seconds spent in the recorder,
+        stopped CanRecorder)
+    """
+    frames = [CanFrame(time.time() + index / rate, (0x28, 0x48, 0x49, 0x63)[index % 4],
+                       False, False, False, 8, bytes(range(8)))
+              for index in range(int(rate * seconds))]
+    recorder = CanRecorder(directory, chunk_records=256)
+    recorder.start()
+    cpu_start = time.thread_time()
+    for index in range(0, len(frames), 8):   # batches as drained from the reader
+        recorder.record_batch(frames[index:index + 8])
+    recorder.flush()
+    cpu = time.thread_time() - cpu_start
+    recorder.stop()
+    return len(frames), cpu, recorder
+
+
+def compare_recorder(seconds=10.0):
+    """Event loop CPU of the recorder on a generated full-load stream. This
+    leaves out the socket reads and the target's CPU and SD card; see
+    vcan_benchmarks for the measurement on a virtual bus."""
+    with tempfile.TemporaryDirectory() as directory:
+        frames, cpu, recorder = record_synthetic(seconds, directory)
+    print(f"recorder: {frames} frames ({FULL_LOAD_FRAMES_PER_SECOND}/s for {seconds:.0f} s) "
+          f"used {cpu * 1e3:.1f} ms of event loop CPU = {cpu / seconds * 100:.3f}% of one "
+          f"core, dropped {recorder.frames_dropped}")
+
+
+# (message name, frames per second) of the synthetic replay flight
+REPLAY_RATES = (
+    ('AHRS_ORIENT', 50), ('AHRS_ACCEL', 50),
+    ('ALTITUDE_AIRSPEED_VSI', 10), ('STATIC_PRESSURE', 10),
+    ('AOA', 5), ('OAT', 5),
+    ('GPS1', 1), ('GPS2', 1), ('GPS3', 1), ('TIME_SYNC', 1),
+    ('MAGX', 4), ('MAGY', 4), ('MAGZ', 4),
+)
+REPLAY_START = 1_760_000_000.0                  # epoch seconds
+REPLAY_DROPOUT = (30.0, 31.0)                   # AHRS silent (log seconds)
+REPLAY_NM_PER_SECOND = 10 / 60                  # 600 kt due north
+REPLAY_ROUTE = (('START', 43.0), ('WPT1', 43.1), ('WPT2', 43.2), ('WPT3', 43.3))
+
+
+def replay_flight_frames(seconds):
+    """Generate the frames of a straight flight north along REPLAY_ROUTE,
+    with the AHRS silent during REPLAY_DROPOUT."""
+    events = []
+    for name, rate in REPLAY_RATES:
+        entry = CAN_SCHEMA_BY_NAME[name]
+        for index in range(int(seconds * rate)):
+            offset = index / rate + entry.msg_id * 1e-5   # stagger the IDs
+            if name.startswith('AHRS') and REPLAY_DROPOUT[0] <= offset < REPLAY_DROPOUT[1]:
+                continue
+            lat = 43.0 + offset * REPLAY_NM_PER_SECOND / 60
+            values = {
+                'yaw': 0.0, 'pitch': 2.5, 'roll': round(5 * (index % 7 - 3), 1),
+                'turn_rate': 0.0, 'accx': 0, 'accy': 0, 'accz': 1000, 'calib': 3,
+                'airspeed': 120, 'altitude': 3500 + index % 20, 'vsi': 0,
+                'static_pressure': 9000, 'temperature': 15, 'differential_pressure': 70,
+                'aoa': 4, 'oat': 12.5,
+                'latitude': round(lat * 1_000_000), 'longitude': -80_000_000,
+                'gps_speed': 600, 'gps_altitude': 3500, 'true_track': 0,
+                'gps_fix_quality': 1, 'gps_fix_3d': 3, 'gps_satellites': 9,
+                'gps_hdop': 0.9, 'gps_vdop': 1.2,
+                'magx': 20.0, 'magy': -3.0, 'magz': 40.0,
+                'tm_year': 2025, 'tm_mon': 10, 'tm_mday': 9,
+                'tm_hour': 12, 'tm_min': int(offset // 60) % 60, 'tm_sec': int(offset) % 60,
+            }
+            events.append((REPLAY_START + offset, entry.msg_id, entry.encode(values)))
+    events.sort()
+    return [CanFrame(timestamp, msg_id, False, False, False, len(payload), payload)
+            for timestamp, msg_id, payload in events]
+
+
+def replay_flight_plan():
+    """Return the FlightPlan of REPLAY_ROUTE, navigating the first leg."""
+    plan = FlightPlan()
+    plan.route_name = 'SYNTHETIC'
+    plan.waypoints = [{'id': name, 'type': 'USER WAYPOINT', 'lat': lat, 'lon': -80.0,
+                       'alt': None}
+                      for name, lat in REPLAY_ROUTE]
+    plan.active_leg = 1
+    return plan
+
+
+def replay_flight(seconds, speeds):
+    """Record the synthetic flight to a log and replay it once per speed
+    (None = as fast as possible) with the display setting QNH every 200 ms.
+
+    Returns:
+        list of CanReplay, one per speed
+    """
+    client_messages = [(REPLAY_START + tick * 0.2,
+                        'json{"qnh": %d}' % (2992 if tick < 50 else 3001))
+                       for tick in range(int(seconds * 5))]
+    engines = []
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = CanRecorder(directory)
+        recorder.start()
+        recorder.record_batch(replay_flight_frames(seconds))
+        recorder.stop()
+        for speed in speeds:
+            engine = CanReplay(load_frames(directory), speed=speed,
+                               flight_plan=replay_flight_plan(),
+                               client_messages=client_messages)
+            asyncio.run(engine.run())
+            engines.append(engine)
+    return engines
+
+
+def compare_replay(seconds=120.0):
+    """Replay speed of the synthetic flight at max speed and paced, and the
+    state digest every speed must reproduce."""
+    *runs, paced = replay_flight(seconds, (None, None, None, seconds / 2.0))
+    for engine in runs:
+        stats = engine.stats()
+        print(f"replay max speed: {stats['frames']} frames in {stats['wall_seconds']:.3f} s = "
+              f"{stats['frames_per_second']} frames/s ({stats['speed']}x real time)")
+    stats = paced.stats()
+    print(f"replay paced {seconds / 2.0:.0f}x: {stats['frames']} frames in "
+          f"{stats['wall_seconds']:.2f} s ({stats['speed']}x real time)")
+    print(f"replay expirations {stats['expirations']}, QNH frames sent "
+          f"{stats['transmitted']}, digest {stats['digest'][:16]}"
+          f"{'' if all(engine.digest() == paced.digest() for engine in runs) else ' DIFFERS'}")
+
+
+def write_random_log(path, frames, seed=1):
+    """Write a recorder log of frames random frames spread over every schema
+    ID; every 1000th frame is too short for its message. Needs numpy."""
+    import numpy as np #pylint: disable=import-error,import-outside-toplevel
+    from can_decode import RECORD_DTYPE #pylint: disable=import-outside-toplevel
+
+    rng = np.random.default_rng(seed)
+    ids = np.array([entry.msg_id for entry in CAN_MESSAGE_SCHEMA], dtype=np.uint32)
+    records = np.zeros(frames, dtype=RECORD_DTYPE)
+    records['timestamp'] = time.time() + np.arange(frames) / 2200.0
+    records['can_id'] = ids[rng.integers(0, len(ids), frames)]
+    records['dlc'] = 8
+    records['data'] = rng.integers(0, 256, (frames, 8), dtype=np.uint8).view('V8')[:, 0]
+    records['dlc'][::1000] = 1          # a few short frames, rejected by the decoders
+    with open(path, 'wb') as log:
+        log.write(FILE_HEADER.pack(LOG_MAGIC, LOG_VERSION, RECORD.size, time.time()))
+        records.tofile(log)
+
+
+def compare_decode_log(millions=10.0):
+    """Bulk decode rate of can_decode.decode_log on a random log (the
+    per-frame live decoders are the decode.* benchmarks)."""
+    from can_decode import decode_log #pylint: disable=import-outside-toplevel
+
+    frames = int(millions * 1_000_000)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / f"random{LOG_SUFFIX}"
+        write_random_log(path, frames)
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            decoded = decode_log(path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    decoded_frames = sum(len(columns['timestamp']) for columns in decoded.values())
+    print(f"decode_log: {frames} frames ({decoded_frames} decoded) in {best:.3f} s = "
+          f"{frames / best / 1e6:.1f} M frames/s")
+
+
+GPS_RECORDING_UTC_START = datetime.datetime(2025, 10, 9, 12, 0, 0,
+                                            tzinfo=datetime.timezone.utc).timestamp()
+GPS_RECORDING_CLOCK_ERROR = -3600.0 * 24 * 400    # the Pi booted with a wrong clock
+
+
+def record_gps_flight(directory, seconds, rate=FULL_LOAD_FRAMES_PER_SECOND,
+                      max_file_bytes=16 * 1024 * 1024):
+    """Record seconds of full bus load with a TIME_SYNC frame every second.
+    Record timestamps are GPS_RECORDING_CLOCK_ERROR off the GPS UTC time,
+    which starts at GPS_RECORDING_UTC_START.
+
+    Returns:
+        CanRecorder: the stopped recorder
+    """
+    time_sync = CAN_SCHEMA_BY_NAME['TIME_SYNC']
+    recorder = CanRecorder(directory, max_file_bytes=max_file_bytes,
+                           max_pending_chunks=1 << 16)
+    recorder.start()
+    for index in range(rate * seconds):
+        offset = index / rate
+        timestamp = GPS_RECORDING_UTC_START + GPS_RECORDING_CLOCK_ERROR + offset
+        if index % rate == 0:
+            moment = datetime.datetime.fromtimestamp(GPS_RECORDING_UTC_START + offset,
+                                                     datetime.timezone.utc)
+            data = time_sync.encode({'tm_year': moment.year, 'tm_mon': moment.month,
+                                     'tm_mday': moment.day, 'tm_hour': moment.hour,
+                                     'tm_min': moment.minute, 'tm_sec': moment.second})
+            recorder.record(CanFrame(timestamp, time_sync.msg_id, False, False, False, 8, data))
+        else:
+            recorder.record(CanFrame(timestamp, 0x48, False, False, False, 8, bytes(8)))
+    recorder.stop(timeout=None)
+    return recorder
+
+
+def compare_index(seconds=1200, rate=FULL_LOAD_FRAMES_PER_SECOND):
+    """A 30 s GPS UTC range out of a 20 minute full-load recording: indexed
+    query against a linear scan of every record."""
+    with tempfile.TemporaryDirectory() as directory:
+        record_gps_flight(directory, seconds, rate)
+        paths = log_files(directory)
+        event = GPS_RECORDING_UTC_START + seconds * 3 / 4
+        start = time.perf_counter()
+        count = sum(1 for _ in can_index.query(directory, event - 15, event + 15, utc=True))
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        scanned = sum(1 for path in paths for record in iter_records(path)
+                      if event - 15 <= record[0] - GPS_RECORDING_CLOCK_ERROR < event + 15)
+        scan = time.perf_counter() - start
+    print(f"index: {rate * seconds} frames in {len(paths)} files, 30 s UTC range -> "
+          f"{count} frames in {indexed * 1e3:.0f} ms (linear scan {scanned} frames in "
+          f"{scan * 1e3:.0f} ms)")
+
+
+class StalledStream:
+    """A stdout that takes write_delay seconds per write (slow journald)."""
+
+    def __init__(self, write_delay):
+        self.write_delay = write_delay
+        self.lines = 0
+
+    def write(self, text):
+        time.sleep(self.write_delay)
+        self.lines += text.count('\n')
+
+    def flush(self):
+        pass
+
+
+def _feed(loop, reader, frames, rate, stop, sent_at):
+    """Bus thread: hand frames to the loop at rate per second, as
+    can.Notifier does, appending the time of each hand-over to sent_at."""
+    start = time.perf_counter()
+    for index, msg in enumerate(frames):
+        if stop.is_set():
+            break
+        delay = start + index / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        loop.call_soon_threadsafe(reader.buffer.put_nowait, msg)
+        sent_at.append(time.perf_counter())
+
+
+async def logging_load(handler, seconds, rate=FULL_LOAD_FRAMES_PER_SECOND, timeout=30.0):
+    """Process full-load CAN traffic with CAN debug logging on through
+    handler (attached to the efis logger for the run).
+
+    Returns:
+        tuple: (frames sent, seconds the last frame was processed after it
+        arrived, max loop lag)
+    """
+    root = logging.getLogger(efis_log.ROOT)
+    root.addHandler(handler)
+    root.propagate = False
+    efis_log.set_level('can', logging.DEBUG)
+
+    traffic = synthetic_traffic(1.0)
+    frames = traffic * int(seconds * rate / len(traffic) + 1)
+    frames = frames[:int(seconds * rate)]
+    reader = _QueueReader()
+    can_stats = aio_server.CanStatistics()
+    monitor = LoopMonitor(interval=0.01, stack_threshold=None)
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+    tasks = [asyncio.create_task(monitor.run()),
+             asyncio.create_task(aio_server.process_can_messages(
+                 reader, AvionicsData(), {}, can_stats))]
+    sent_at = []
+    feeder = threading.Thread(target=_feed, args=(loop, reader, frames, rate, stop, sent_at))
+    feeder.start()
+    try:
+        await loop.run_in_executor(None, feeder.join)
+        last_arrival = sent_at[-1]
+        # the process task only yields between batches, so once every frame
+        # has been taken from the reader the last one has been handled
+        deadline = last_arrival + timeout
+        while can_stats.frames_received < len(frames) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.001)
+        behind = time.perf_counter() - last_arrival
+    finally:
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        root.removeHandler(handler)
+        root.propagate = True
+        efis_log.set_level('can', None)
+    return len(frames), behind, monitor.lag.maximum
+
+
+def compare_logging(seconds=3.0, write_delay=0.002):
+    """CAN debug logging at full bus load with a stalled stdout: a handler
+    writing on the event loop (the former print calls) against the
+    efis_log queue and writer thread."""
+    print(f"logging: {FULL_LOAD_FRAMES_PER_SECOND} frames/s for {seconds:.0f} s, CAN debug "
+          f"on, stdout taking {write_delay * 1e3:.0f} ms per write")
+    direct = logging.StreamHandler(StalledStream(write_delay))
+    direct.setFormatter(efis_log.StructuredFormatter())
+    pipeline = efis_log.LogPipeline(stream=StalledStream(write_delay), queue_size=1000)
+    for label, handler in (('print-style', direct), ('queue', pipeline.handler)):
+        if handler is pipeline.handler:
+            pipeline.listener.start()
+        sent, behind, lag = asyncio.run(logging_load(handler, seconds))
+        if handler is pipeline.handler:
+            pipeline.listener.stop()
+        print(f"{label:>12}: {sent} frames, last one handled {behind:.3f} s after it "
+              f"arrived, max loop lag {lag * 1e3:.1f} ms")
+    print(f"       queue: {pipeline.output.stream.lines} lines written, "
+          f"{pipeline.handler.dropped} records dropped")
+
+
+def reference_navigation(lat, lon, prev, wpt):
+    """The former per-fix computation from the reference great-circle
+    functions: (bearing, dist, dtk, xtrack)."""
+    brg = initial_bearing(lat, lon, wpt['lat'], wpt['lon'])
+    dist = haversine_distance(lat, lon, wpt['lat'], wpt['lon'])
+    dtk = initial_bearing(prev['lat'], prev['lon'], wpt['lat'], wpt['lon'])
+    xtrack = cross_track_distance(lat, lon, prev['lat'], prev['lon'], wpt['lat'], wpt['lon'])
+    return brg, dist, dtk, xtrack
+
+
+def precomputed_navigation(lat, lon, leg):
+    """The same values from a LegGeometry, as compute_navigation gets them."""
+    position = PointGeometry(lat, lon)
+    return (position.bearing_to(leg.target), position.distance_to(leg.target),
+            leg.dtk, leg.cross_track(position))
+
+
+def compare_navigation(fixes=100000):
+    """Per-fix navigation on one leg: the reference functions against the
+    precomputed leg geometry."""
+    rng = random.Random(20)
+    prev = {'lat': 43.0, 'lon': -80.0}
+    wpt = {'lat': 44.5, 'lon': -78.5}
+    leg = LegGeometry(PointGeometry(prev['lat'], prev['lon']),
+                      PointGeometry(wpt['lat'], wpt['lon']))
+    positions = [(43.0 + rng.uniform(-5, 5), -80.0 + rng.uniform(-5, 5))
+                 for _ in range(fixes)]
+    timings = {}
+    for label, navigate in (('reference', partial(reference_navigation, prev=prev, wpt=wpt)),
+                            ('precomputed', partial(precomputed_navigation, leg=leg))):
+        start = time.perf_counter()
+        for lat, lon in positions:
+            navigate(lat, lon)
+        timings[label] = (time.perf_counter() - start) / fixes
+        print(f"navigation {label:>12}: {timings[label] * 1e6:.2f} us per fix")
+    print(f"navigation: speedup {timings['reference'] / timings['precomputed']:.1f}x")
+
+
+def reference_parse_fpl(filepath):
+    """The former FlightPlan.load parsing: the whole file decoded,
+    ET.fromstring and findall. Returns what parse_fpl returns."""
+    raw = Path(filepath).read_bytes()
+    text = raw.decode('utf-16') if raw[:2] in (b'\xff\xfe', b'\xfe\xff') else raw.decode('utf-8')
+    root = ET.fromstring(text)
+    wpt_lookup = {}
+    for wpt in root.findall(f'{FPL_NS}waypoint-table/{FPL_NS}waypoint'):
+        lat_text = wpt.findtext(f'{FPL_NS}lat', '')
+        lon_text = wpt.findtext(f'{FPL_NS}lon', '')
+        alt_text = wpt.findtext(f'{FPL_NS}altitude-ft', '')
+        if lat_text and lon_text:
+            key = (wpt.findtext(f'{FPL_NS}identifier', ''), wpt.findtext(f'{FPL_NS}type', ''))
+            wpt_lookup[key] = {'id': key[0], 'type': key[1], 'lat': float(lat_text),
+                               'lon': float(lon_text),
+                               'alt': int(alt_text) if alt_text else None}
+    route_el = root.find(f'{FPL_NS}route')
+    keys = [(rp.findtext(f'{FPL_NS}waypoint-identifier', ''),
+             rp.findtext(f'{FPL_NS}waypoint-type', ''))
+            for rp in route_el.findall(f'{FPL_NS}route-point')]
+    return (route_el.findtext(f'{FPL_NS}route-name', 'Unknown'),
+            [wpt_lookup[key] for key in keys if key in wpt_lookup],
+            [key for key in keys if key not in wpt_lookup])
+
+
+async def loop_lag_while(load, interval=0.001):
+    """Await load() while probing the loop every interval seconds.
+
+    Returns:
+        tuple: (result of load, longest the loop was blocked, probes that
+        ran while load was awaited)
+    """
+    worst = 0.0
+    probes = 0
+    done = False
+
+    async def probe():
+        nonlocal worst, probes
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            worst = max(worst, time.perf_counter() - start - interval)
+            probes += 1
+
+    task = asyncio.create_task(probe())
+    await asyncio.sleep(interval * 2)
+    probes = 0
+    result = await load()
+    done = True
+    await task
+    return result, worst, probes
+
+
+def compare_flightplan_parse(table_size=10000):
+    """A 100 waypoint route behind a large waypoint table: the former
+    whole-file parse against the streaming parser (time and peak memory),
+    and the loop lag of loading on the loop against a worker thread."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'table.fpl'
+        synthetic_flight_plan(path, 100, table_size=table_size)
+        for label, parse in (('fromstring', reference_parse_fpl), ('streaming', parse_fpl)):
+            start = time.perf_counter()
+            parse(path)
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            parse(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{label:>14}: {table_size} entry waypoint table parsed in "
+                  f"{elapsed * 1e3:.0f} ms, peak {peak / 1e6:.1f} MB")
+
+        async def inline():
+            return FlightPlan().load(path)
+
+        async def worker():
+            return await aio_server.load_flight_plan(path)
+
+        for label, load in (('on the loop', inline), ('worker thread', worker)):
+            _, lag, _ = asyncio.run(loop_lag_while(load))
+            print(f"{label:>14}: loop blocked for up to {lag * 1e3:.1f} ms")
+
+
+def former_plan_poll(directory):
+    """One pass of the former monitor_flight_plan loop: glob, a stat per
+    file in the sort key, sort, then one more stat of the newest."""
+    fpl_files = sorted(Path(directory).glob('*.fpl'), key=lambda f: f.stat().st_mtime,
+                       reverse=True)
+    if fpl_files:
+        return fpl_files[0], fpl_files[0].stat().st_mtime
+    return None
+
+
+async def plan_pickup(watcher, directory, writes=5, chunks=4, chunk_pause=0.01):
+    """Write plans in several appends (closing in between) and wait for
+    the watcher to report each one.
+
+    Returns:
+        tuple: (seconds from each last close to the watcher reporting the
+        file, number of changes reported)
+    """
+    changes = watcher.changes()
+    await changes.__anext__()   # initial state
+    latencies = []
+    reports = 0
+    for index in range(writes):
+        path = Path(directory) / f"new_{index}.fpl"
+        for chunk in range(chunks):
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(f"<!-- part {chunk} -->\n")
+            if chunk < chunks - 1:
+                await asyncio.sleep(chunk_pause)
+        written = time.perf_counter()
+        while True:
+            newest = await asyncio.wait_for(changes.__anext__(), watcher.poll_interval * 3)
+            reports += 1
+            if newest is not None and newest[0] == path:
+                break
+        latencies.append(time.perf_counter() - written)
+        await asyncio.sleep(0.02)
+    await changes.aclose()
+    return latencies, reports
+
+
+async def watcher_idle_cpu(watcher, seconds):
+    """CPU seconds used by the process while the watcher waits for changes."""
+    changes = watcher.changes()
+    await changes.__anext__()
+    start = time.process_time()
+    try:
+        await asyncio.wait_for(changes.__anext__(), seconds)
+    except asyncio.TimeoutError:
+        pass
+    used = time.process_time() - start
+    await changes.aclose()
+    return used
+
+
+def compare_plan_watcher(plans=1000, idle_seconds=3.0, poll_interval=0.5):
+    """The former 5 s glob/stat/sort poll of the flight plan directory
+    against FlightPlanWatcher (inotify and polling): pickup latency after
+    the last write and idle CPU, with plans files in the directory."""
+    efis_log.set_level('nav', 'WARNING')
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(plans):
+            path = Path(directory) / f"plan_{index:04d}.fpl"
+            path.write_text("<flight-plan/>\n", encoding='utf-8')
+            os.utime(path, (1_600_000_000 + index, 1_600_000_000 + index))
+
+        start = time.process_time()
+        for _ in range(20):
+            former_plan_poll(directory)
+        former = (time.process_time() - start) / 20
+        print(f"plan watcher: {plans} plans, former glob/stat/sort poll {former * 1e3:.1f} ms "
+              f"CPU per poll, {former / 5.0 * 60 * 1e3:.0f} ms CPU per minute at 5 s, "
+              f"pickup up to 5 s")
+
+        for use_inotify in (True, False):
+            watcher = FlightPlanWatcher(directory, poll_interval=poll_interval,
+                                        use_inotify=use_inotify)
+            latencies, reports = asyncio.run(plan_pickup(watcher, directory))
+            watcher.close()
+            backend = watcher.backend
+            watcher = FlightPlanWatcher(directory, poll_interval=poll_interval,
+                                        use_inotify=use_inotify)
+            cpu = asyncio.run(watcher_idle_cpu(watcher, idle_seconds))
+            watcher.close()
+            print(f"{backend:>12}: pickup after the last write {min(latencies) * 1e3:.1f}-"
+                  f"{max(latencies) * 1e3:.1f} ms (poll interval {poll_interval} s), "
+                  f"idle CPU {cpu / idle_seconds * 60 * 1e3:.1f} ms per minute, "
+                  f"{reports} changes for {len(latencies)} plans")
+    efis_log.set_level('nav', None)
+
+
+def compare_plan_cache(plans=5, waypoints=500, table_size=5000, switches=50):
+    """Switching between plans: parsing the XML every time against the
+    binary cache directory (after a restart) and the in-memory cache."""
+    efis_log.set_level('nav', 'WARNING')
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index in range(plans):
+            path = Path(directory) / f"plan_{index}.fpl"
+            synthetic_flight_plan(path, waypoints, start=(45.0 + index, -75.0),
+                                  table_size=table_size)
+            paths.append(path)
+        cache_dir = Path(directory) / 'cache'
+
+        start = time.perf_counter()
+        for path in paths:
+            FlightPlanCache(cache_dir).load(path)
+        parse_time = time.perf_counter() - start
+        restarted = FlightPlanCache(cache_dir, capacity=plans)
+        restarted.read_index()
+        start = time.perf_counter()
+        for path in paths:
+            restarted.load(path)
+        disk_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for index in range(switches):
+            restarted.load(paths[index % plans])
+        switch_time = time.perf_counter() - start
+        cache_size = sum(path.stat().st_size for path in cache_dir.iterdir()) / plans
+        print(f"plan cache: {plans} plans of {waypoints} waypoints, {table_size} in the "
+              f"waypoint table")
+        print(f"       parse XML: {parse_time / plans * 1e3:7.2f} ms per plan")
+        print(f" cache directory: {disk_time / plans * 1e3:7.2f} ms per plan")
+        print(f"       in memory: {switch_time / switches * 1e3:7.3f} ms per switch")
+        print(f"      file sizes: cache {cache_size:.0f} B, .fpl {paths[0].stat().st_size} B")
+    efis_log.set_level('nav', None)
+
+
+COMPARISONS = (
+    ('encoder', compare_encoder),
+    ('delta', compare_delta),
+    ('push', compare_push),
+    ('hub', compare_hub),
+    ('snapshot', compare_snapshot),
+    ('recorder', compare_recorder),
+    ('replay', compare_replay),
+    ('decode_log', compare_decode_log),
+    ('index', compare_index),
+    ('logging', compare_logging),
+    ('navigation', compare_navigation),
+    ('flightplan_parse', compare_flightplan_parse),
+    ('plan_watcher', compare_plan_watcher),
+    ('plan_cache', compare_plan_cache),
+)
+
+
+# =============================================================================
+# Baselines
+# =============================================================================
+
+def run(name_filter=None):
+    """Run the benchmarks (those whose group contains name_filter).
+    Returns {benchmark: ns per operation}."""
+    results = {}
+    for group, function in BENCHMARKS:
+        if name_filter and name_filter not in group:
+            continue
+        results.update(function())
+    return results
+
+
+def run_comparisons(name_filter=None):
+    """Print the comparisons whose name contains name_filter."""
+    for name, function in COMPARISONS:
+        if not name_filter or name_filter in name:
+            function()
+
+
+def environment():
+    """Describe the machine the results were taken on."""
+    return {'python': platform.python_version(),
+            'machine': platform.machine(),
+            'node': platform.node(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """Write results as the baseline (merged into an existing baseline)."""
+    baseline = load_baseline(path) or {}
+    baseline.update(results)
+    Path(path).write_text(json.dumps({'environment': environment(),
+                                      'results': dict(sorted(baseline.items()))},
+                                     indent=2) + '\n', encoding='utf-8')
+
+
+def load_baseline(path=BASELINE_FILE):
+    """Return the baseline results, or None if there is no baseline."""
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))['results']
+    except FileNotFoundError:
+        return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return [(name, baseline ns, ns, ratio)] of the benchmarks slower than
+    the baseline by more than threshold."""
+    return [(name, baseline[name], value, value / baseline[name])
+            for name, value in results.items()
+            if baseline.get(name) and value > baseline[name] * (1 + threshold)]
+
+
+def _format_ns(value):
+    if value >= 1e6:
+        return f"{value / 1e6:8.2f} ms"
+    if value >= 1e3:
+        return f"{value / 1e3:8.2f} us"
+    return f"{value:8.0f} ns"
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="EFIS server benchmarks")
+    parser.add_argument('--save', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown as a fraction (default %(default)s)")
+    parser.add_argument('--filter', help="only run benchmark groups containing this text")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    parser.add_argument('--vcan', metavar='CHANNEL',
+                        help="only run the virtual CAN benchmarks on this interface")
+    parser.add_argument('--compare', nargs='?', const='', metavar='FILTER',
+                        help="only print the comparisons with the former implementations")
+    arguments = parser.parse_args()
+
+    if arguments.compare is not None:
+        efis_log.set_level('all', 'ERROR')
+        run_comparisons(arguments.compare)
+        sys.exit(0)
+
+    if arguments.vcan:
+        if not Path(f"/sys/class/net/{arguments.vcan}").exists():
+            sys.exit(f"no CAN interface {arguments.vcan} - see vcan_benchmarks")
+        vcan_benchmarks(arguments.vcan)
+        sys.exit(0)
+
+    efis_log.set_level('all', 'ERROR')    # no backlight / flight plan messages
+    run_results = run(arguments.filter)
+    run_baseline = load_baseline(arguments.baseline)
+    for bench_name, bench_value in run_results.items():
+        line = f"{bench_name:<36} {_format_ns(bench_value)}"
+        if run_baseline and run_baseline.get(bench_name):
+            line += f"   {bench_value / run_baseline[bench_name] - 1:+7.1%} vs baseline"
+        print(line)
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps({'environment': environment(),
+                                                      'results': run_results},
+                                                     indent=2) + '\n', encoding='utf-8')
+
+    if arguments.save:
+        save_baseline(run_results, arguments.baseline)
+        print(f"baseline saved to {arguments.baseline}")
+    elif run_baseline is None:
+        print(f"no baseline at {arguments.baseline} - run with --save to create one")
+    else:
+        regressions = compare(run_results, run_baseline, arguments.threshold)
+        for bench_name, base, now, ratio in regressions:
+            print(f"REGRESSION {bench_name}: {_format_ns(base).strip()} -> "
+                  f"{_format_ns(now).strip()} ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"OK - no benchmark more than {arguments.threshold:.0%} slower than the baseline")
@@ -0,0 +1,137 @@
+"""Compact binary websocket frame for the high-rate EFIS fields.
+
+Clients that send ``ready binary`` instead of ``ready`` receive the
+attitude, air data, GPS position and navigation fields as one fixed-layout
+little-endian record per update. All remaining (rarely changing) fields are
+still sent as JSON text messages.
+
+Frame layout (little-endian):
+
+    uint8   version            BINARY_PROTOCOL_VERSION
+    uint8   reserved
+    uint16  sequence           wraps at 65536
+    uint32  presence bitmask   bit i set -> field i holds a value (not None)
+    ...     fields             BINARY_FIELDS in order, fixed size each
+
+Fields that carry decimals are sent as scaled integers (value × scale) so the
+decoded value is exactly the value the server holds (e.g. pitch 2.5 -> 25).
+A value outside the range of its field is saturated to the nearest limit;
+NaN and infinity are sent as absent (null).
+The JavaScript decoder is support/binaryFrame.mjs; the two field tables must
+be kept identical.
+"""
+
+import struct
+
+BINARY_PROTOCOL_VERSION = 1
+
+# (field name, struct code, scale) - order defines the bitmask bits
+BINARY_FIELDS = (
+    # Attitude
+    ('yaw', 'h', 10),
+    ('pitch', 'h', 10),
+    ('roll', 'h', 10),
+    ('turn_rate', 'h', 10),
+    ('accx', 'h', 1),
+    ('accy', 'h', 1),
+    ('accz', 'h', 1),
+    # Air data
+    ('airspeed', 'h', 1),
+    ('altitude', 'i', 1),
+    ('vsi', 'h', 1),
+    ('static_pressure', 'h', 1),
+    ('differential_pressure', 'h', 1),
+    ('temperature', 'h', 1),
+    ('oat', 'h', 10),
+    ('aoa', 'h', 1),
+    # GPS
+    ('latitude', 'i', 1),
+    ('longitude', 'i', 1),
+    ('gps_speed', 'h', 1),
+    ('gps_altitude', 'h', 1),
+    ('true_track', 'h', 1),
+    # Navigation
+    ('dtk', 'h', 10),
+    ('bearing', 'h', 10),
+    ('xtrack', 'i', 100),
+    ('dist', 'i', 10),
+    # Input
+    ('position', 'i', 1),
+    ('pressed', 'B', 1),
+)
+
+BINARY_FIELD_NAMES = frozenset(name for name, _, _ in BINARY_FIELDS)
+
+FRAME_STRUCT = struct.Struct('<BxHI' + ''.join(code for _, code, _ in BINARY_FIELDS))
+
+# (min, max) packable value for each struct code
+_CODE_RANGES = {
+    'h': (-0x8000, 0x7FFF),
+    'i': (-0x80000000, 0x7FFFFFFF),
+    'B': (0, 0xFF),
+}
+
+
+class BinaryFrameEncoder:
+    """Pack AvionicsData snapshots into binary frames."""
+
+    def __init__(self):
+        self.sequence = 0
+        # (name, scale, bit) with scale None for unscaled fields
+        self._plan = tuple((name, scale if scale != 1 else None, 1 << bit)
+                           for bit, (name, _, scale) in enumerate(BINARY_FIELDS))
+        self._ranges = tuple(_CODE_RANGES[code] for _, code, _ in BINARY_FIELDS)
+
+    def encode(self, snapshot):
+        """Return the binary frame for a snapshot dict."""
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        presence = 0
+        values = []
+        append = values.append
+        for name, scale, bit in self._plan:
+            value = snapshot.get(name)
+            if value is None:
+                append(0)
+                continue
+            try:
+                value = int(round(value * scale)) if scale is not None else int(value)
+            except (ValueError, OverflowError):
+                # NaN or infinity - send the field as absent
+                append(0)
+                continue
+            presence |= bit
+            append(value)
+        try:
+            return FRAME_STRUCT.pack(BINARY_PROTOCOL_VERSION, self.sequence, presence, *values)
+        except struct.error:
+            # A value is out of range for its field - saturate it
+            values = [min(max(value, low), high)
+                      for value, (low, high) in zip(values, self._ranges)]
+            return FRAME_STRUCT.pack(BINARY_PROTOCOL_VERSION, self.sequence, presence, *values)
+
+
+def decode_binary_frame(frame):
+    """Reference decoder (mirrors support/binaryFrame.mjs).
+
+    Returns:
+        tuple: (sequence, dict of field name -> value; absent fields are None)
+    """
+    version, sequence, presence, *values = FRAME_STRUCT.unpack(frame)
+    if version != BINARY_PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary frame version {version}")
+    fields = {}
+    for bit, ((name, code, scale), value) in enumerate(zip(BINARY_FIELDS, values)):
+        if not presence & (1 << bit):
+            fields[name] = None
+        elif code == 'B':
+            fields[name] = bool(value)
+        else:
+            fields[name] = value / scale if scale != 1 else value
+    return sequence, fields
+
+
+def split_snapshot(snapshot):
+    """Return the fields of a snapshot that are not in the binary record."""
+    return {key: value for key, value in snapshot.items()
+            if key not in BINARY_FIELD_NAMES}
+
@@ -0,0 +1,215 @@
+"""Bulk decoding of CAN flight recordings into columnar NumPy arrays.
+
+For post-flight analysis. A can_recorder.py log is memory-mapped as an array
+of records, frames are grouped by arbitration ID and each group is decoded
+in one step by viewing its payload bytes through a structured dtype built
+from the message's struct format in CAN_MESSAGE_SCHEMA (``<hlh`` for 0x28,
+``<hhhh`` for 0x48, ``<ll`` for 0x63, ...). Scale, offset and rounding are
+applied as the live decoders do, so a column holds exactly the values
+aio_server would have stored in AvionicsData.
+
+The result is, per message, one array per signal plus the frame timestamps:
+
+    {'AHRS_ORIENT': {'timestamp': array([...]), 'yaw': ..., 'pitch': ...}, ...}
+
+Frames shorter than the message layout are skipped, as the live decoders
+reject them. Extended-ID frames never match (the server only accepts
+standard IDs). The GPS1/TIME_SYNC hooks (navigation, time check) are not run.
+
+Needs numpy (the EFIS server only uses it for flight plan route tables).
+
+    python can_decode.py LOG_FILE_OR_DIR [--npz OUTPUT]
+
+The decode rate is printed by "python benchmark.py --compare decode_log".
+"""
+
+import functools
+from pathlib import Path
+
+import numpy as np #pylint: disable=import-error
+
+from can_recorder import (FILE_HEADER, LOG_MAGIC, LOG_SUFFIX, LOG_VERSION, RECORD,
+                          log_files, read_header)
+from can_schema import CAN_MESSAGE_SCHEMA
+
+# One log record (can_recorder.RECORD '<dIB3x8s')
+RECORD_DTYPE = np.dtype([('timestamp', '<f8'),
+                         ('can_id', '<u4'),
+                         ('dlc', 'u1'),
+                         ('_pad', 'V3'),
+                         ('data', 'V8')])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+# struct code -> NumPy type (byte order added from the format string)
+_STRUCT_TYPES = {
+    'b': 'i1', 'B': 'u1', '?': '?',
+    'h': 'i2', 'H': 'u2',
+    'i': 'i4', 'I': 'u4', 'l': 'i4', 'L': 'u4',
+    'q': 'i8', 'Q': 'u8',
+    'e': 'f2', 'f': 'f4', 'd': 'f8',
+}
+
+
+def payload_dtype(entry, itemsize=8):
+    """Build the structured dtype of a schema entry's payload.
+
+    Values whose field is None are left out. The dtype is itemsize bytes
+    long so it can view the 8 byte data column of the log directly.
+
+    Args:
+        entry: CanMessage schema entry (standard sizes, no native alignment)
+        itemsize: size of each payload in the array being viewed
+
+    Returns:
+        numpy.dtype
+    """
+    fmt = entry.codec.format
+    byte_order = '>' if fmt[0] in '>!' else '<'
+    names, formats, offsets = [], [], []
+    position = 0
+    fields = iter(entry.fields)
+    count = ''
+    for char in fmt.lstrip('@=<>!'):
+        if char.isdigit():
+            count += char
+            continue
+        repeat = int(count) if count else 1
+        count = ''
+        if char == 'x':
+            position += repeat
+            continue
+        if char in 'sp':
+            raise ValueError(f"{entry.name}: string fields are not supported")
+        code = np.dtype(byte_order + _STRUCT_TYPES[char])
+        for _ in range(repeat):
+            field = next(fields)
+            if field is not None:
+                names.append(field.attr)
+                formats.append(code)
+                offsets.append(position)
+            position += code.itemsize
+    if position > itemsize:
+        raise ValueError(f"{entry.name}: payload of {position} bytes exceeds {itemsize}")
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                     'itemsize': itemsize})
+
+
+@functools.lru_cache(maxsize=None)
+def _decode_table(field, dtype):
+    """Decoded value of every raw value of a small integer type, indexed by
+    the raw bits read as unsigned."""
+    info = np.iinfo(dtype)
+    raw = np.arange(info.min, info.max + 1).astype(dtype)
+    table = np.array([field.decode(value) for value in raw.tolist()])
+    order = raw.view(dtype.str.replace('i', 'u'))
+    result = np.empty_like(table)
+    result[order] = table
+    return result
+
+
+def _scale(field, raw):
+    """Apply a CanField's scale/offset/rounding to a column of raw values."""
+    if field.is_raw:
+        return raw
+    if field.digits is not None:
+        # numpy.round does not round exactly like Python's round(), so the
+        # field's own decode() is used once per distinct raw value: through a
+        # table of every possible value for 8/16 bit fields, else per value seen
+        if raw.dtype.kind in 'iu' and raw.dtype.itemsize <= 2:
+            return _decode_table(field, raw.dtype)[raw.view(raw.dtype.str.replace('i', 'u'))]
+        unique, inverse = np.unique(raw, return_inverse=True)
+        table = np.array([field.decode(value.item()) for value in unique])
+        return table[inverse.reshape(raw.shape)]
+    value = raw.astype(np.float64)
+    if field.scale is not None:
+        value = value / field.scale
+    if field.offset is not None:
+        value = value + field.offset
+    return value
+
+
+def map_log(path):
+    """Memory-map the records of a log file as a RECORD_DTYPE array.
+    A partially written last record is ignored."""
+    read_header(path)
+    count = (Path(path).stat().st_size - FILE_HEADER.size) // RECORD.size
+    if count <= 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                     offset=FILE_HEADER.size, shape=(count,))
+
+
+def decode_records(records, schema=CAN_MESSAGE_SCHEMA):
+    """Decode an array of log records into columns per message.
+
+    Args:
+        records: RECORD_DTYPE array (e.g. from map_log)
+        schema: iterable of CanMessage entries
+
+    Returns:
+        dict: message name -> {'timestamp': float64 array, attr: array, ...}
+            for every message with at least one frame
+    """
+    records = np.asarray(records)
+    # contiguous copies make the per-ID comparisons cheap
+    can_ids = np.ascontiguousarray(records['can_id'])
+    dlcs = np.ascontiguousarray(records['dlc'])
+    decoded = {}
+    for entry in schema:
+        selected = can_ids == entry.msg_id
+        if not selected.any():
+            continue
+        selected &= dlcs >= entry.size
+        group = records.take(np.flatnonzero(selected))
+        payloads = group['data'].view(payload_dtype(entry))
+        columns = {'timestamp': group['timestamp']}
+        for field in entry.fields:
+            if field is not None:
+                columns[field.attr] = _scale(field, payloads[field.attr])
+        decoded[entry.name] = columns
+    return decoded
+
+
+def decode_log(source, schema=CAN_MESSAGE_SCHEMA):
+    """Decode a log file, or every log in a directory (oldest first).
+
+    Returns:
+        dict: as decode_records, with the files' columns concatenated
+    """
+    source = Path(source)
+    paths = log_files(source) if source.is_dir() else [source]
+    parts = [decode_records(map_log(path), schema) for path in paths]
+    if len(parts) == 1:
+        return parts[0]
+    decoded = {}
+    for entry in schema:
+        pieces = [part[entry.name] for part in parts if entry.name in part]
+        if pieces:
+            decoded[entry.name] = {column: np.concatenate([piece[column] for piece in pieces])
+                                   for column in pieces[0]}
+    return decoded
+
+
+def save_npz(decoded, path):
+    """Save decoded columns to a .npz file with keys 'MESSAGE.column'."""
+    np.savez(path, **{f"{name}.{column}": values
+                      for name, columns in decoded.items()
+                      for column, values in columns.items()})
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Decode a CAN log into NumPy columns")
+    parser.add_argument('source', help="log file or directory of logs")
+    parser.add_argument('--npz', help="save the columns to this .npz file")
+    arguments = parser.parse_args()
+
+    log_decoded = decode_log(arguments.source)
+    for message_name, message_columns in log_decoded.items():
+        timestamps = message_columns['timestamp']
+        print(f"{message_name:>22}: {len(timestamps):8d} frames  "
+              f"{', '.join(column for column in message_columns if column != 'timestamp')}")
+    if arguments.npz:
+        save_npz(log_decoded, arguments.npz)
+        print(f"saved {arguments.npz}")
@@ -0,0 +1,477 @@
+"""Sidecar time index and range queries for CAN flight recordings.
+
+Each can_recorder.py log can have an index next to it (same name, suffix
+INDEX_SUFFIX) that splits the log into blocks of block_records records and
+stores, per block:
+
+    lowest and highest record timestamp
+    GPS UTC offset   UTC from the first valid TIME_SYNC frame minus that
+                     frame's record timestamp, carried to blocks without one
+
+plus the frame count per CAN ID for the whole file. The recorder writes the
+index as it records (CanRecorder index=True); for other logs, or when a log
+has grown since its index was written, the index is rebuilt on first use.
+
+A query only reads the blocks whose time span overlaps the requested range
+and streams the matching frames, so memory use does not grow with the size
+of the recording. Times are either record timestamps (relative to the start
+of the recording on the command line) or UTC from the GPS, which is right
+even when the Pi's clock was not set during the flight.
+
+    python can_index.py SOURCE --info
+    python can_index.py SOURCE --start 2025-10-09T12:00:30Z --duration 30 [--npy OUT]
+    python can_index.py SOURCE --start +600 --end +630 [--csv OUT]
+"""
+
+import collections
+import datetime
+import math
+import struct
+import sys
+from pathlib import Path
+
+from can_recorder import (CAN_EFF_FLAG, FILE_HEADER, INDEX_SUFFIX, RECORD, log_files,
+                          read_header)
+from can_schema import CAN_SCHEMA_BY_NAME
+
+INDEX_MAGIC = b'EFISIDX\x00'
+INDEX_VERSION = 1
+
+# magic, version, records per block, size of the indexed log, blocks, IDs
+INDEX_HEADER = struct.Struct('<8sHxxIQII')
+# lowest timestamp, highest timestamp, GPS UTC offset (NaN = unknown), records
+INDEX_BLOCK = struct.Struct('<dddI4x')
+# CAN ID (+ CAN_EFF_FLAG), frames
+INDEX_ID_COUNT = struct.Struct('<II')
+
+DEFAULT_BLOCK_RECORDS = 4096    # 96 kB of log per block
+
+_TIME_SYNC = CAN_SCHEMA_BY_NAME['TIME_SYNC']
+_LITTLE_ENDIAN = sys.byteorder == 'little'   # logs are little-endian
+
+
+def gps_utc(payload):
+    """Return the UTC epoch seconds of a TIME_SYNC payload, or None if the
+    payload is short or not a valid date/time."""
+    if len(payload) < _TIME_SYNC.size:
+        return None
+    fields = _TIME_SYNC.decode(payload)
+    try:
+        return datetime.datetime(fields['tm_year'], fields['tm_mon'], fields['tm_mday'],
+                                 fields['tm_hour'], fields['tm_min'], fields['tm_sec'],
+                                 tzinfo=datetime.timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def index_path(log_path):
+    """Path of the sidecar index of a log file."""
+    return Path(log_path).with_suffix(INDEX_SUFFIX)
+
+
+class LogIndex:
+    """Index of one log file.
+
+    Args:
+        block_records: records per block (the last block may hold fewer)
+        log_size: size in bytes of the log file when it was indexed
+        blocks: list of (lowest timestamp, highest timestamp, UTC offset,
+            records) per block
+        id_counts: dict of CAN ID (+ CAN_EFF_FLAG) -> frames
+    """
+
+    def __init__(self, block_records, log_size, blocks, id_counts):
+        self.block_records = block_records
+        self.log_size = log_size
+        self.blocks = blocks
+        self.id_counts = id_counts
+
+    @property
+    def records(self):
+        """Number of records in the indexed log."""
+        return sum(block[3] for block in self.blocks)
+
+    @property
+    def start(self):
+        """Lowest record timestamp, or None for an empty log."""
+        return min((block[0] for block in self.blocks), default=None)
+
+    @property
+    def end(self):
+        """Highest record timestamp, or None for an empty log."""
+        return max((block[1] for block in self.blocks), default=None)
+
+    @property
+    def has_utc(self):
+        """True if the log contains a valid GPS TIME_SYNC frame."""
+        return any(not math.isnan(block[2]) for block in self.blocks)
+
+    def utc_span(self):
+        """(first, last) GPS UTC time of the log, or None without GPS time."""
+        spans = [(block[0] + block[2], block[1] + block[2])
+                 for block in self.blocks if not math.isnan(block[2])]
+        if not spans:
+            return None
+        return min(span[0] for span in spans), max(span[1] for span in spans)
+
+    def overlapping(self, start, end, utc=False):
+        """Yield (block number, UTC offset) of the blocks that may hold
+        records in [start, end). With utc, blocks without a GPS UTC offset
+        are skipped."""
+        for number, (lowest, highest, offset, _) in enumerate(self.blocks):
+            if utc:
+                if math.isnan(offset):
+                    continue
+                lowest += offset
+                highest += offset
+            if highest >= start and lowest < end:
+                yield number, offset
+
+    def save(self, path):
+        """Write the index to a sidecar file."""
+        with open(path, 'wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.block_records,
+                                               self.log_size, len(self.blocks),
+                                               len(self.id_counts)))
+            for block in self.blocks:
+                index_file.write(INDEX_BLOCK.pack(*block))
+            for can_id, count in sorted(self.id_counts.items()):
+                index_file.write(INDEX_ID_COUNT.pack(can_id, count))
+
+    @classmethod
+    def load(cls, path):
+        """Read an index from a sidecar file."""
+        with open(path, 'rb') as index_file:
+            content = index_file.read()
+        magic, version, block_records, log_size, block_count, id_count = \
+            INDEX_HEADER.unpack_from(content)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a CAN log index")
+        offset = INDEX_HEADER.size
+        blocks = list(INDEX_BLOCK.iter_unpack(
+            content[offset:offset + block_count * INDEX_BLOCK.size]))
+        offset += block_count * INDEX_BLOCK.size
+        id_counts = dict(INDEX_ID_COUNT.iter_unpack(
+            content[offset:offset + id_count * INDEX_ID_COUNT.size]))
+        return cls(block_records, log_size, blocks, id_counts)
+
+
+class IndexBuilder:
+    """Build a LogIndex from records as they are written.
+
+    Args:
+        block_records: records per block
+    """
+
+    def __init__(self, block_records=DEFAULT_BLOCK_RECORDS):
+        self.block_records = block_records
+        self.blocks = []      # [lowest, highest, UTC offset, records]
+        self.id_counts = collections.Counter()
+        self._block = None
+
+    def add(self, timestamp, can_id, dlc, data):
+        """Add one record (the values of a RECORD)."""
+        block = self._block
+        if block is None or block[3] >= self.block_records:
+            block = self._block = [timestamp, timestamp, math.nan, 0]
+            self.blocks.append(block)
+        elif timestamp < block[0]:
+            block[0] = timestamp
+        elif timestamp > block[1]:
+            block[1] = timestamp
+        block[3] += 1
+        self.id_counts[can_id] += 1
+        if can_id == _TIME_SYNC.msg_id and math.isnan(block[2]):
+            utc = gps_utc(data[:dlc])
+            if utc is not None:
+                block[2] = utc - timestamp
+
+    def add_chunk(self, chunk):
+        """Add every record of a chunk of packed RECORDs.
+
+        The recorder's writer thread calls this for every chunk it writes,
+        so on little-endian machines the timestamps and IDs are read as
+        strided memoryview slices and summarized with C-level min/max/Counter
+        instead of unpacking each record in Python.
+        """
+        if not _LITTLE_ENDIAN:
+            add = self.add
+            for timestamp, can_id, dlc, data in RECORD.iter_unpack(chunk):
+                add(timestamp, can_id, dlc, data)
+            return
+        view = memoryview(chunk)
+        doubles = view.cast('d')    # 3 per record, timestamp first
+        words = view.cast('I')      # 6 per record, CAN ID third
+        count = len(chunk) // RECORD.size
+        position = 0
+        while position < count:
+            block = self._block
+            if block is None or block[3] >= self.block_records:
+                first = doubles[position * 3]
+                block = self._block = [first, first, math.nan, 0]
+                self.blocks.append(block)
+            take = min(count - position, self.block_records - block[3])
+            timestamps = doubles[position * 3:(position + take) * 3:3]
+            can_ids = words[position * 6 + 2:(position + take) * 6:6]
+            block[0] = min(block[0], min(timestamps))
+            block[1] = max(block[1], max(timestamps))
+            block[3] += take
+            self.id_counts.update(can_ids)
+            if math.isnan(block[2]):
+                self._find_time_sync(block, chunk, position, can_ids.tolist())
+            position += take
+
+    @staticmethod
+    def _find_time_sync(block, chunk, position, can_ids):
+        """Set the block's UTC offset from the first valid TIME_SYNC record."""
+        start = 0
+        while _TIME_SYNC.msg_id in can_ids[start:]:
+            index = can_ids.index(_TIME_SYNC.msg_id, start)
+            timestamp, _, dlc, data = RECORD.unpack_from(chunk,
+                                                         (position + index) * RECORD.size)
+            utc = gps_utc(data[:dlc])
+            if utc is not None:
+                block[2] = utc - timestamp
+                return
+            start = index + 1
+
+    def finish(self, log_size):
+        """Return the LogIndex. Blocks without a TIME_SYNC frame take the UTC
+        offset of the block before them (or, at the start, after them)."""
+        blocks = [list(block) for block in self.blocks]
+        offset = math.nan
+        for block in blocks:
+            if math.isnan(block[2]):
+                block[2] = offset
+            else:
+                offset = block[2]
+        offset = math.nan
+        for block in reversed(blocks):
+            if math.isnan(block[2]):
+                block[2] = offset
+            else:
+                offset = block[2]
+        return LogIndex(self.block_records, log_size, [tuple(block) for block in blocks],
+                        dict(self.id_counts))
+
+
+def build_index(log_path, block_records=DEFAULT_BLOCK_RECORDS):
+    """Index a log file by reading it once. A partially written last record
+    is ignored."""
+    read_header(log_path)
+    builder = IndexBuilder(block_records)
+    chunk_size = RECORD.size * block_records
+    with open(log_path, 'rb') as log:
+        log.seek(FILE_HEADER.size)
+        while True:
+            chunk = log.read(chunk_size)
+            usable = len(chunk) - len(chunk) % RECORD.size
+            if usable:
+                builder.add_chunk(chunk[:usable])
+            if usable != chunk_size:
+                break
+    return builder.finish(Path(log_path).stat().st_size)
+
+
+def load_index(log_path, save=True):
+    """Return the index of a log file, rebuilding it if it is missing or the
+    log has changed since it was written.
+
+    Args:
+        log_path: log file
+        save: write a rebuilt index next to the log (errors are ignored)
+    """
+    sidecar = index_path(log_path)
+    size = Path(log_path).stat().st_size
+    try:
+        index = LogIndex.load(sidecar)
+        if index.log_size == size:
+            return index
+    except (OSError, ValueError, struct.error):
+        pass
+    index = build_index(log_path)
+    if save:
+        try:
+            index.save(sidecar)
+        except OSError:
+            pass
+    return index
+
+
+def _log_paths(source):
+    source = Path(source)
+    return log_files(source) if source.is_dir() else [source]
+
+
+def recording_start(source):
+    """Lowest record timestamp of a log file or directory, or None."""
+    starts = [load_index(path).start for path in _log_paths(source)]
+    starts = [start for start in starts if start is not None]
+    return min(starts) if starts else None
+
+
+def query(source, start=-math.inf, end=math.inf, utc=False):
+    """Yield the frames of a log file or directory in a time range.
+
+    Only the index blocks overlapping the range are read, one at a time.
+    Frames are yielded in log order.
+
+    Args:
+        source: log file or directory of logs
+        start: range start (inclusive), epoch seconds
+        end: range end (exclusive), epoch seconds
+        utc: start/end are GPS UTC times rather than record timestamps
+
+    Yields:
+        (timestamp, UTC time or None, arbitration ID, is extended, dlc, data)
+    """
+    for path in _log_paths(source):
+        index = load_index(path)
+        block_bytes = index.block_records * RECORD.size
+        with open(path, 'rb') as log:
+            for number, offset in index.overlapping(start, end, utc):
+                log.seek(FILE_HEADER.size + number * block_bytes)
+                block = log.read(index.blocks[number][3] * RECORD.size)
+                block = block[:len(block) - len(block) % RECORD.size]
+                has_offset = not math.isnan(offset)
+                for timestamp, can_id, dlc, data in RECORD.iter_unpack(block):
+                    utc_time = timestamp + offset if has_offset else None
+                    key = utc_time if utc else timestamp
+                    if start <= key < end:
+                        yield (timestamp, utc_time, can_id & ~CAN_EFF_FLAG,
+                               bool(can_id & CAN_EFF_FLAG), dlc, data[:dlc])
+
+
+# =============================================================================
+# Output
+# =============================================================================
+
+def _iso(epoch):
+    if epoch is None:
+        return ''
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat(
+        timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def write_csv(frames, output):
+    """Write frames from query() as CSV to a text stream. Returns the count."""
+    count = 0
+    output.write("timestamp,utc,id,extended,dlc,data\n")
+    for timestamp, utc_time, can_id, is_extended, dlc, data in frames:
+        output.write(f"{timestamp:.6f},{_iso(utc_time)},0x{can_id:X},"
+                     f"{int(is_extended)},{dlc},{data.hex()}\n")
+        count += 1
+    return count
+
+
+def write_npy(frame_source, path):
+    """Write the frames of a query as a .npy array of log records (the
+    can_decode.RECORD_DTYPE layout, so decode_records() accepts it).
+
+    Args:
+        frame_source: function returning a new query() iterator - called
+            twice, once to count the frames and once to write them
+        path: output file
+
+    Returns:
+        int: frames written
+    """
+    import numpy as np #pylint: disable=import-error
+    from can_decode import RECORD_DTYPE
+
+    count = sum(1 for _ in frame_source())
+    with open(path, 'wb') as output:
+        np.lib.format.write_array_header_1_0(output, {
+            'descr': np.lib.format.dtype_to_descr(RECORD_DTYPE),
+            'fortran_order': False,
+            'shape': (count,)})
+        written = 0
+        for timestamp, _, can_id, is_extended, dlc, data in frame_source():
+            if written == count:
+                break
+            output.write(RECORD.pack(timestamp, can_id | (CAN_EFF_FLAG if is_extended else 0),
+                                     dlc, data))
+            written += 1
+    return written
+
+
+def parse_time(text):
+    """Parse a command line time.
+
+    '+90' or '90' is 90 seconds after the start of the recording; anything
+    else is an ISO 8601 date/time, UTC unless it carries an offset.
+
+    Returns:
+        (seconds, is_utc): relative seconds, or UTC epoch seconds
+    """
+    try:
+        return float(text), False
+    except ValueError:
+        pass
+    moment = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp(), True
+
+
+def _print_info(source):
+    for path in _log_paths(source):
+        index = load_index(path)
+        print(f"{path.name}: {index.records} records in {len(index.blocks)} blocks")
+        if index.start is not None:
+            print(f"  record time {_iso(index.start)} .. {_iso(index.end)} "
+                  f"({index.end - index.start:.1f} s)")
+        span = index.utc_span()
+        print(f"  GPS UTC     {_iso(span[0])} .. {_iso(span[1])}" if span
+              else "  GPS UTC     no TIME_SYNC frames")
+        print("  frames by ID: " + ", ".join(
+            f"0x{can_id & ~CAN_EFF_FLAG:02X}{'x' if can_id & CAN_EFF_FLAG else ''}={count}"
+            for can_id, count in sorted(index.id_counts.items())))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index and query CAN recordings")
+    parser.add_argument('source', nargs='?', help="log file or directory of logs")
+    parser.add_argument('--info', action='store_true', help="show the index summary")
+    parser.add_argument('--start', help="range start: seconds after the start of the "
+                                        "recording (+600) or UTC time (2025-10-09T12:00:30Z)")
+    parser.add_argument('--end', help="range end, as --start")
+    parser.add_argument('--duration', type=float, help="range length in seconds")
+    parser.add_argument('--csv', help="write CSV to this file (default: stdout)")
+    parser.add_argument('--npy', help="write the frames as a .npy array of log records")
+    arguments = parser.parse_args()
+
+    if arguments.source is None:
+        parser.error("a log file or directory is required")
+    if arguments.info:
+        _print_info(arguments.source)
+        sys.exit(0)
+
+    range_start, start_utc = (parse_time(arguments.start) if arguments.start
+                              else (0.0, False))
+    if arguments.end:
+        range_end, end_utc = parse_time(arguments.end)
+    elif arguments.duration is not None:
+        range_end, end_utc = range_start + arguments.duration, start_utc
+    else:
+        range_end, end_utc = math.inf, start_utc
+    if start_utc != end_utc:
+        parser.error("--start and --end must both be UTC or both relative")
+    if not start_utc:
+        origin_time = recording_start(arguments.source) or 0.0
+        range_start += origin_time
+        range_end += origin_time
+
+    def run_query():
+        return query(arguments.source, range_start, range_end, utc=start_utc)
+
+    if arguments.npy:
+        frames_written = write_npy(run_query, arguments.npy)
+    elif arguments.csv:
+        with open(arguments.csv, 'w', encoding='utf-8') as csv_file:
+            frames_written = write_csv(run_query(), csv_file)
+    else:
+        frames_written = write_csv(run_query(), sys.stdout)
+    print(f"{frames_written} frames", file=sys.stderr)
@@ -0,0 +1,317 @@
+"""Binary CAN flight data recorder.
+
+Every frame taken off the bus is appended to a compact binary log:
+
+    file header  FILE_HEADER  magic, version, record size, creation time
+    records      RECORD       kernel timestamp (float64 seconds since the
+                              epoch), CAN ID (u32, CAN_EFF_FLAG set for
+                              extended IDs), DLC (u8), 3 pad bytes, data (8)
+
+Frames are packed into a preallocated chunk on the event loop (one
+``pack_into`` per frame). Full chunks, and partial chunks once a second, are
+handed to a writer thread that performs the file writes, rotates files at
+max_file_bytes, deletes the oldest files beyond max_total_bytes and calls
+fsync only every fsync_interval seconds to spare the SD card. If the writer
+falls behind (e.g. a slow card), whole chunks are dropped and counted rather
+than ever blocking the event loop.
+"""
+
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from pathlib import Path
+
+import efis_log
+
+log = efis_log.get_logger('recorder')
+
+LOG_MAGIC = b'EFISCAN\x00'
+LOG_VERSION = 1
+LOG_SUFFIX = '.efiscan'
+INDEX_SUFFIX = '.efisidx'   # sidecar time index (can_index.py)
+
+# magic, version, record size, creation time (epoch seconds), reserved
+FILE_HEADER = struct.Struct('<8sHHd12x')
+# timestamp, CAN ID (+ CAN_EFF_FLAG), DLC, pad, data
+RECORD = struct.Struct('<dIB3x8s')
+CAN_EFF_FLAG = 0x80000000
+
+# Defaults (overridden by aio_server configuration)
+DEFAULT_MAX_FILE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_TOTAL_BYTES = 1024 * 1024 * 1024
+DEFAULT_FSYNC_INTERVAL = 30.0        # seconds
+DEFAULT_CHUNK_RECORDS = 1024         # records per chunk handed to the writer
+DEFAULT_FLUSH_INTERVAL = 1.0         # seconds before a partial chunk is handed over
+DEFAULT_MAX_PENDING_CHUNKS = 64      # chunks queued for the writer before dropping
+
+
+class CanRecorder:
+    """Record CAN frames to rotating binary log files.
+
+    Args:
+        directory: directory that holds the log files
+        max_file_bytes: size at which a new file is started
+        max_total_bytes: oldest files are deleted to stay under this total
+        fsync_interval: seconds between fsync calls
+        chunk_records: records buffered before a chunk is handed to the writer
+        flush_interval: seconds before a partially filled chunk is handed over
+        max_pending_chunks: chunks waiting for the writer before new chunks
+            are dropped
+        index: write a sidecar time index for each file (can_index.py),
+            built by the writer thread as the records are written
+    """
+
+    def __init__(self, directory, max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+                 max_total_bytes=DEFAULT_MAX_TOTAL_BYTES,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 chunk_records=DEFAULT_CHUNK_RECORDS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_pending_chunks=DEFAULT_MAX_PENDING_CHUNKS,
+                 index=True):
+        self.directory = Path(directory)
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.fsync_interval = fsync_interval
+        self.flush_interval = flush_interval
+        self._chunk_size = chunk_records * RECORD.size
+        self._max_pending = max_pending_chunks
+        self._chunk = bytearray(self._chunk_size)
+        self._offset = 0
+        self._chunks = queue.SimpleQueue()
+        self._pending = 0           # chunks handed over and not yet written
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._flush_handle = None
+        self._file = None
+        self._file_bytes = 0
+        self._index_builder_class = None
+        if index:
+            from can_index import IndexBuilder  # can_index imports this module
+            self._index_builder_class = IndexBuilder
+        self._index_builder = None
+        self.current_path = None
+        self._error_limiter = efis_log.RateLimiter()
+        # Statistics
+        self.frames_recorded = 0    # frames packed into chunks
+        self.frames_written = 0     # frames written to disk
+        self.frames_dropped = 0     # frames lost to a full queue or a failed write (_pending_lock)
+        self.files_opened = 0
+        self.files_deleted = 0
+        self.fsyncs = 0
+        self.write_errors = 0
+
+    # --- event loop side ----------------------------------------------------
+
+    def start(self, loop=None):
+        """Start the writer thread and the partial chunk flush timer."""
+        if self._thread is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='can-recorder',
+                                        daemon=True)
+        self._thread.start()
+        if loop is not None:
+            self._loop = loop
+            self._flush_handle = loop.call_later(self.flush_interval, self._on_flush_timer)
+
+    def record(self, msg):
+        """Append one frame (can.Message or CanFrame)."""
+        can_id = msg.arbitration_id
+        if msg.is_extended_id:
+            can_id |= CAN_EFF_FLAG
+        RECORD.pack_into(self._chunk, self._offset, msg.timestamp, can_id,
+                         msg.dlc, msg.data)
+        self._offset += RECORD.size
+        self.frames_recorded += 1
+        if self._offset >= self._chunk_size:
+            self.flush()
+
+    def record_batch(self, batch):
+        """Append a list of frames."""
+        record = self.record
+        for msg in batch:
+            record(msg)
+
+    def flush(self):
+        """Hand the current chunk to the writer thread (never blocks)."""
+        if not self._offset:
+            return
+        records = self._offset // RECORD.size
+        with self._pending_lock:
+            overloaded = self._pending >= self._max_pending
+            if overloaded:
+                self.frames_dropped += records
+            else:
+                self._pending += 1
+        if not overloaded:
+            self._chunks.put(bytes(memoryview(self._chunk)[:self._offset]))
+        self._offset = 0
+
+    def _on_flush_timer(self):
+        self.flush()
+        self._flush_handle = self._loop.call_later(self.flush_interval, self._on_flush_timer)
+
+    def stop(self, timeout=5.0):
+        """Write out everything buffered, fsync and stop the writer thread."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self.flush()
+        if self._thread is not None:
+            self._chunks.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        """Return the recorder statistics as a dict."""
+        return {
+            'frames_recorded': self.frames_recorded,
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'pending_chunks': self._pending,
+            'files_opened': self.files_opened,
+            'files_deleted': self.files_deleted,
+            'fsyncs': self.fsyncs,
+            'write_errors': self.write_errors,
+            'current_file': str(self.current_path) if self.current_path else None,
+        }
+
+    # --- writer thread ------------------------------------------------------
+
+    def _open_file(self):
+        now = time.time()
+        name = time.strftime('can-%Y%m%d-%H%M%S', time.gmtime(now))
+        path = self.directory / f"{name}{LOG_SUFFIX}"
+        suffix = 1
+        while path.exists():
+            path = self.directory / f"{name}-{suffix}{LOG_SUFFIX}"
+            suffix += 1
+        self._file = open(path, 'wb', buffering=0) #pylint: disable=consider-using-with
+        self._file.write(FILE_HEADER.pack(LOG_MAGIC, LOG_VERSION, RECORD.size, now))
+        self._file_bytes = FILE_HEADER.size
+        if self._index_builder_class is not None:
+            self._index_builder = self._index_builder_class()
+        self.current_path = path
+        self.files_opened += 1
+        self._enforce_total_size()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+            if self._index_builder is not None:
+                self._index_builder.finish(self._file_bytes).save(
+                    self.current_path.with_suffix(INDEX_SUFFIX))
+                self._index_builder = None
+
+    def _sync(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+
+    def _enforce_total_size(self):
+        files = sorted(self.directory.glob(f"*{LOG_SUFFIX}"),
+                       key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in files)
+        for path in files:
+            if total <= self.max_total_bytes or path == self.current_path:
+                break
+            size = path.stat().st_size
+            path.unlink()
+            path.with_suffix(INDEX_SUFFIX).unlink(missing_ok=True)
+            total -= size
+            self.files_deleted += 1
+            log.info("CAN recorder deleted %s", path.name)
+
+    def _run(self):
+        next_sync = time.monotonic() + self.fsync_interval
+        try:
+            while True:
+                try:
+                    chunk = self._chunks.get(timeout=self.fsync_interval)
+                except queue.Empty:
+                    chunk = b''
+                if chunk is None:
+                    break
+                if chunk:
+                    self._write(chunk)
+                    with self._pending_lock:
+                        self._pending -= 1
+                if time.monotonic() >= next_sync:
+                    try:
+                        self._sync()
+                    except OSError:
+                        self.write_errors += 1
+                    next_sync = time.monotonic() + self.fsync_interval
+        finally:
+            try:
+                self._close_file()
+            except OSError:
+                self.write_errors += 1
+
+    def _write(self, chunk):
+        try:
+            if self._file is None or self._file_bytes + len(chunk) > self.max_file_bytes:
+                self._close_file()
+                self._open_file()
+            self._file.write(chunk)
+            self._file_bytes += len(chunk)
+            if self._index_builder is not None:
+                self._index_builder.add_chunk(chunk)
+            self.frames_written += len(chunk) // RECORD.size
+        except OSError as e:
+            self.write_errors += 1
+            with self._pending_lock:    # frames_dropped is also counted by flush()
+                self.frames_dropped += len(chunk) // RECORD.size
+            self._error_limiter.log(log, logging.ERROR, 'write', "CAN recorder write failed: %s", e)
+
+
+# =============================================================================
+# Reading logs
+# =============================================================================
+
+def read_header(path):
+    """Return (version, record size, creation time) of a log file."""
+    with open(path, 'rb') as log:
+        magic, version, record_size, created = FILE_HEADER.unpack(log.read(FILE_HEADER.size))
+    if magic != LOG_MAGIC:
+        raise ValueError(f"{path} is not a CAN log")
+    if version != LOG_VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path}: unsupported log version {version}")
+    return version, record_size, created
+
+
+def iter_records(path):
+    """Yield (timestamp, arbitration ID, is extended, dlc, data) for every
+    record in a log file. A partially written last record is ignored."""
+    read_header(path)
+    with open(path, 'rb') as log:
+        log.seek(FILE_HEADER.size)
+        while True:
+            block = log.read(RECORD.size * 4096)
+            if not block:
+                return
+            usable = len(block) - len(block) % RECORD.size
+            for timestamp, can_id, dlc, data in RECORD.iter_unpack(block[:usable]):
+                is_extended = bool(can_id & CAN_EFF_FLAG)
+                yield (timestamp, can_id & ~CAN_EFF_FLAG, is_extended, dlc, data[:dlc])
+            if usable != len(block):
+                return
+
+
+def log_files(directory):
+    """Return the log files in a directory, oldest first (by the creation
+    time in their headers). Files that are not CAN logs are skipped."""
+    files = []
+    for path in Path(directory).glob(f"*{LOG_SUFFIX}"):
+        try:
+            files.append((read_header(path)[2], path.name, path))
+        except (OSError, ValueError, struct.error):
+            continue
+    return [path for _, _, path in sorted(files)]
+
@@ -0,0 +1,389 @@
+"""Replay recorded CAN logs through the server's decode pipeline.
+
+Frames from can_recorder.py logs are fed through the same
+CAN_MESSAGE_HANDLERS, AvionicsData, flight plan navigation and
+MessageTimeoutMonitor that aio_server runs on the live bus. Time comes from
+the log: a ReplayClock stands in for the event loop clock (timeouts) and for
+the monotonic clock of MyWebSocketResponse (QNH send period), so a replay
+produces the same data, timeouts and auto-sequencing on every run, whatever
+the replay speed or host load.
+
+Replay speed is real time (1.0), N times real time (N) or as fast as possible
+(None). Instead of being decoded in-process the frames can also be sent to a
+CAN interface (e.g. vcan0) with their recorded timing, for a complete server
+to receive as if the bus were live.
+
+    python can_replay.py LOG_FILE_OR_DIR [--speed N|max] [--flightplan FILE]
+    python can_replay.py LOG_FILE_OR_DIR --vcan vcan0 [--speed N]
+
+A synthetic flight is replayed by "python benchmark.py --compare replay"
+and tests/test_can_replay.py.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import can #pylint: disable=import-error
+
+import aio_server
+from avionics_data import AvionicsData
+from can_reader import CanFrame
+from can_recorder import iter_records, log_files
+from flightplan import FlightPlan
+
+DEFAULT_CHECKPOINT_INTERVAL = 1.0   # log seconds between state digests
+MAX_SPEED_YIELD_FRAMES = 4096       # frames between yields at max speed
+
+
+class _ReplayTimer:
+    """Stand-in for asyncio.TimerHandle."""
+    __slots__ = ('callback', 'args', '_cancelled')
+
+    def __init__(self, callback, args):
+        self.callback = callback
+        self.args = args
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def cancelled(self):
+        return self._cancelled
+
+
+class ReplayClock:
+    """Virtual clock with timers, driven by the log timestamps.
+
+    Provides the time()/call_at()/call_later() subset of the event loop used
+    by MessageTimeoutMonitor. Timers run from advance_to(), in deadline order
+    and with the clock set to their deadline.
+
+    Args:
+        start: initial time in seconds
+    """
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._timers = []
+        self._sequence = 0
+        self.timers_run = 0
+
+    def time(self):
+        """Current replay time in seconds."""
+        return self._now
+
+    def call_at(self, when, callback, *args):
+        timer = _ReplayTimer(callback, args)
+        self._sequence += 1
+        heapq.heappush(self._timers, (when, self._sequence, timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self._now + delay, callback, *args)
+
+    def advance_to(self, when):
+        """Move the clock forward to when, running every timer that falls due.
+        The clock never moves backwards."""
+        timers = self._timers
+        while timers and timers[0][0] <= when:
+            due, _, timer = heapq.heappop(timers)
+            if due > self._now:
+                self._now = due
+            if not timer.cancelled():
+                self.timers_run += 1
+                timer.callback(*timer.args)
+        if when > self._now:
+            self._now = when
+
+
+class _Pacer:
+    """Wait until the wall clock reaches a log timestamp at the replay speed.
+
+    Args:
+        speed: 1.0 for real time, N for N times real time, None for no waiting
+    """
+
+    def __init__(self, speed):
+        if speed is not None and speed <= 0:
+            raise ValueError(f"replay speed must be positive, not {speed}")
+        self.speed = speed
+        self._log_start = None
+        self._wall_start = None
+
+    async def wait(self, timestamp):
+        """Sleep until timestamp is due. Returns False if no wait was needed."""
+        if self.speed is None:
+            return False
+        loop = asyncio.get_running_loop()
+        if self._log_start is None:
+            self._log_start = timestamp
+            self._wall_start = loop.time()
+            return False
+        delay = (self._wall_start + (timestamp - self._log_start) / self.speed
+                 - loop.time())
+        if delay <= 0:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+
+class _TransmitLog:
+    """CAN bus stand-in that keeps the frames the server transmits (QNH)."""
+
+    channel_info = 'replay'
+
+    def __init__(self, clock):
+        self._clock = clock
+        self.frames = []   # (replay time, arbitration ID, data)
+
+    def send(self, msg):
+        self.frames.append((self._clock.time(), msg.arbitration_id, bytes(msg.data)))
+
+
+def load_frames(source):
+    """Yield the frames of a log file, or of every log in a directory
+    (oldest first), as CanFrame objects."""
+    source = Path(source)
+    paths = log_files(source) if source.is_dir() else [source]
+    for path in paths:
+        for timestamp, arbitration_id, is_extended, dlc, data in iter_records(path):
+            yield CanFrame(timestamp, arbitration_id, is_extended, False, False, dlc, data)
+
+
+class CanReplay:
+    """Feed CAN frames through the server's decode pipeline on a ReplayClock.
+
+    Every frame is dispatched through aio_server.dispatch_can_message (the
+    generated decoders and their GPS1/TIME_SYNC hooks) into a fresh
+    AvionicsData, and successfully decoded frames are reported to a
+    MessageTimeoutMonitor running on the replay clock. Navigation runs every
+    1 / NAV_UPDATE_RATE seconds of log time, as the server's navigation
+    task does. Frames are processed
+    one at a time in log order, i.e. without the coalescing of batched
+    drains, so the result does not depend on how frames were batched live.
+
+    A digest of the AvionicsData snapshot is taken every checkpoint_interval
+    seconds of log time and at the end of the log; two replays of the same
+    log match exactly when ``digest()`` does.
+
+    Args:
+        frames: iterable of CAN frames (see load_frames) in timestamp order
+        speed: 1.0 for real time, N for N times real time, None for as fast
+            as possible
+        flight_plan: FlightPlan or path of a .fpl file to navigate, or None
+        client_messages: optional iterable of (log timestamp, text) websocket
+            messages, e.g. 'json{"qnh": 2992}', handled by
+            MyWebSocketResponse.process_json_data at that point of the log.
+            Frames the server transmits in response (QNH) are kept in
+            ``transmitted``.
+        checkpoint_interval: log seconds between state digests
+    """
+
+    def __init__(self, frames, speed=None, flight_plan=None, client_messages=None,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self._frames = frames
+        self._pacer = _Pacer(speed)
+        self.clock = ReplayClock()
+        self.data = AvionicsData()
+        self.last_received_times = {}
+        self.can_stats = aio_server.CanStatistics()
+        self.timeout_monitor = aio_server.create_timeout_monitor(
+            self.data, self.last_received_times, loop=self.clock)
+
+        if isinstance(flight_plan, (str, Path)):
+            path = flight_plan
+            flight_plan = FlightPlan()
+            if not flight_plan.load(path):
+                raise ValueError(f"could not load flight plan {path}")
+        if flight_plan is not None:
+            aio_server.set_flight_plan(self.data, flight_plan)
+
+        self._client_messages = sorted(client_messages or (), key=lambda m: m[0])
+        self._bus = _TransmitLog(self.clock)
+        self.web_socket_response = None
+        if self._client_messages:
+            self.web_socket_response = aio_server.MyWebSocketResponse(clock=self.clock.time)
+            self.web_socket_response.data = self.data
+            self.web_socket_response.can_bus = self._bus
+
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = []   # (log time, data version, snapshot digest)
+        self._digest = hashlib.sha256()
+        self.frames_failed = 0  # frames without a handler or that failed to decode
+        self.paced_waits = 0
+        self.log_start = None
+        self.log_end = None
+        self.wall_seconds = 0.0
+
+    @property
+    def transmitted(self):
+        """Frames sent by the server during the replay: (time, ID, data)."""
+        return self._bus.frames
+
+    def _checkpoint(self, when):
+        text = self.data.snapshot_json()
+        self._digest.update(text.encode())
+        self.checkpoints.append((when, self.data.version,
+                                 hashlib.sha256(text.encode()).hexdigest()[:16]))
+
+    def _client_message(self, text):
+        self.web_socket_response.process_json_data(SimpleNamespace(data=text))
+
+    async def run(self):
+        """Replay every frame. Returns the statistics (see stats())."""
+        clock = self.clock
+        data = self.data
+        last_received_times = self.last_received_times
+        received = self.timeout_monitor.received
+        dispatch = aio_server.dispatch_can_message
+        frames_by_id = self.can_stats.frames_by_id
+        pacer = self._pacer
+        yield_every = MAX_SPEED_YIELD_FRAMES if pacer.speed is None else 0
+        messages = self._client_messages
+        next_message = 0
+        next_checkpoint = None
+        next_navigation = None
+        navigation_interval = 1.0 / aio_server.NAV_UPDATE_RATE
+        processed = failed = count = 0
+
+        wall_start = time.perf_counter()
+        for msg in self._frames:
+            timestamp = msg.timestamp
+            if next_checkpoint is None:
+                self.log_start = timestamp
+                clock.advance_to(timestamp)
+                next_checkpoint = timestamp + self.checkpoint_interval
+                next_navigation = timestamp + navigation_interval
+            if await pacer.wait(timestamp):
+                self.paced_waits += 1
+            elif yield_every and count % yield_every == yield_every - 1:
+                await asyncio.sleep(0)
+
+            while next_message < len(messages) and messages[next_message][0] <= timestamp:
+                clock.advance_to(messages[next_message][0])
+                self._client_message(messages[next_message][1])
+                next_message += 1
+            while next_navigation <= timestamp:
+                clock.advance_to(next_navigation)
+                aio_server.navigation_step(data)
+                next_navigation += navigation_interval
+            while next_checkpoint <= timestamp:
+                clock.advance_to(next_checkpoint)
+                self._checkpoint(next_checkpoint)
+                next_checkpoint += self.checkpoint_interval
+            clock.advance_to(timestamp)
+
+            count += 1
+            msg_id = msg.arbitration_id
+            frames_by_id[msg_id] = frames_by_id.get(msg_id, 0) + 1
+            if dispatch(msg, data, last_received_times):
+                received(msg_id)
+                processed += 1
+            else:
+                failed += 1
+        self.wall_seconds = time.perf_counter() - wall_start
+
+        if self.log_start is not None:
+            self.log_end = clock.time()
+            self._checkpoint(self.log_end)
+        self.timeout_monitor.stop()
+        self.can_stats.frames_received = count
+        self.can_stats.frames_processed = processed
+        self.frames_failed = failed
+        return self.stats()
+
+    def digest(self):
+        """SHA-256 over every checkpoint snapshot of the replay."""
+        return self._digest.hexdigest()
+
+    def stats(self):
+        """Return the replay statistics as a dict."""
+        log_seconds = ((self.log_end - self.log_start)
+                       if self.log_start is not None else 0.0)
+        frames = self.can_stats.frames_received
+        return {
+            'frames': frames,
+            'frames_processed': self.can_stats.frames_processed,
+            'frames_failed': self.frames_failed,
+            'log_seconds': round(log_seconds, 3),
+            'wall_seconds': round(self.wall_seconds, 3),
+            'frames_per_second': (round(frames / self.wall_seconds)
+                                  if self.wall_seconds else None),
+            'speed': (round(log_seconds / self.wall_seconds, 1)
+                      if self.wall_seconds else None),
+            'timer_callbacks': self.clock.timers_run,
+            'expirations': {name: group.expirations
+                            for name, group in self.timeout_monitor.groups.items()
+                            if group.expirations},
+            'transmitted': len(self.transmitted),
+            'checkpoints': len(self.checkpoints),
+            'digest': self.digest(),
+        }
+
+
+async def send_to_bus(frames, channel, speed=1.0):
+    """Send frames to a CAN interface with their recorded timing.
+
+    Args:
+        frames: iterable of CAN frames in timestamp order
+        channel: SocketCAN interface, e.g. 'vcan0'
+        speed: 1.0 for real time, N for N times real time, None for as fast
+            as the interface accepts them
+
+    Returns:
+        int: frames sent
+    """
+    pacer = _Pacer(speed)
+    sent = 0
+    with can.Bus(interface='socketcan', channel=channel) as bus:
+        for msg in frames:
+            await pacer.wait(msg.timestamp)
+            message = can.Message(timestamp=msg.timestamp,
+                                  arbitration_id=msg.arbitration_id,
+                                  is_extended_id=msg.is_extended_id,
+                                  data=msg.data)
+            while True:
+                try:
+                    bus.send(message)
+                    break
+                except can.CanOperationError:
+                    await asyncio.sleep(0.001)  # tx queue full
+            sent += 1
+            if speed is None and sent % MAX_SPEED_YIELD_FRAMES == 0:
+                await asyncio.sleep(0)
+    return sent
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a recorded CAN log")
+    parser.add_argument('source', nargs='?', help="log file or directory of logs")
+    parser.add_argument('--speed', default=None,
+                        help="replay speed: 1 = real time, N = N times, max = as fast "
+                             "as possible (default: max, or 1 with --vcan)")
+    parser.add_argument('--flightplan', help=".fpl flight plan to navigate")
+    parser.add_argument('--vcan', metavar='CHANNEL',
+                        help="send the frames to this CAN interface instead")
+    arguments = parser.parse_args()
+
+    if arguments.source is None:
+        parser.error("a log file or directory is required")
+    else:
+        if arguments.speed is None:
+            replay_speed = 1.0 if arguments.vcan else None
+        else:
+            replay_speed = None if arguments.speed == 'max' else float(arguments.speed)
+        if arguments.vcan:
+            frames_sent = asyncio.run(send_to_bus(load_frames(arguments.source),
+                                                  arguments.vcan, replay_speed))
+            print(f"sent {frames_sent} frames to {arguments.vcan}")
+        else:
+            replay_engine = CanReplay(load_frames(arguments.source), speed=replay_speed,
+                                      flight_plan=arguments.flightplan)
+            for key, value in asyncio.run(replay_engine.run()).items():
+                print(f"{key:>18}: {value}")
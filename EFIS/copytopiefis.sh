@@ -21,6 +21,23 @@ echo "$destination_server"
 rsync index.html "$user"@"$destination_server":"$piefis_main_dir"index.html
 rsync aio_server.py "$user"@"$destination_server":"$piefis_main_dir"aio_server.py
 rsync flightplan.py "$user"@"$destination_server":"$piefis_main_dir"flightplan.py
+rsync flightplan_watcher.py "$user"@"$destination_server":"$piefis_main_dir"flightplan_watcher.py
+rsync flightplan_cache.py "$user"@"$destination_server":"$piefis_main_dir"flightplan_cache.py
+rsync can_reader.py "$user"@"$destination_server":"$piefis_main_dir"can_reader.py
+rsync can_schema.py "$user"@"$destination_server":"$piefis_main_dir"can_schema.py
+rsync message_timeouts.py "$user"@"$destination_server":"$piefis_main_dir"message_timeouts.py
+rsync encoder_poller.py "$user"@"$destination_server":"$piefis_main_dir"encoder_poller.py
+rsync websocket_delta.py "$user"@"$destination_server":"$piefis_main_dir"websocket_delta.py
+rsync binary_frame.py "$user"@"$destination_server":"$piefis_main_dir"binary_frame.py
+rsync push_scheduler.py "$user"@"$destination_server":"$piefis_main_dir"push_scheduler.py
+rsync metrics.py "$user"@"$destination_server":"$piefis_main_dir"metrics.py
+rsync loop_monitor.py "$user"@"$destination_server":"$piefis_main_dir"loop_monitor.py
+rsync efis_log.py "$user"@"$destination_server":"$piefis_main_dir"efis_log.py
+rsync websocket_hub.py "$user"@"$destination_server":"$piefis_main_dir"websocket_hub.py
+rsync avionics_data.py "$user"@"$destination_server":"$piefis_main_dir"avionics_data.py
+rsync can_recorder.py "$user"@"$destination_server":"$piefis_main_dir"can_recorder.py
+rsync can_index.py "$user"@"$destination_server":"$piefis_main_dir"can_index.py
+rsync can_replay.py "$user"@"$destination_server":"$piefis_main_dir"can_replay.py
 
 # Read the support files line by line
 while IFS= read -r line || [[ -n "$line" ]]; do
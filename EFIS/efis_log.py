@@ -0,0 +1,265 @@
+"""Non-blocking, structured logging for the EFIS server.
+
+A log call on the event loop only puts the record on a bounded queue; a
+writer thread (logging.handlers.QueueListener) formats it and writes it to
+stdout. A slow stdout (journald under load, a stalled terminal) therefore
+delays the writer thread, never the loop. When the queue is full new records
+are dropped and counted instead of blocking.
+
+Every module logs under a category, a child of the ``efis`` logger:
+
+    log = efis_log.get_logger('can')
+    log.debug("frame 0x%02X", msg_id)                  # formatted lazily
+    log.info("recorder started", extra=efis_log.fields(path=path))
+
+Levels are switched per category at runtime with set_level() - served by
+the server at /log - instead of the former DEBUG_* constants. A category
+without its own level follows the ``efis`` level.
+
+Each line holds time, level, category, message and the structured fields as
+key=value pairs, or one JSON object with json_lines=True.
+
+Repeated messages (e.g. an unplugged encoder failing every read) go through
+a RateLimiter, which lets one through per interval and reports how many
+were suppressed in between.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+ROOT = 'efis'
+
+# Categories and what they cover (listed at /log)
+CATEGORIES = {
+    'server': "startup, shutdown, web server",
+    'can': "CAN ingest, filters, transmit",
+    'json': "websocket updates (send_json)",
+    'websocket': "websocket connections and client messages",
+    'qnh': "QNH from clients and on CAN",
+    'brightness': "backlight",
+    'gps_time': "GPS date/time validation",
+    'nav': "navigation and flight plans",
+    'encoder': "rotary encoder",
+    'timeouts': "message group timeouts",
+    'recorder': "CAN flight data recorder",
+    'hub': "websocket client queues",
+    'schema': "generated CAN decoders",
+}
+
+DEFAULT_LEVEL = logging.INFO
+DEFAULT_QUEUE_SIZE = 10000              # records held for the writer thread
+DEFAULT_RATE_LIMIT_INTERVAL = 10.0      # seconds between repeats of a message
+
+
+def get_logger(category):
+    """Return the logger of a category (``efis.<category>``)."""
+    return logging.getLogger(f"{ROOT}.{category}")
+
+
+def fields(**values):
+    """Structured fields for a record: log.info(msg, extra=fields(a=1))."""
+    return {'fields': values}
+
+
+def _level_number(level):
+    if level is None or isinstance(level, int):
+        return logging.NOTSET if level is None else level
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError(f"unknown log level {level!r}")
+    return number
+
+
+def set_level(category, level):
+    """Set the level of a category ('all' for the efis logger itself).
+
+    Args:
+        category: category name, or 'all'
+        level: level name ('DEBUG', 'info', ...) or number; None makes the
+            category follow the efis level again
+    """
+    if category not in CATEGORIES and category != 'all':
+        raise ValueError(f"unknown log category {category!r}")
+    number = _level_number(level)
+    if category == 'all':
+        logging.getLogger(ROOT).setLevel(number or DEFAULT_LEVEL)
+    else:
+        get_logger(category).setLevel(number)
+
+
+def levels():
+    """Return {'all': level, category: level or None (follows all), ...}."""
+    result = {'all': logging.getLevelName(logging.getLogger(ROOT).getEffectiveLevel())}
+    for category in CATEGORIES:
+        level = get_logger(category).level
+        result[category] = logging.getLevelName(level) if level else None
+    return result
+
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as text lines or JSON lines, with their fields."""
+
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.default_msec_format = '%s.%03d'
+        self.json_lines = json_lines
+
+    def format(self, record):
+        category = record.name[len(ROOT) + 1:] if record.name.startswith(ROOT + '.') else record.name
+        values = getattr(record, 'fields', None) or {}
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if self.json_lines:
+            entry = {'time': round(record.created, 6), 'level': record.levelname,
+                     'category': category, 'message': message}
+            entry.update(values)
+            if record.exc_text:
+                entry['exception'] = record.exc_text
+            return json.dumps(entry, default=str)
+        line = f"{self.formatTime(record)} {record.levelname:<7} {category}: {message}"
+        if values:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in values.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full.
+
+    The message is merged with its arguments on the calling thread (the
+    arguments may change before the writer runs); formatting and the write
+    happen on the writer thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    """QueueListener whose stop sentinel waits for room in a full queue."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """The queue, the writer thread and the handler on the efis logger.
+
+    Args:
+        stream: where the writer thread writes (default: sys.stdout)
+        queue_size: records held before new ones are dropped
+        json_lines: write JSON objects instead of text lines
+        level: level of the efis logger
+    """
+
+    def __init__(self, stream=None, queue_size=DEFAULT_QUEUE_SIZE, json_lines=False,
+                 level=DEFAULT_LEVEL):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.output = logging.StreamHandler(stream if stream is not None else sys.stdout)
+        self.output.setFormatter(StructuredFormatter(json_lines))
+        self.listener = _Listener(self.queue, self.output)
+        self.level = level
+        self.started = False
+
+    def start(self):
+        """Attach the queue handler to the efis logger and start the writer."""
+        root = logging.getLogger(ROOT)
+        root.addHandler(self.handler)
+        root.propagate = False
+        root.setLevel(_level_number(self.level))
+        self.listener.start()
+        self.started = True
+        return self
+
+    def stop(self):
+        """Write what is queued, stop the writer and detach the handler."""
+        if not self.started:
+            return
+        self.listener.stop()
+        root = logging.getLogger(ROOT)
+        root.removeHandler(self.handler)
+        root.propagate = True
+        self.started = False
+
+    def stats(self):
+        """Return the queue statistics as a dict."""
+        return {'queued': self.queue.qsize(),
+                'queue_size': self.queue.maxsize,
+                'dropped': self.handler.dropped}
+
+
+def start_logging(level=DEFAULT_LEVEL, category_levels=None, **options):
+    """Create and start a LogPipeline and apply category levels.
+
+    Args:
+        level: level of the efis logger
+        category_levels: {category: level} overrides
+        options: LogPipeline arguments (stream, queue_size, json_lines)
+
+    Returns:
+        LogPipeline
+    """
+    pipeline = LogPipeline(level=level, **options).start()
+    for category, category_level in (category_levels or {}).items():
+        set_level(category, category_level)
+    return pipeline
+
+
+class RateLimiter:
+    """Let a repeated message through at most once per interval.
+
+    Messages are told apart by a key. The first message of a key goes out at
+    once; later ones within the interval are counted, and the count is added
+    to the next message that goes out. Safe to share between threads under
+    the GIL (the worst case is an extra message).
+
+    Args:
+        interval: seconds between messages of the same key
+        clock: function returning monotonic seconds
+    """
+
+    def __init__(self, interval=DEFAULT_RATE_LIMIT_INTERVAL, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self._last = {}
+        self._suppressed = {}
+
+    def log(self, logger, level, key, msg, *args, **kwargs):
+        """Log through logger unless key was logged within the interval.
+
+        Returns:
+            bool: True if the message was logged
+        """
+        if not logger.isEnabledFor(level):
+            return False
+        now = self.clock()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg = f"{msg} ({suppressed} similar suppressed)"
+        logger.log(level, msg, *args, **kwargs)
+        return True
+
@@ -0,0 +1,159 @@
+"""Rotary encoder and button poller running off the event loop.
+
+Every ``encoder.position`` / ``button.value`` read is a blocking I2C
+transaction with the seesaw board. EncoderPoller performs those reads on a
+dedicated thread, either at a fixed rate or when the seesaw interrupt line
+signals a change, and hands only the changes to the event loop through an
+asyncio.Queue.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+import efis_log
+
+log = efis_log.get_logger('encoder')
+
+# Defaults (overridden by aio_server configuration)
+DEFAULT_POLL_RATE = 100.0  # Hz
+DEFAULT_THRESHOLD = 100  # ignore position jumps at least this large (read glitches)
+INTERRUPT_POLL_INTERVAL = 0.5  # seconds - safety poll when waiting on the interrupt line
+ERROR_RETRY_DELAY = 0.1  # seconds to wait after a failed read
+
+
+class EncoderEvent:
+    """A change in encoder position or button state."""
+    __slots__ = ('position', 'pressed', 'timestamp')
+
+    def __init__(self, position, pressed, timestamp):
+        self.position = position
+        self.pressed = pressed
+        self.timestamp = timestamp  # time.monotonic() when the change was read
+
+    def __repr__(self):
+        return f"EncoderEvent(position={self.position}, pressed={self.pressed})"
+
+
+class _InterruptLine:
+    """Falling-edge wait on the seesaw INT pin using libgpiod (v2 API)."""
+
+    def __init__(self, chip, offset):
+        import gpiod #pylint: disable=import-error
+        from gpiod.line import Bias, Edge #pylint: disable=import-error
+        self._offset = offset
+        self._request = gpiod.request_lines(
+            chip,
+            consumer='piefis-encoder',
+            config={offset: gpiod.LineSettings(edge_detection=Edge.FALLING,
+                                               bias=Bias.PULL_UP)})
+
+    def wait(self, timeout):
+        """Wait for an edge. Returns True if one occurred."""
+        if self._request.wait_edge_events(timeout):
+            self._request.read_edge_events()
+            return True
+        return False
+
+    def close(self):
+        self._request.release()
+
+
+class EncoderPoller:
+    """Poll an adafruit seesaw encoder and button from a background thread.
+
+    Args:
+        encoder: adafruit rotaryio.IncrementalEncoder
+        button: adafruit digitalio.DigitalIO (active low)
+        loop: event loop that receives the events
+        rate_hz: polling rate when no interrupt line is used
+        interrupt_chip: gpiochip path of the seesaw INT line (e.g.
+            '/dev/gpiochip0'), or None to poll at rate_hz
+        interrupt_offset: line offset of the seesaw INT line on that chip
+        threshold: position jumps at least this large are ignored
+    """
+
+    def __init__(self, encoder, button, loop, rate_hz=DEFAULT_POLL_RATE,
+                 interrupt_chip=None, interrupt_offset=None,
+                 threshold=DEFAULT_THRESHOLD):
+        self._encoder = encoder
+        self._button = button
+        self._loop = loop
+        self._period = 1.0 / rate_hz
+        self._interrupt_chip = interrupt_chip
+        self._interrupt_offset = interrupt_offset
+        self._threshold = threshold
+        self._stop = threading.Event()
+        self._thread = None
+        self.events = asyncio.Queue()
+        self.reads = 0
+        self.errors = 0
+        self._error_limiter = efis_log.RateLimiter()
+
+    def start(self):
+        """Start the polling thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='encoder-poller',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop the polling thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _open_interrupt(self):
+        if self._interrupt_chip is None or self._interrupt_offset is None:
+            return None
+        try:
+            return _InterruptLine(self._interrupt_chip, self._interrupt_offset)
+        except Exception as e: #pylint: disable=broad-except
+            log.warning("Encoder interrupt line unavailable (%s), polling at %.0f Hz",
+                        e, 1.0 / self._period)
+            return None
+
+    def _push(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self.events.put_nowait, event)
+        except RuntimeError:
+            self._stop.set()  # event loop closed
+
+    def _run(self):
+        interrupt = self._open_interrupt()
+        last_position = None
+        last_pressed = None
+        try:
+            while not self._stop.is_set():
+                try:
+                    position = -self._encoder.position
+                    pressed = not self._button.value
+                    self.reads += 1
+                except Exception as e: #pylint: disable=broad-except
+                    self.errors += 1
+                    # one message per interval however fast the reads fail
+                    self._error_limiter.log(log, logging.WARNING, 'read',
+                                            "Error reading encoder: %s (%d errors)",
+                                            e, self.errors)
+                    # Keep the last known good values
+                    self._stop.wait(ERROR_RETRY_DELAY)
+                    continue
+
+                if (last_position is not None and
+                        abs(position - last_position) >= self._threshold):
+                    position = last_position  # glitch - keep the last good position
+                if position != last_position or pressed != last_pressed:
+                    last_position = position
+                    last_pressed = pressed
+                    self._push(EncoderEvent(position, pressed, time.monotonic()))
+
+                if interrupt is not None:
+                    interrupt.wait(INTERRUPT_POLL_INTERVAL)
+                else:
+                    self._stop.wait(self._period)
+        finally:
+            if interrupt is not None:
+                interrupt.close()
+
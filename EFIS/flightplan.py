@@ -1,14 +1,39 @@
 """Flight plan parser and navigation computer for Garmin FPL format."""
 
+import logging
 import math
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
+import efis_log
+
+try:
+    import numpy as np #pylint: disable=import-error
+except ImportError:
+    np = None   # route tables (compute_route_table) need numpy
+
+log = efis_log.get_logger('nav')
+
 # Earth radius in nautical miles (WGS84 mean radius)
 EARTH_RADIUS_NM = 3440.065
 
 # Garmin FPL XML namespace
 FPL_NS = '{http://www8.garmin.com/xmlschemas/FlightPlan/v1}'
+_TABLE_TAG = f'{FPL_NS}waypoint-table'
+_WAYPOINT_TAG = f'{FPL_NS}waypoint'
+_IDENTIFIER_TAG = f'{FPL_NS}identifier'
+_TYPE_TAG = f'{FPL_NS}type'
+_LAT_TAG = f'{FPL_NS}lat'
+_LON_TAG = f'{FPL_NS}lon'
+_ALTITUDE_TAG = f'{FPL_NS}altitude-ft'
+_ROUTE_TAG = f'{FPL_NS}route'
+_ROUTE_NAME_TAG = f'{FPL_NS}route-name'
+_ROUTE_POINT_TAG = f'{FPL_NS}route-point'
+_RP_IDENTIFIER_TAG = f'{FPL_NS}waypoint-identifier'
+_RP_TYPE_TAG = f'{FPL_NS}waypoint-type'
+
+# Characters of an FPL file fed to the XML parser at a time
+PARSE_CHUNK_SIZE = 64 * 1024
 
 # Auto-sequence threshold — advance waypoint when FROM and closer than this
 SEQUENCE_DISTANCE_NM = 2.0
@@ -16,6 +41,9 @@ SEQUENCE_DISTANCE_NM = 2.0
 # GPS lat/lon from CAN bus are integers scaled by 10^6
 GPS_SCALE = 1_000_000
 
+# No ETE/ETA below this ground speed (knots) - taxiing or stopped
+ETE_MIN_GROUND_SPEED = 20
+
 
 # =============================================================================
 # Navigation math — all great-circle on WGS84 sphere
@@ -57,6 +85,200 @@ def cross_track_distance(lat, lon, lat1, lon1, lat2, lon2):
     return xt * EARTH_RADIUS_NM
 
 
+# =============================================================================
+# Precomputed geometry — the functions above with the per-waypoint and
+# per-leg terms computed once
+# =============================================================================
+
+class PointGeometry:
+    """A position with its trig values and ECEF unit vector precomputed."""
+    __slots__ = ('lat', 'lon', 'sin_lat', 'cos_lat', 'sin_lon', 'cos_lon', 'x', 'y', 'z')
+
+    def __init__(self, lat, lon):
+        self.lat = lat
+        self.lon = lon
+        lat_rad = _to_rad(lat)
+        lon_rad = _to_rad(lon)
+        self.sin_lat = math.sin(lat_rad)
+        self.cos_lat = math.cos(lat_rad)
+        self.sin_lon = math.sin(lon_rad)
+        self.cos_lon = math.cos(lon_rad)
+        self.x = self.cos_lat * self.cos_lon
+        self.y = self.cos_lat * self.sin_lon
+        self.z = self.sin_lat
+
+    def distance_to(self, other):
+        """Great-circle distance in NM (haversine_distance), from the chord
+        between the unit vectors."""
+        dx = self.x - other.x
+        dy = self.y - other.y
+        dz = self.z - other.z
+        half_chord = math.sqrt(dx * dx + dy * dy + dz * dz) / 2
+        return 2 * EARTH_RADIUS_NM * math.asin(min(1.0, half_chord))
+
+    def bearing_to(self, other):
+        """Initial bearing to other in degrees 0-360 (initial_bearing)."""
+        # sin/cos of the longitude difference from the angle difference identities
+        sin_dlon = other.sin_lon * self.cos_lon - other.cos_lon * self.sin_lon
+        cos_dlon = other.cos_lon * self.cos_lon + other.sin_lon * self.sin_lon
+        x = sin_dlon * other.cos_lat
+        y = self.cos_lat * other.sin_lat - self.sin_lat * other.cos_lat * cos_dlon
+        return _to_deg(math.atan2(x, y)) % 360
+
+
+class LegGeometry:
+    """Constants of the leg origin -> target: desired track and the unit
+    normal of its great circle.
+
+    Args:
+        origin: PointGeometry of the leg start, None when there is none
+        target: PointGeometry of the active waypoint
+    """
+    __slots__ = ('origin', 'target', 'dtk', 'normal')
+
+    def __init__(self, origin, target):
+        self.origin = origin
+        self.target = target
+        self.dtk = None
+        self.normal = None
+        if origin is None:
+            return
+        self.dtk = origin.bearing_to(target)
+        # origin x target, normalised; None for a zero length leg
+        nx = origin.y * target.z - origin.z * target.y
+        ny = origin.z * target.x - origin.x * target.z
+        nz = origin.x * target.y - origin.y * target.x
+        length = math.sqrt(nx * nx + ny * ny + nz * nz)
+        if length > 1e-15:
+            self.normal = (nx / length, ny / length, nz / length)
+
+    def cross_track(self, position):
+        """Cross-track distance in NM of a PointGeometry (cross_track_distance),
+        positive right of course."""
+        normal = self.normal
+        if normal is None:
+            origin, target = self.origin, self.target
+            return cross_track_distance(position.lat, position.lon,
+                                        origin.lat, origin.lon, target.lat, target.lon)
+        # the normal points left of the direction of travel
+        sin_xt = position.x * normal[0] + position.y * normal[1] + position.z * normal[2]
+        return -math.asin(max(-1.0, min(1.0, sin_xt))) * EARTH_RADIUS_NM
+
+
+class RouteArrays:
+    """The waypoint geometry as NumPy arrays, for whole-route computations.
+
+    Args:
+        waypoints: route waypoint dicts
+        points: their PointGeometry
+    """
+    __slots__ = ('ids', 'xyz', 'sin_lat', 'cos_lat', 'sin_lon', 'cos_lon', 'leg_dist')
+
+    def __init__(self, waypoints, points):
+        self.ids = [wpt['id'] for wpt in waypoints]
+        self.xyz = np.array([(point.x, point.y, point.z) for point in points],
+                            dtype=float).reshape(-1, 3)
+        self.sin_lat = np.array([point.sin_lat for point in points], dtype=float)
+        self.cos_lat = np.array([point.cos_lat for point in points], dtype=float)
+        self.sin_lon = np.array([point.sin_lon for point in points], dtype=float)
+        self.cos_lon = np.array([point.cos_lon for point in points], dtype=float)
+        # length of the leg ending at each waypoint (0 for the first)
+        self.leg_dist = np.zeros(len(points))
+        if len(points) > 1:
+            self.leg_dist[1:] = _chord_distance(self.xyz[1:] - self.xyz[:-1])
+
+
+def _chord_distance(difference):
+    """Great-circle distances in NM from an (N, 3) array of unit vector
+    differences (PointGeometry.distance_to for every row)."""
+    half_chord = np.sqrt(np.square(difference).sum(axis=1)) / 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.minimum(1.0, half_chord))
+
+
+# =============================================================================
+# FPL parsing
+# =============================================================================
+
+def parse_fpl(filepath, chunk_size=PARSE_CHUNK_SIZE):
+    """Parse a Garmin FPL file in one streaming pass.
+
+    The text is fed to the XML parser chunk_size characters at a time and
+    every waypoint / route-point element is cleared as soon as it has been
+    read, so the document tree is never built. Only the coordinate text of
+    the waypoint table is kept until the route has been read; the numbers
+    are converted for the route waypoints only.
+
+    Args:
+        filepath: path of the .fpl file (UTF-8, or UTF-16 with a BOM)
+        chunk_size: characters fed to the parser at a time
+
+    Returns:
+        (route name, route waypoint dicts in order, [(id, type) of the
+        route points missing from the waypoint table]); the route name is
+        None when the file has no route
+
+    Raises:
+        ET.ParseError: invalid XML
+        OSError, ValueError: unreadable file, bad encoding or numbers
+    """
+    with open(filepath, 'rb') as f:
+        bom = f.read(2)
+    # UTF-16 BOM detection - the declared encoding is ignored when the
+    # parser is fed text
+    encoding = 'utf-16' if bom in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+
+    parser = ET.XMLPullParser(events=('end',))
+    wpt_lookup = {}     # (id, type) -> (lat text, lon text, altitude text)
+    route_keys = []
+    route_name = None
+    with open(filepath, encoding=encoding) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                parser.feed(chunk)
+            else:
+                parser.close()
+            for _, elem in parser.read_events():
+                tag = elem.tag
+                if tag == _WAYPOINT_TAG:
+                    lat_text = elem.findtext(_LAT_TAG)
+                    lon_text = elem.findtext(_LON_TAG)
+                    if lat_text and lon_text:
+                        key = (elem.findtext(_IDENTIFIER_TAG, ''), elem.findtext(_TYPE_TAG, ''))
+                        wpt_lookup[key] = (lat_text, lon_text, elem.findtext(_ALTITUDE_TAG))
+                    elem.clear()
+                elif tag == _ROUTE_POINT_TAG:
+                    route_keys.append((elem.findtext(_RP_IDENTIFIER_TAG, ''),
+                                       elem.findtext(_RP_TYPE_TAG, '')))
+                    elem.clear()
+                elif tag == _ROUTE_NAME_TAG:
+                    route_name = elem.text or ''
+                elif tag == _ROUTE_TAG:
+                    if route_name is None:
+                        route_name = 'Unknown'
+                elif tag == _TABLE_TAG:
+                    elem.clear()    # the cleared waypoint elements
+            if not chunk:
+                break
+
+    waypoints = []
+    missing = []
+    for key in route_keys:
+        texts = wpt_lookup.get(key)
+        if texts is None:
+            missing.append(key)
+            continue
+        lat_text, lon_text, alt_text = texts
+        waypoints.append({
+            'id': key[0],
+            'type': key[1],
+            'lat': float(lat_text),
+            'lon': float(lon_text),
+            'alt': int(alt_text) if alt_text else None,
+        })
+    return route_name, waypoints, missing
+
+
 # =============================================================================
 # Flight Plan class
 # =============================================================================
@@ -70,89 +292,93 @@ class FlightPlan:
         self.active_leg = 0       # index of active waypoint (target)
         self.direct_to_origin = None  # {'lat': float, 'lon': float} — GPS position at D→ activation
         self._filepath = None
+        self._points = []         # PointGeometry per waypoint
+        self._points_for = None   # waypoints list _points was computed from
+        self._leg = None          # LegGeometry of the active leg
+        self._leg_for = None      # (active_leg, direct_to_origin, _points) of _leg
+        self._arrays = None       # RouteArrays of _points (numpy only)
+        self._to_go = None        # route distance from the active waypoint to each later one
+        self._to_go_for = None    # (active_leg, _arrays) of _to_go
 
     def load(self, filepath):
-        """Load a Garmin FPL file. Handles UTF-8 and UTF-16 encoding."""
+        """Load a Garmin FPL file. Handles UTF-8 and UTF-16 encoding.
+
+        The file is parsed in one streaming pass (parse_fpl) and the plan is
+        replaced only once parsing has succeeded, so a FlightPlan can be
+        loaded in a worker thread and handed to the event loop when ready.
+        """
         filepath = Path(filepath)
         if not filepath.exists():
-            print(f"Flight plan not found: {filepath}")
+            log.warning("Flight plan not found: %s", filepath)
             return False
 
-        # Read raw bytes to detect encoding
-        raw = filepath.read_bytes()
-
-        # UTF-16 BOM detection
-        if raw[:2] in (b'\xff\xfe', b'\xfe\xff'):
-            text = raw.decode('utf-16')
-        else:
-            text = raw.decode('utf-8')
-
         try:
-            root = ET.fromstring(text)
+            route_name, waypoints, missing = parse_fpl(filepath)
         except ET.ParseError as e:
-            print(f"Error parsing flight plan XML: {e}")
+            log.error("Error parsing flight plan XML: %s", e)
             return False
-
-        # Build waypoint lookup from waypoint-table
-        wpt_lookup = {}
-        for wpt in root.findall(f'{FPL_NS}waypoint-table/{FPL_NS}waypoint'):
-            wpt_id = wpt.findtext(f'{FPL_NS}identifier', '')
-            wpt_type = wpt.findtext(f'{FPL_NS}type', '')
-            lat_text = wpt.findtext(f'{FPL_NS}lat', '')
-            lon_text = wpt.findtext(f'{FPL_NS}lon', '')
-            alt_text = wpt.findtext(f'{FPL_NS}altitude-ft', '')
-
-            if lat_text and lon_text:
-                key = (wpt_id, wpt_type)
-                wpt_lookup[key] = {
-                    'id': wpt_id,
-                    'type': wpt_type,
-                    'lat': float(lat_text),
-                    'lon': float(lon_text),
-                    'alt': int(alt_text) if alt_text else None,
-                }
-
-        # Build ordered route from route-point elements
-        route_el = root.find(f'{FPL_NS}route')
-        if route_el is None:
-            print("No route found in flight plan")
+        except (OSError, ValueError) as e:
+            log.error("Error reading flight plan %s: %s", filepath, e)
             return False
 
-        self.route_name = route_el.findtext(f'{FPL_NS}route-name', 'Unknown')
-
-        self.waypoints = []
-        for rp in route_el.findall(f'{FPL_NS}route-point'):
-            rp_id = rp.findtext(f'{FPL_NS}waypoint-identifier', '')
-            rp_type = rp.findtext(f'{FPL_NS}waypoint-type', '')
-            key = (rp_id, rp_type)
-            if key in wpt_lookup:
-                self.waypoints.append(wpt_lookup[key])
-            else:
-                print(f"Warning: route waypoint {rp_id} ({rp_type}) not in waypoint table")
+        if route_name is None:
+            log.error("No route found in flight plan")
+            return False
+        for rp_id, rp_type in missing:
+            log.warning("route waypoint %s (%s) not in waypoint table", rp_id, rp_type)
+
+        self.set_route(route_name, waypoints, filepath)
+        log.info("Loaded flight plan: %s (%d waypoints)", self.route_name, len(self.waypoints))
+        if log.isEnabledFor(logging.DEBUG):
+            for i, wpt in enumerate(self.waypoints):
+                marker = " <-- active" if i == self.active_leg else ""
+                log.debug("  %d: %s (%s) %.6f, %.6f%s",
+                          i, wpt['id'], wpt['type'], wpt['lat'], wpt['lon'], marker)
+        return True
 
+    def set_route(self, route_name, waypoints, filepath=None):
+        """Replace the route, start on its first leg and precompute the
+        waypoint geometry.
+
+        Args:
+            route_name: route name
+            waypoints: ordered route waypoint dicts {id, type, lat, lon, alt}
+            filepath: file the route was read from, if any
+        """
+        self.route_name = route_name
+        self.waypoints = waypoints
         self.active_leg = min(1, len(self.waypoints) - 1)  # start targeting first waypoint after departure
-        self._filepath = filepath
-
-        print(f"Loaded flight plan: {self.route_name} ({len(self.waypoints)} waypoints)")
-        for i, wpt in enumerate(self.waypoints):
-            marker = " <-- active" if i == self.active_leg else ""
-            print(f"  {i}: {wpt['id']} ({wpt['type']}) "
-                  f"{wpt['lat']:.6f}, {wpt['lon']:.6f}{marker}")
-        return True
+        self.direct_to_origin = None
+        self._filepath = Path(filepath) if filepath is not None else None
+        self.waypoint_geometry()
+
+    def copy(self):
+        """Return a plan of the same route starting on its first leg. The
+        waypoints and their geometry are shared, not copied: they are never
+        modified once loaded."""
+        plan = FlightPlan()
+        plan.route_name = self.route_name
+        plan.waypoints = self.waypoints
+        plan.active_leg = min(1, len(self.waypoints) - 1)
+        plan._filepath = self._filepath
+        plan._points = self._points
+        plan._points_for = self._points_for
+        plan._arrays = self._arrays
+        return plan
 
     def load_newest(self, directory):
         """Load the most recently modified .fpl file from a directory."""
         directory = Path(directory)
         if not directory.exists():
-            print(f"Flight plans directory not found: {directory}")
+            log.warning("Flight plans directory not found: %s", directory)
             return False
 
         fpl_files = sorted(directory.glob('*.fpl'), key=lambda f: f.stat().st_mtime, reverse=True)
         if not fpl_files:
-            print(f"No .fpl files found in {directory}")
+            log.info("No .fpl files found in %s", directory)
             return False
 
-        print(f"Found {len(fpl_files)} flight plan(s), loading newest: {fpl_files[0].name}")
+        log.info("Found %d flight plan(s), loading newest: %s", len(fpl_files), fpl_files[0].name)
         return self.load(fpl_files[0])
 
     @property
@@ -188,7 +414,7 @@ class FlightPlan:
         if self.active_leg < len(self.waypoints) - 1:
             self.active_leg += 1
             self.direct_to_origin = None  # revert to leg-by-leg
-            print(f"Nav: sequenced to {self.active_waypoint_id} (leg {self.active_leg})")
+            log.info("Nav: sequenced to %s (leg %d)", self.active_waypoint_id, self.active_leg)
             return True
         return False
 
@@ -197,7 +423,7 @@ class FlightPlan:
         if self.active_leg > 1:  # don't go before first leg
             self.active_leg -= 1
             self.direct_to_origin = None
-            print(f"Nav: sequenced back to {self.active_waypoint_id} (leg {self.active_leg})")
+            log.info("Nav: sequenced back to %s (leg %d)", self.active_waypoint_id, self.active_leg)
             return True
         return False
 
@@ -206,14 +432,65 @@ class FlightPlan:
         if 1 <= waypoint_index < len(self.waypoints):
             self.active_leg = waypoint_index
             self.direct_to_origin = {'lat': lat, 'lon': lon}
-            print(f"Direct-To: {self.active_waypoint_id} from {lat:.6f}, {lon:.6f}")
+            self.leg_geometry()
+            log.info("Direct-To: %s from %.6f, %.6f", self.active_waypoint_id, lat, lon)
             return True
         return False
 
     def cancel_direct_to(self):
         """Cancel Direct-To and revert to leg-by-leg navigation."""
         self.direct_to_origin = None
-        print(f"Direct-To cancelled, leg mode to {self.active_waypoint_id}")
+        log.info("Direct-To cancelled, leg mode to %s", self.active_waypoint_id)
+
+    def waypoint_geometry(self):
+        """Return the PointGeometry of every waypoint, computed when the
+        plan is loaded (or when waypoints has been replaced since)."""
+        if self._points_for is not self.waypoints or len(self._points) != len(self.waypoints):
+            self._points = [PointGeometry(wpt['lat'], wpt['lon']) for wpt in self.waypoints]
+            self._points_for = self.waypoints
+            self._arrays = RouteArrays(self.waypoints, self._points) if np is not None else None
+        return self._points
+
+    def route_arrays(self):
+        """Return the RouteArrays of the waypoints (None without numpy)."""
+        self.waypoint_geometry()
+        return self._arrays
+
+    def route_distances(self):
+        """Return the route distance (NM) from the active waypoint to it and
+        every later waypoint as an array, recomputed only when the active leg
+        changes (numpy only)."""
+        arrays = self.route_arrays()
+        cached_for = self._to_go_for
+        if cached_for is not None and cached_for[0] == self.active_leg and cached_for[1] is arrays:
+            return self._to_go
+        to_go = np.cumsum(arrays.leg_dist[self.active_leg:])
+        to_go -= to_go[0]   # the leg ending at the active waypoint is flown direct
+        self._to_go = to_go
+        self._to_go_for = (self.active_leg, arrays)
+        return to_go
+
+    def leg_geometry(self):
+        """Return the LegGeometry of the active leg (None without an active
+        waypoint), computed once per leg / Direct-To activation."""
+        points = self.waypoint_geometry()
+        origin = self.direct_to_origin
+        cached_for = self._leg_for
+        if (cached_for is not None and cached_for[0] == self.active_leg
+                and cached_for[1] is origin and cached_for[2] is points):
+            return self._leg
+        leg = None
+        if 0 <= self.active_leg < len(points):
+            if origin is not None:
+                start = PointGeometry(origin['lat'], origin['lon'])
+            elif self.active_leg >= 1:
+                start = points[self.active_leg - 1]
+            else:
+                start = None
+            leg = LegGeometry(start, points[self.active_leg])
+        self._leg = leg
+        self._leg_for = (self.active_leg, origin, points)
+        return leg
 
     def to_dict(self):
         """Return route data as a JSON-serializable dict."""
@@ -243,24 +520,21 @@ def compute_navigation(lat_raw, lon_raw, flight_plan):
         dict with dtk, bearing, xtrack, dist, to_from, wpt_id, route_name
         or None if computation not possible
     """
-    wpt = flight_plan.active_waypoint
-    prev = flight_plan.previous_waypoint
-    if wpt is None:
+    leg = flight_plan.leg_geometry()
+    if leg is None:
         return None
 
     # Convert CAN integer lat/lon to decimal degrees
-    lat = lat_raw / GPS_SCALE
-    lon = lon_raw / GPS_SCALE
+    position = PointGeometry(lat_raw / GPS_SCALE, lon_raw / GPS_SCALE)
 
     # Bearing and distance from current position to active waypoint
-    brg = initial_bearing(lat, lon, wpt['lat'], wpt['lon'])
-    dist = haversine_distance(lat, lon, wpt['lat'], wpt['lon'])
-
-    # Desired track (course of the leg)
-    if prev is not None:
-        dtk = initial_bearing(prev['lat'], prev['lon'], wpt['lat'], wpt['lon'])
-        xtrack = cross_track_distance(lat, lon, prev['lat'], prev['lon'],
-                                       wpt['lat'], wpt['lon'])
+    brg = position.bearing_to(leg.target)
+    dist = position.distance_to(leg.target)
+
+    # Desired track (course of the leg, precomputed)
+    if leg.origin is not None:
+        dtk = leg.dtk
+        xtrack = leg.cross_track(position)
     else:
         # No previous waypoint (direct-to) — DTK is bearing to waypoint
         dtk = brg
@@ -287,6 +561,70 @@ def compute_navigation(lat_raw, lon_raw, flight_plan):
     }
 
 
+def compute_route_table(lat_raw, lon_raw, ground_speed, flight_plan, now):
+    """Compute the progress along the whole remaining route in one
+    vectorized pass.
+
+    Args:
+        lat_raw: latitude from CAN bus (integer, ×10^6)
+        lon_raw: longitude from CAN bus (integer, ×10^6)
+        ground_speed: GPS ground speed in knots (None if unknown)
+        flight_plan: FlightPlan instance with loaded route
+        now: time of the fix (seconds since the epoch) for the ETAs
+
+    Returns:
+        dict of columns, one entry per waypoint from the active one to the
+        destination: ids, bearing (degrees), dist (direct, NM), leg_dist
+        (NM, the active leg measured from the present position), to_go
+        (route distance, NM), ete (seconds) and eta (seconds since the
+        epoch); plus active_leg and to_dest (NM). ete/eta are None below
+        ETE_MIN_GROUND_SPEED. None if numpy or an active waypoint is missing.
+    """
+    if np is None:
+        return None
+    arrays = flight_plan.route_arrays()
+    active = flight_plan.active_leg
+    if arrays is None or not 0 <= active < len(arrays.ids):
+        return None
+
+    position = PointGeometry(lat_raw / GPS_SCALE, lon_raw / GPS_SCALE)
+
+    # Direct distance and bearing to every remaining waypoint
+    dist = _chord_distance(arrays.xyz[active:] - (position.x, position.y, position.z))
+    sin_lon = arrays.sin_lon[active:]
+    cos_lon = arrays.cos_lon[active:]
+    cos_lat = arrays.cos_lat[active:]
+    sin_dlon = sin_lon * position.cos_lon - cos_lon * position.sin_lon
+    cos_dlon = cos_lon * position.cos_lon + sin_lon * position.sin_lon
+    bearing = np.degrees(np.arctan2(
+        sin_dlon * cos_lat,
+        position.cos_lat * arrays.sin_lat[active:] - position.sin_lat * cos_lat * cos_dlon)) % 360
+
+    # Along the route: direct to the active waypoint, then the legs
+    to_go = dist[0] + flight_plan.route_distances()
+    leg_dist = arrays.leg_dist[active:].copy()
+    leg_dist[0] = dist[0]
+
+    if ground_speed is not None and ground_speed >= ETE_MIN_GROUND_SPEED:
+        ete = to_go * (3600.0 / ground_speed)
+        ete_list = ete.round().astype(int).tolist()
+        eta_list = (ete + now).round().astype(int).tolist()
+    else:
+        ete_list = eta_list = [None] * len(to_go)
+
+    return {
+        'active_leg': active,
+        'ids': arrays.ids[active:],
+        'bearing': bearing.round(1).tolist(),
+        'dist': dist.round(1).tolist(),
+        'leg_dist': leg_dist.round(1).tolist(),
+        'to_go': to_go.round(1).tolist(),
+        'ete': ete_list,
+        'eta': eta_list,
+        'to_dest': round(float(to_go[-1]), 1),
+    }
+
+
 # =============================================================================
 # Standalone test
 # =============================================================================
@@ -294,6 +632,10 @@ def compute_navigation(lat_raw, lon_raw, flight_plan):
 if __name__ == '__main__':
     import sys
 
+    # show the plan as it is loaded (waypoints are logged at DEBUG)
+    logging.basicConfig(format='%(message)s')
+    log.setLevel(logging.DEBUG)
+
     if len(sys.argv) < 2:
         print("Usage: python flightplan.py <file.fpl> [lat_deg lon_deg]")
         print("  e.g. python flightplan.py ForeFlight.fpl 43.13 -80.34")
@@ -0,0 +1,303 @@
+"""Cache of parsed flight plans.
+
+Plans are keyed by their file path, modification time (ns) and size, so
+switching back to a plan that has not changed on disk never parses its XML
+again:
+
+  - the last ``capacity`` plans are kept in memory as ready FlightPlan
+    objects (waypoint geometry and route arrays included), least recently
+    used first out. Every load returns a copy (FlightPlan.copy) sharing
+    the cached waypoints and geometry, so a selected plan starts on its
+    first leg without Direct-To, as a freshly parsed one does;
+  - every parsed plan is also written to ``cache_dir`` in a compact binary
+    form, read back after a restart (or once the plan has left the memory
+    cache) for the cost of unpacking the route waypoints.
+
+Cache file layout (little endian):
+
+    header    '4sHqqI'  magic b'FPLC', format version, source mtime (ns),
+                        source size, waypoint count
+    string    'H' length + UTF-8: source path, route name
+    waypoint  'ddi' lat, lon, altitude (ft, NO_ALTITUDE when absent),
+              then the id and type strings
+
+A cache file that is unreadable, of another version or whose source file
+changed is ignored and rewritten from the XML.
+"""
+
+import collections
+import hashlib
+import os
+import struct
+import threading
+from pathlib import Path
+
+import efis_log
+from flightplan import FlightPlan
+
+log = efis_log.get_logger('nav')
+
+DEFAULT_CAPACITY = 8        # plans kept in memory
+CACHE_SUFFIX = '.fplc'
+CACHE_MAGIC = b'FPLC'
+CACHE_VERSION = 1
+NO_ALTITUDE = -2 ** 31      # altitude stored for waypoints without one
+
+_HEADER = struct.Struct('<4sHqqI')
+_STRING_LENGTH = struct.Struct('<H')
+_WAYPOINT = struct.Struct('<ddi')
+
+
+# =============================================================================
+# Binary cache format
+# =============================================================================
+
+def _pack_string(text):
+    data = text.encode('utf-8')
+    return _STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(buffer, offset):
+    (length,) = _STRING_LENGTH.unpack_from(buffer, offset)
+    offset += _STRING_LENGTH.size
+    return buffer[offset:offset + length].decode('utf-8'), offset + length
+
+
+def encode_plan(source, key, route_name, waypoints):
+    """Return the cache file contents for a parsed plan.
+
+    Args:
+        source: path of the .fpl file (str)
+        key: (mtime ns, size) of the .fpl file when it was parsed
+        route_name: route name
+        waypoints: route waypoint dicts {id, type, lat, lon, alt}
+    """
+    parts = [_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, key[0], key[1], len(waypoints)),
+             _pack_string(source), _pack_string(route_name)]
+    pack = _WAYPOINT.pack
+    for wpt in waypoints:
+        alt = wpt['alt']
+        parts.append(pack(wpt['lat'], wpt['lon'], NO_ALTITUDE if alt is None else alt))
+        parts.append(_pack_string(wpt['id']))
+        parts.append(_pack_string(wpt['type']))
+    return b''.join(parts)
+
+
+def decode_header(buffer):
+    """Return (source, key, route name, waypoint count, offset of the
+    waypoints) from the start of a cache file.
+
+    Raises:
+        ValueError: not a cache file of this version
+        struct.error, UnicodeDecodeError: truncated or corrupt file
+    """
+    magic, version, mtime_ns, size, count = _HEADER.unpack_from(buffer, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        raise ValueError("not a flight plan cache file of version %d" % CACHE_VERSION)
+    source, offset = _unpack_string(buffer, _HEADER.size)
+    route_name, offset = _unpack_string(buffer, offset)
+    return source, (mtime_ns, size), route_name, count, offset
+
+
+def decode_plan(buffer):
+    """Return (source, key, route name, waypoints) from cache file contents.
+
+    Raises:
+        ValueError, struct.error, UnicodeDecodeError: see decode_header
+    """
+    source, key, route_name, count, offset = decode_header(buffer)
+    unpack = _WAYPOINT.unpack_from
+    size = _WAYPOINT.size
+    waypoints = []
+    for _ in range(count):
+        lat, lon, alt = unpack(buffer, offset)
+        wpt_id, offset = _unpack_string(buffer, offset + size)
+        wpt_type, offset = _unpack_string(buffer, offset)
+        waypoints.append({'id': wpt_id, 'type': wpt_type, 'lat': lat, 'lon': lon,
+                          'alt': None if alt == NO_ALTITUDE else alt})
+    return source, key, route_name, waypoints
+
+
+def file_key(path):
+    """Return the cache key (mtime ns, size) of a file.
+
+    Raises:
+        OSError: the file cannot be read
+    """
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+class FlightPlanCache:
+    """LRU of loaded FlightPlan objects backed by a binary cache directory.
+
+    load() may run in a worker thread while the event loop calls cached()
+    and catalog().
+
+    Args:
+        cache_dir: directory for the binary cache files, or None to cache
+            in memory only
+        capacity: plans kept in memory
+    """
+
+    def __init__(self, cache_dir=None, capacity=DEFAULT_CAPACITY):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.capacity = capacity
+        self._plans = collections.OrderedDict()   # source -> (key, FlightPlan), oldest first
+        self._index = {}                          # source -> (key, route name, waypoint count)
+        self._lock = threading.Lock()
+        # Statistics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.parses = 0
+
+    @staticmethod
+    def source(path):
+        """Return the absolute path string a plan is cached under."""
+        return os.path.abspath(path)
+
+    def _cache_file(self, source):
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+        return self.cache_dir / (name + CACHE_SUFFIX)
+
+    def read_index(self):
+        """Index the cache directory, removing the files of plans whose
+        source was deleted or changed. Call once at startup (in a worker
+        thread: it reads the start of every cache file).
+
+        Returns:
+            number of plans indexed
+        """
+        if self.cache_dir is None:
+            return 0
+        index = {}
+        try:
+            cache_files = list(self.cache_dir.glob('*' + CACHE_SUFFIX))
+        except OSError:
+            cache_files = []
+        for cache_file in cache_files:
+            try:
+                with open(cache_file, 'rb') as f:
+                    start = f.read(4096)
+                source, key, route_name, count, _ = decode_header(start)
+                current = file_key(source)
+            except (OSError, ValueError, struct.error, UnicodeDecodeError):
+                current = key = None
+            if current is None or current != key:
+                try:
+                    cache_file.unlink()
+                except OSError:
+                    pass
+                continue
+            index[source] = (key, route_name, count)
+        with self._lock:
+            index.update(self._index)
+            self._index = index
+        return len(index)
+
+    def cached(self, path):
+        """Return a copy of the in-memory plan of a file if it has not
+        changed since it was loaded (one stat), else None."""
+        source = self.source(path)
+        with self._lock:
+            entry = self._plans.get(source)
+        if entry is None:
+            return None
+        try:
+            key = file_key(source)
+        except OSError:
+            return None
+        if key != entry[0]:
+            return None
+        with self._lock:
+            if source in self._plans:
+                self._plans.move_to_end(source)
+            self.memory_hits += 1
+        return entry[1].copy()
+
+    def load(self, path):
+        """Return the FlightPlan of a file from memory, the cache directory
+        or by parsing it, or None if it cannot be loaded."""
+        plan = self.cached(path)
+        if plan is not None:
+            return plan
+        source = self.source(path)
+        try:
+            key = file_key(source)
+        except OSError as e:
+            log.warning("Flight plan not found: %s (%s)", path, e)
+            return None
+
+        plan = self._read_cache_file(source, key)
+        if plan is not None:
+            self.disk_hits += 1
+            log.info("Loaded flight plan: %s (%d waypoints) from the cache",
+                     plan.route_name, len(plan.waypoints))
+        else:
+            plan = FlightPlan()
+            if not plan.load(source):
+                return None
+            self.parses += 1
+            self._write_cache_file(source, key, plan)
+
+        with self._lock:
+            self._plans[source] = (key, plan)
+            self._plans.move_to_end(source)
+            while len(self._plans) > self.capacity:
+                self._plans.popitem(last=False)
+            self._index[source] = (key, plan.route_name, len(plan.waypoints))
+        return plan.copy()
+
+    def _read_cache_file(self, source, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_file(source), 'rb') as f:
+                buffer = f.read()
+            cached_source, cached_key, route_name, waypoints = decode_plan(buffer)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+            log.warning("Ignoring flight plan cache file for %s: %s", source, e)
+            return None
+        if cached_source != source or cached_key != key:
+            return None
+        plan = FlightPlan()
+        plan.set_route(route_name, waypoints, source)
+        return plan
+
+    def _write_cache_file(self, source, key, plan):
+        if self.cache_dir is None:
+            return
+        cache_file = self._cache_file(source)
+        temporary = cache_file.with_suffix('.tmp')
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            temporary.write_bytes(encode_plan(source, key, plan.route_name, plan.waypoints))
+            os.replace(temporary, cache_file)
+        except OSError as e:
+            log.warning("Could not write the flight plan cache file %s: %s", cache_file, e)
+
+    def catalog(self, directory=None):
+        """Return the cached plans as [{'file', 'route_name', 'waypoints'}]
+        sorted by file name, optionally only those in one directory."""
+        if directory is not None:
+            directory = self.source(directory)
+        with self._lock:
+            entries = list(self._index.items())
+        return sorted(
+            ({'file': os.path.basename(source), 'route_name': route_name, 'waypoints': count}
+             for source, (_, route_name, count) in entries
+             if directory is None or os.path.dirname(source) == directory),
+            key=lambda entry: entry['file'])
+
+    def stats(self):
+        """Return the cache statistics as a dict."""
+        return {'in_memory': len(self._plans), 'indexed': len(self._index),
+                'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits,
+                'parses': self.parses}
+
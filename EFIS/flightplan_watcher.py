@@ -0,0 +1,267 @@
+"""Watch the flight plan directory for the newest .fpl file.
+
+FlightPlanWatcher keeps an index of the .fpl files in a directory and their
+modification times, and reports the newest one whenever it changes. On
+Linux the index is updated from inotify events (through ctypes, read by the
+event loop from the inotify file descriptor):
+
+  - IN_CLOSE_WRITE / IN_MOVED_TO: a file was written or renamed into place
+    - its mtime is read (one stat);
+  - IN_DELETE / IN_MOVED_FROM: a file went away;
+  - IN_DELETE_SELF / IN_MOVE_SELF / IN_IGNORED: the directory went away -
+    the watcher waits for it to come back;
+  - IN_Q_OVERFLOW: events were lost - the directory is scanned again.
+
+A change is reported once no further event arrived for ``debounce``
+seconds, so a plan written in several opens/closes (or copied, then
+renamed) is loaded once, after its last write. Where inotify is not
+available (other platforms, no free watches) the directory is scanned every
+``poll_interval`` seconds instead, with one stat per file.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+from pathlib import Path
+
+import efis_log
+
+log = efis_log.get_logger('nav')
+
+DEFAULT_DEBOUNCE = 0.05       # seconds without events before a change is reported
+DEFAULT_POLL_INTERVAL = 5.0   # seconds between scans without inotify
+
+# inotify event masks (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+class _Inotify:
+    """Minimal inotify binding: one watch, non-blocking reads."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.wd = None
+
+    def watch(self, directory, mask=WATCH_MASK):
+        """Watch a directory (replacing the previous watch)."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), str(directory))
+        self.wd = wd
+
+    def read(self):
+        """Return the pending events as [(mask, name)]."""
+        try:
+            buffer = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(buffer):
+            _, mask, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FlightPlanWatcher:
+    """Report the newest file with a suffix in a directory as it changes.
+
+    Args:
+        directory: directory to watch (need not exist yet)
+        suffix: file name suffix of the plans
+        debounce: seconds without further events before a change is
+            reported
+        poll_interval: seconds between scans when inotify is unavailable,
+            and between checks for a missing directory
+        use_inotify: False to always poll
+    """
+
+    def __init__(self, directory, suffix='.fpl', debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None         # 'inotify' or 'poll' once started
+        self.files = {}             # name -> mtime (seconds)
+        self.events = 0             # inotify events read
+        self.scans = 0              # full directory scans
+        self._use_inotify = use_inotify
+        self._inotify = None
+        self._loop = None
+        self._changed = asyncio.Event()
+        self._timer = None
+        self._watching = False      # directory watch in place
+
+    # --- index ---------------------------------------------------------------
+
+    def newest(self):
+        """Return (Path, mtime) of the newest file, or None."""
+        if not self.files:
+            return None
+        name = max(self.files, key=self.files.get)
+        return self.directory / name, self.files[name]
+
+    def scan(self):
+        """Rebuild the index from the directory (one stat per file).
+
+        Returns:
+            True if the directory exists
+        """
+        self.scans += 1
+        files = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(self.suffix):
+                        try:
+                            if entry.is_file():
+                                files[entry.name] = entry.stat().st_mtime
+                        except FileNotFoundError:
+                            pass
+        except (FileNotFoundError, NotADirectoryError):
+            self.files = {}
+            return False
+        self.files = files
+        return True
+
+    def _update(self, name):
+        try:
+            self.files[name] = os.stat(self.directory / name).st_mtime
+        except FileNotFoundError:
+            self.files.pop(name, None)
+
+    # --- inotify -------------------------------------------------------------
+
+    def _start_inotify(self):
+        """Set up inotify; returns False where it is unavailable."""
+        if not self._use_inotify:
+            return False
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            log.info("inotify unavailable (%s) - scanning %s every %.0f s",
+                     e, self.directory, self.poll_interval)
+            return False
+        self._loop.add_reader(self._inotify.fd, self._on_readable)
+        return True
+
+    def _watch_directory(self):
+        """Watch the directory and index it. Returns False if it is missing."""
+        try:
+            self._inotify.watch(self.directory)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                return False
+            raise
+        self._watching = True
+        self.scan()     # after the watch, so nothing written in between is missed
+        return True
+
+    def _on_readable(self):
+        for mask, name in self._inotify.read():
+            self.events += 1
+            if mask & IN_Q_OVERFLOW:
+                log.warning("inotify queue overflow - scanning %s", self.directory)
+                self.scan()
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                if self._watching:
+                    log.info("Flight plans directory %s went away", self.directory)
+                self._watching = False
+                self.files = {}
+            elif name.endswith(self.suffix):
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self._update(name)
+                else:
+                    self.files.pop(name, None)
+            else:
+                continue
+            self._schedule()
+
+    def _schedule(self):
+        # (re)start the debounce timer
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_later(self.debounce, self._changed.set)
+
+    # --- reporting -----------------------------------------------------------
+
+    async def changes(self):
+        """Yield the newest file as (Path, mtime), or None when there is no
+        file, first for the current state and then on every change."""
+        self._loop = asyncio.get_running_loop()
+        self.backend = 'inotify' if self._start_inotify() else 'poll'
+        last = self._initial_state()
+        yield last
+        while True:
+            if self.backend == 'inotify' and self._watching:
+                await self._changed.wait()
+                self._changed.clear()
+            else:
+                # polling, or waiting for the directory to (re)appear
+                await asyncio.sleep(self.poll_interval)
+                if self.backend == 'inotify':
+                    if not self._watch_directory():
+                        continue
+                    log.info("Watching flight plans directory %s", self.directory)
+                else:
+                    self.scan()
+            current = self.newest()
+            if current != last:
+                last = current
+                yield current
+
+    def _initial_state(self):
+        if self.backend == 'inotify':
+            if not self._watch_directory():
+                log.warning("Flight plans directory not found: %s", self.directory)
+        elif not self.scan():
+            log.warning("Flight plans directory not found: %s", self.directory)
+        return self.newest()
+
+    def close(self):
+        """Stop watching."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._inotify is not None:
+            self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        self._watching = False
+
+    def stats(self):
+        """Return the watcher statistics as a dict."""
+        return {'backend': self.backend, 'files': len(self.files),
+                'events': self.events, 'scans': self.scans}
+
@@ -0,0 +1,264 @@
+"""Event loop lag probe and per-task accounting.
+
+Everything in the EFIS server shares one event loop, so any callback that
+blocks (an I2C read, a sysfs backlight write, XML parsing, a print to a
+stalled journald) delays every other task. LoopMonitor shows who is doing
+it:
+
+  - a lag probe sleeps for a fixed interval and records how late it wakes,
+    which covers every callback on the loop, tracked or not;
+  - coroutines wrapped with track() have every step (one send() between two
+    awaits) timed, giving busy wall time, step counts and slow steps per
+    task;
+  - a watchdog thread notices when the probe is overdue by more than
+    stack_threshold and captures the stack of the loop thread while it is
+    still blocked, labelled with the tracked task running at the time.
+
+Timing a step is two perf_counter calls; the watchdog wakes every
+stack_threshold / 2 and only reads a few attributes.
+"""
+
+import asyncio
+import collections
+import collections.abc
+import sys
+import threading
+import time
+import traceback
+
+from metrics import LatencyHistogram
+
+DEFAULT_INTERVAL = 0.1          # seconds between lag probes
+DEFAULT_SLOW_THRESHOLD = 0.02   # a step running longer than this is slow
+DEFAULT_STACK_THRESHOLD = 0.1   # capture the stack when blocked this long
+DEFAULT_MAX_STACKS = 20         # captured stacks kept (newest)
+
+# Step durations histogram buckets (seconds)
+STEP_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5, 1.0)
+
+
+class TaskStats:
+    """Accumulated step timings of one tracked task."""
+    __slots__ = ('name', 'steps', 'busy', 'slow_steps', 'max_step', 'step_time')
+
+    def __init__(self, name):
+        self.name = name
+        self.steps = 0              # steps run
+        self.busy = 0.0             # seconds spent running steps
+        self.slow_steps = 0         # steps longer than the slow threshold
+        self.max_step = 0.0         # longest step in seconds
+        self.step_time = LatencyHistogram(STEP_BUCKETS)
+
+    def as_dict(self):
+        """Return the statistics as a JSON-serializable dict."""
+        return {'steps': self.steps,
+                'busy_seconds': round(self.busy, 6),
+                'slow_steps': self.slow_steps,
+                'max_step_ms': round(self.max_step * 1e3, 3),
+                'step_time': self.step_time.summary()}
+
+
+class _TrackedCoroutine(collections.abc.Coroutine):
+    """Coroutine wrapper that times every step of the coroutine it wraps.
+
+    asyncio.Task accepts it because it is a collections.abc.Coroutine, and
+    drives it through send()/throw() like a native coroutine.
+    """
+
+    def __init__(self, coro, stats, monitor):
+        self._coro = coro
+        self._stats = stats
+        self._monitor = monitor
+        # names shown in Task repr
+        self.__name__ = coro.__name__
+        self.__qualname__ = coro.__qualname__
+
+    def _step(self, method, *args):
+        monitor = self._monitor
+        stats = self._stats
+        monitor.current = stats
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            monitor.current = None
+            stats.steps += 1
+            stats.busy += elapsed
+            stats.step_time.record(elapsed)
+            if elapsed > monitor.slow_threshold:
+                stats.slow_steps += 1
+            if elapsed > stats.max_step:
+                stats.max_step = elapsed
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, typ, val=None, tb=None):
+        return self._step(self._coro.throw, typ, val, tb)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    # Introspection used by Task repr and Task.get_stack()
+    @property
+    def cr_frame(self):
+        return self._coro.cr_frame
+
+    @property
+    def cr_running(self):
+        return self._coro.cr_running
+
+    @property
+    def cr_await(self):
+        return self._coro.cr_await
+
+    @property
+    def cr_code(self):
+        return self._coro.cr_code
+
+
+class LoopMonitor:
+    """Measure event loop lag and the time each tracked task holds the loop.
+
+    Args:
+        interval: seconds between lag probes
+        slow_threshold: steps longer than this (seconds) count as slow
+        stack_threshold: capture the loop thread's stack when the loop has
+            been blocked this long (seconds); None disables the watchdog
+        max_stacks: number of captured stacks kept
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, slow_threshold=DEFAULT_SLOW_THRESHOLD,
+                 stack_threshold=DEFAULT_STACK_THRESHOLD, max_stacks=DEFAULT_MAX_STACKS):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.stack_threshold = stack_threshold
+        self.tasks = {}             # name -> TaskStats
+        self.current = None         # TaskStats of the step running now
+        self.lag = LatencyHistogram()
+        self.stacks = collections.deque(maxlen=max_stacks)
+        self.blocked_events = 0     # times the watchdog found the loop blocked
+        self.started_at = None
+        self._expected_wake = None  # perf_counter time the probe should wake
+        self._captured_wake = None  # _expected_wake of the last capture
+        self._loop_thread = None
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    def track(self, coro, name=None):
+        """Wrap a coroutine so its steps are accounted to a task name.
+
+        Args:
+            coro: coroutine object
+            name: task name (default: the coroutine's name)
+
+        Returns:
+            coroutine to pass to asyncio.create_task
+        """
+        name = name or coro.__name__
+        stats = self.tasks.get(name)
+        if stats is None:
+            stats = self.tasks[name] = TaskStats(name)
+        return _TrackedCoroutine(coro, stats, self)
+
+    async def run(self):
+        """Lag probe - run as a task for as long as the loop is monitored."""
+        self._loop_thread = threading.get_ident()
+        self.started_at = time.perf_counter()
+        if self.stack_threshold is not None and self._watchdog is None:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog',
+                                              daemon=True)
+            self._watchdog.start()
+        try:
+            while True:
+                self._expected_wake = time.perf_counter() + self.interval
+                await asyncio.sleep(self.interval)
+                self.lag.record(max(0.0, time.perf_counter() - self._expected_wake))
+        finally:
+            self._expected_wake = None
+            self.stop()
+
+    def stop(self):
+        """Stop the watchdog thread."""
+        self._stop.set()
+        watchdog = self._watchdog
+        if watchdog is not None and watchdog is not threading.current_thread():
+            watchdog.join()
+        self._watchdog = None
+
+    def _watch(self):
+        """Watchdog thread: capture the loop thread's stack while it blocks."""
+        poll = self.stack_threshold / 2
+        while not self._stop.wait(poll):
+            expected = self._expected_wake
+            if expected is None or expected == self._captured_wake:
+                continue
+            blocked = time.perf_counter() - expected
+            if blocked < self.stack_threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)  # pylint: disable=protected-access
+            if frame is None:
+                continue
+            current = self.current
+            self._captured_wake = expected
+            self.blocked_events += 1
+            self.stacks.append({
+                'time': time.time(),
+                'blocked_ms': round(blocked * 1e3, 1),
+                'task': current.name if current is not None else None,
+                'stack': traceback.format_stack(frame),
+            })
+            del frame
+
+    def stats(self):
+        """Return the lag, task and stack statistics as a JSON-serializable dict."""
+        uptime = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            'uptime_seconds': round(uptime, 1),
+            'lag': self.lag.summary(),
+            'lag_max_ms': round(self.lag.maximum * 1e3, 3),
+            'blocked_events': self.blocked_events,
+            'tasks': {name: dict(stats.as_dict(),
+                                 busy_percent=round(stats.busy / uptime * 100, 2) if uptime else 0.0)
+                      for name, stats in self.tasks.items()},
+            'stacks': list(self.stacks),
+        }
+
+    def write_metrics(self, out):
+        """Add the statistics to a metrics.PrometheusText."""
+        out.histogram('efis_loop_lag_seconds', "Event loop lag seen by the probe", self.lag)
+        out.counter('efis_loop_blocked_total',
+                    f"Times the loop was blocked for over {self.stack_threshold} s",
+                    self.blocked_events)
+        for name, stats in self.tasks.items():
+            labels = {'task': name}
+            out.counter('efis_task_busy_seconds_total', "Wall time spent running task steps",
+                        stats.busy, labels)
+            out.counter('efis_task_steps_total', "Task steps run", stats.steps, labels)
+            out.counter('efis_task_slow_steps_total',
+                        f"Task steps longer than {self.slow_threshold} s",
+                        stats.slow_steps, labels)
+            out.gauge('efis_task_max_step_seconds', "Longest task step", stats.max_step, labels)
+
+    def summary(self):
+        """Multi-line text summary (printed at shutdown)."""
+        uptime = time.perf_counter() - self.started_at if self.started_at else 0.0
+        lines = [f"Event loop lag: {self.lag.summary()}, "
+                 f"blocked over {self.stack_threshold * 1e3:.0f}ms: {self.blocked_events}"]
+        for name, stats in sorted(self.tasks.items(), key=lambda item: -item[1].busy):
+            share = stats.busy / uptime * 100 if uptime else 0.0
+            lines.append(f"  {name:<24} busy {stats.busy:8.3f}s ({share:5.1f}%) "
+                         f"steps {stats.steps:8d} slow {stats.slow_steps:5d} "
+                         f"max {stats.max_step * 1e3:7.1f}ms")
+        if self.stacks:
+            newest = self.stacks[-1]
+            lines.append(f"  last blocked {newest['blocked_ms']}ms in task {newest['task']}:")
+            lines.extend("    " + line.rstrip().replace('\n', '\n    ')
+                         for line in newest['stack'][-4:])
+        return '\n'.join(lines)
+
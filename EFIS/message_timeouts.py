@@ -0,0 +1,113 @@
+"""Deadline-based staleness monitor for CAN message groups.
+
+Each message group (e.g. air data, GPS position, magnetometer) has a timeout.
+When no frame from the group arrives within its timeout the group's
+AvionicsData fields are cleared (set to None) and the optional on_expire
+callback is run, so the cleared fields can be pushed to the display at once.
+
+Rather than polling every group in a loop, each group owns at most one timer
+on the event loop (``loop.call_at``). A frame arriving only records its
+arrival time; the timer is armed if the group has none. When the timer fires
+it either finds a newer frame and re-arms for that frame's deadline, or the
+deadline really has passed and the group is cleared. Work is therefore
+proportional to timeouts, not to frames, and zero while nothing arrives.
+"""
+
+import asyncio
+
+import efis_log
+
+log = efis_log.get_logger('timeouts')
+
+
+class MessageGroup:
+    """A set of CAN message IDs whose fields go stale together.
+
+    Args:
+        name: group name (used for configuration and statistics)
+        msg_ids: CAN arbitration IDs belonging to the group
+        attrs: AvionicsData attributes cleared when the group times out
+        timeout: seconds without a frame before the group is stale
+    """
+    __slots__ = ('name', 'msg_ids', 'attrs', 'timeout',
+                 'last_received', 'handle', 'stale', 'expirations')
+
+    def __init__(self, name, msg_ids, attrs, timeout):
+        self.name = name
+        self.msg_ids = tuple(msg_ids)
+        self.attrs = tuple(attrs)
+        self.timeout = timeout
+        self.last_received = None   # loop time of the newest frame
+        self.handle = None          # pending TimerHandle, or None
+        self.stale = False          # True once cleared, until the next frame
+        self.expirations = 0        # number of times the group has gone stale
+
+
+class MessageTimeoutMonitor:
+    """Clear stale AvionicsData fields using one event-loop timer per group.
+
+    Args:
+        data: AvionicsData instance whose fields are cleared
+        groups: iterable of MessageGroup
+        loop: event loop providing time() and call_at() (default: running loop)
+        last_received_times: optional dict updated with msg ID -> loop time of
+            the last frame received
+        on_expire: optional callable(group) run after a group's fields have
+            been cleared (e.g. to mark the push groups of the fields dirty)
+    """
+
+    def __init__(self, data, groups, loop=None, last_received_times=None,
+                 on_expire=None):
+        self._data = data
+        self._loop = loop
+        self._on_expire = on_expire
+        self.groups = {group.name: group for group in groups}
+        self._group_by_id = {msg_id: group
+                             for group in self.groups.values()
+                             for msg_id in group.msg_ids}
+        self.last_received_times = (last_received_times
+                                    if last_received_times is not None else {})
+        self.wakeups = 0  # timer callbacks run - a measure of the monitor's work
+
+    def received(self, msg_id):
+        """Record the arrival of a frame. Called for every decoded frame, so
+        this only stores the time and, if needed, arms the group's timer."""
+        group = self._group_by_id.get(msg_id)
+        if group is None:
+            return
+        loop = self._loop
+        if loop is None:
+            loop = self._loop = asyncio.get_event_loop()
+        now = loop.time()
+        self.last_received_times[msg_id] = now
+        group.last_received = now
+        group.stale = False
+        if group.handle is None:
+            group.handle = loop.call_at(now + group.timeout, self._expire, group)
+
+    def _expire(self, group):
+        """Timer callback - clear the group or re-arm for a newer frame."""
+        self.wakeups += 1
+        group.handle = None
+        deadline = group.last_received + group.timeout
+        if self._loop.time() < deadline:
+            # A frame arrived since the timer was armed
+            group.handle = self._loop.call_at(deadline, self._expire, group)
+            return
+
+        for attr in group.attrs:
+            setattr(self._data, attr, None)
+        self._data.mark_changed()
+        group.stale = True
+        group.expirations += 1
+        log.info("Message group %s timed out after %ss", group.name, group.timeout)
+        if self._on_expire is not None:
+            self._on_expire(group)
+
+    def stop(self):
+        """Cancel all pending timers."""
+        for group in self.groups.values():
+            if group.handle is not None:
+                group.handle.cancel()
+                group.handle = None
+
@@ -0,0 +1,158 @@
+"""Lightweight measurement helpers shared by the EFIS server modules."""
+
+import bisect
+
+# Upper bounds (seconds) of the latency histogram buckets. The last bucket
+# (+Inf) catches everything slower.
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                           0.1, 0.2, 0.5, 1.0)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of latencies in seconds.
+
+    Recording is a bisect and two additions, so it is cheap enough to run for
+    every frame sent.
+
+    Args:
+        buckets: ascending bucket upper bounds in seconds
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        """Add one latency measurement."""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def reset(self):
+        """Clear all measurements."""
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    @property
+    def mean(self):
+        """Mean latency in seconds (0.0 when empty)."""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the given fraction
+        (0..1) of measurements. The +Inf bucket reports the maximum seen."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        running = 0
+        for index, bucket_count in enumerate(self.counts):
+            running += bucket_count
+            if running >= target and bucket_count:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], self.maximum)
+                return self.maximum
+        return self.maximum
+
+    def cumulative(self):
+        """Return [(upper bound, count of measurements <= bound)] with
+        float('inf') as the last bound (Prometheus style)."""
+        result = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            running += bucket_count
+            result.append((bound, running))
+        return result
+
+    def summary(self):
+        """One line text summary in milliseconds."""
+        return (f"n={self.count} mean={self.mean * 1e3:.1f}ms "
+                f"p50<={self.percentile(0.5) * 1e3:.1f}ms "
+                f"p99<={self.percentile(0.99) * 1e3:.1f}ms "
+                f"max={self.maximum * 1e3:.1f}ms")
+
+    def format_buckets(self):
+        """Multi-line text rendering of the buckets."""
+        lines = []
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            label = f"<= {bound * 1e3:6.1f} ms" if bound != float('inf') else f" > {lower * 1e3:6.1f} ms"
+            lines.append(f"  {label}: {bucket_count}")
+            lower = bound
+        return "\n".join(lines)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class PrometheusText:
+    """Build a Prometheus text exposition (version 0.0.4).
+
+    Samples of the same metric are grouped under one HELP/TYPE header in the
+    order the metrics were first added.
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._families = {}   # name -> (type, help, [sample lines])
+
+    def _samples(self, name, metric_type, help_text):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (metric_type, help_text, [])
+        return family[2]
+
+    def counter(self, name, help_text, value, labels=None):
+        """Add a counter sample (name should end in _total)."""
+        self._samples(name, 'counter', help_text).append(
+            f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def gauge(self, name, help_text, value, labels=None):
+        """Add a gauge sample."""
+        self._samples(name, 'gauge', help_text).append(
+            f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name, help_text, histogram, labels=None):
+        """Add a LatencyHistogram as a histogram in seconds."""
+        samples = self._samples(name, 'histogram', help_text)
+        labels = labels or {}
+        for bound, count in histogram.cumulative():
+            samples.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})}"
+                           f" {count}")
+        samples.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(histogram.total))}")
+        samples.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+    def summary(self, name, help_text, total, count, labels=None):
+        """Add a summary with only _sum and _count (no quantiles)."""
+        samples = self._samples(name, 'summary', help_text)
+        samples.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+        samples.append(f"{name}_count{_format_labels(labels)} {_format_value(count)}")
+
+    def text(self):
+        """Return the exposition text."""
+        lines = []
+        for name, (metric_type, help_text, samples) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,235 @@
+"""Change-driven scheduling of the websocket updates.
+
+Instead of sending on a fixed period, send_json waits on a PushScheduler.
+The CAN path marks a field group dirty when one of its frames is decoded;
+the scheduler then wakes, waits a short coalescing window so frames that
+arrive together (e.g. the two AHRS frames) go out in one update, and
+returns the dirty groups whose maximum rate allows a send. Groups that
+changed too soon after their last send are held until their next slot.
+
+Each group keeps a histogram of the time from the CAN frame timestamp of
+its oldest unsent change to the moment the update was sent.
+"""
+
+import asyncio
+import time
+
+from metrics import LatencyHistogram
+
+DEFAULT_COALESCE_WINDOW = 0.002  # seconds
+
+
+class PushGroup:
+    """A set of fields that are sent together at up to max_rate Hz.
+
+    Args:
+        name: group name
+        fields: AvionicsData attributes belonging to the group, or None for
+            every field not claimed by another group
+        max_rate: maximum updates per second
+        msg_ids: CAN arbitration IDs whose frames mark the group dirty
+        periodic: treat the group as always dirty, so it is sent at max_rate
+            (for fields that are not updated from CAN frames)
+    """
+    __slots__ = ('name', 'fields', 'max_rate', 'min_interval', 'msg_ids',
+                 'periodic', 'dirty', 'first_dirty', 'next_allowed', 'sends',
+                 'marks', 'latency')
+
+    def __init__(self, name, fields, max_rate, msg_ids=(), periodic=False):
+        self.name = name
+        self.fields = None if fields is None else tuple(fields)
+        self.max_rate = max_rate
+        self.min_interval = 1.0 / max_rate
+        self.msg_ids = tuple(msg_ids)
+        self.periodic = periodic
+        self.dirty = False
+        self.first_dirty = None   # wall clock timestamp of the oldest unsent change
+        self.next_allowed = 0.0   # loop time of the next permitted send
+        self.sends = 0
+        self.marks = 0
+        self.latency = LatencyHistogram()
+
+
+class PushScheduler:
+    """Wake send_json when field groups change, within per-group rate limits.
+
+    Args:
+        groups: iterable of PushGroup
+        coalesce_window: seconds to wait after the first change before
+            sending, to gather changes that arrive together
+        loop: event loop (default: the running loop)
+    """
+
+    def __init__(self, groups, coalesce_window=DEFAULT_COALESCE_WINDOW, loop=None):
+        self.groups = {group.name: group for group in groups}
+        self._group_by_id = {msg_id: group
+                             for group in self.groups.values()
+                             for msg_id in group.msg_ids}
+        self._claimed_fields = frozenset(field
+                                         for group in self.groups.values()
+                                         if group.fields is not None
+                                         for field in group.fields)
+        self.coalesce_window = coalesce_window
+        self._loop = loop
+        self._waiter = None
+        self._timer = None
+        self._timer_fired = False
+        self.wakeups = 0
+        self.updates = 0
+
+    # --- producers ----------------------------------------------------------
+
+    def mark_dirty_id(self, msg_id, timestamp=None):
+        """Mark the group of a CAN message ID dirty (no-op for other IDs)."""
+        group = self._group_by_id.get(msg_id)
+        if group is not None:
+            self._mark(group, timestamp)
+
+    def mark_dirty(self, name, timestamp=None):
+        """Mark a group dirty by name.
+
+        Args:
+            name: group name
+            timestamp: wall clock time (time.time()) of the change, e.g. the
+                CAN frame timestamp. Defaults to now.
+        """
+        self._mark(self.groups[name], timestamp)
+
+    def mark_fields(self, fields, timestamp=None):
+        """Mark every group covering one of the fields dirty (the catch-all
+        groups for fields no group claims), e.g. fields cleared on a
+        message timeout."""
+        fields = set(fields)
+        for group in self.groups.values():
+            if group.fields is None:
+                if not fields <= self._claimed_fields:
+                    self._mark(group, timestamp)
+            elif not fields.isdisjoint(group.fields):
+                self._mark(group, timestamp)
+
+    def _mark(self, group, timestamp):
+        group.marks += 1
+        if group.dirty:
+            return  # already waiting to be sent - keep the oldest timestamp
+        group.dirty = True
+        group.first_dirty = timestamp if timestamp is not None else time.time()
+        self._wake()
+
+    def request_flush(self):
+        """Send every group on the next wakeup, ignoring the rate limits
+        (e.g. a client asked for a keyframe)."""
+        now = time.time()
+        for group in self.groups.values():
+            group.next_allowed = 0.0
+            if not group.dirty:
+                group.dirty = True
+                group.first_dirty = now
+        self._wake()
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _on_timer(self):
+        self._timer = None
+        self._timer_fired = True
+        self._wake()
+
+    # --- consumer -----------------------------------------------------------
+
+    def _ready_groups(self, now):
+        return [group for group in self.groups.values()
+                if (group.dirty or group.periodic) and group.next_allowed <= now]
+
+    def _next_deadline(self):
+        deadlines = [group.next_allowed for group in self.groups.values()
+                     if group.dirty or group.periodic]
+        return min(deadlines) if deadlines else None
+
+    async def next_update(self):
+        """Wait until at least one group is due and return the due groups."""
+        loop = self._loop
+        if loop is None:
+            loop = self._loop = asyncio.get_running_loop()
+        coalesce = True
+        while True:
+            ready = self._ready_groups(loop.time())
+            if ready:
+                # Changes held back by a rate limit have been gathering
+                # already; only fresh changes wait for the coalescing window
+                if coalesce and self.coalesce_window:
+                    await asyncio.sleep(self.coalesce_window)
+                    ready = self._ready_groups(loop.time())
+                self.updates += 1
+                return ready
+
+            self._waiter = loop.create_future()
+            deadline = self._next_deadline()
+            if deadline is not None:
+                self._timer = loop.call_at(deadline, self._on_timer)
+            self._timer_fired = False
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            coalesce = not self._timer_fired
+            self.wakeups += 1
+
+    def sent(self, groups, record=True):
+        """Record that the given groups were sent: update the latency
+        histograms and start the groups' rate limit intervals.
+
+        Send slots follow a fixed grid of min_interval so the delay of one
+        send does not push back every later one; after an idle period the
+        next send may follow no sooner than half an interval.
+
+        Args:
+            groups: groups returned by next_update()
+            record: False when nothing was actually sent (no client), so the
+                latency histograms only reflect real sends
+        """
+        now = time.time()
+        loop_now = self._loop.time() if self._loop is not None else 0.0
+        for group in groups:
+            if record and group.dirty and group.first_dirty is not None:
+                group.latency.record(max(0.0, now - group.first_dirty))
+            group.dirty = False
+            group.first_dirty = None
+            group.next_allowed = max(group.next_allowed + group.min_interval,
+                                     loop_now + group.min_interval / 2)
+            group.sends += 1
+
+    def oldest_change(self, groups):
+        """Return the timestamp of the oldest unsent change of the given
+        groups (e.g. the CAN frame timestamp), or None if none is dirty."""
+        timestamps = [group.first_dirty for group in groups
+                      if group.dirty and group.first_dirty is not None]
+        return min(timestamps) if timestamps else None
+
+    def fields_of(self, groups, all_fields):
+        """Return the set of fields covered by the given groups.
+
+        Args:
+            groups: groups returned by next_update()
+            all_fields: every field name (used for catch-all groups)
+        """
+        fields = set()
+        for group in groups:
+            if group.fields is None:
+                fields.update(field for field in all_fields
+                              if field not in self._claimed_fields)
+            else:
+                fields.update(group.fields)
+        return fields
+
+    def stats(self):
+        """Return per-group send statistics as a dict."""
+        return {name: {'marks': group.marks,
+                       'sends': group.sends,
+                       'latency': group.latency.summary()}
+                for name, group in self.groups.items()}
+
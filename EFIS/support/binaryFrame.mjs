@@ -0,0 +1,92 @@
+// 17-Oct-2026 - Decoder for the binary websocket frame (binary_frame.py)
+'use strict';
+
+/**
+ * Version of the binary frame layout understood by this decoder. Must match
+ * BINARY_PROTOCOL_VERSION in binary_frame.py.
+ */
+export const BINARY_PROTOCOL_VERSION = 1;
+
+// Size in bytes and DataView getter for each struct code used by the server
+const FIELD_TYPES = {
+    'h': [2, 'getInt16'],
+    'i': [4, 'getInt32'],
+    'B': [1, 'getUint8'],
+};
+
+/**
+ * [field name, struct code, scale] in frame order. The index of a field is
+ * its bit in the presence bitmask. Must be kept identical to BINARY_FIELDS
+ * in binary_frame.py.
+ */
+export const BINARY_FIELDS = [
+    // Attitude
+    ['yaw', 'h', 10],
+    ['pitch', 'h', 10],
+    ['roll', 'h', 10],
+    ['turn_rate', 'h', 10],
+    ['accx', 'h', 1],
+    ['accy', 'h', 1],
+    ['accz', 'h', 1],
+    // Air data
+    ['airspeed', 'h', 1],
+    ['altitude', 'i', 1],
+    ['vsi', 'h', 1],
+    ['static_pressure', 'h', 1],
+    ['differential_pressure', 'h', 1],
+    ['temperature', 'h', 1],
+    ['oat', 'h', 10],
+    ['aoa', 'h', 1],
+    // GPS
+    ['latitude', 'i', 1],
+    ['longitude', 'i', 1],
+    ['gps_speed', 'h', 1],
+    ['gps_altitude', 'h', 1],
+    ['true_track', 'h', 1],
+    // Navigation
+    ['dtk', 'h', 10],
+    ['bearing', 'h', 10],
+    ['xtrack', 'i', 100],
+    ['dist', 'i', 10],
+    // Input
+    ['position', 'i', 1],
+    ['pressed', 'B', 1],
+];
+
+// version (u8), reserved (u8), sequence (u16), presence bitmask (u32)
+const HEADER_SIZE = 8;
+
+/**
+ * Decode a binary frame into an object, updating the fields in place.
+ * @param {ArrayBuffer} buffer The binary websocket message
+ * @param {object} target The object that receives the fields. Fields that
+ *     are not present in the frame are set to null.
+ * @returns {number} The frame sequence number, or -1 if the frame version is
+ *     not supported (target is left unchanged)
+ */
+export function decodeBinaryFrame(buffer, target) {
+    const view = new DataView(buffer);
+    if (view.getUint8(0) !== BINARY_PROTOCOL_VERSION) {
+        return -1;
+    }
+    const sequence = view.getUint16(2, true);
+    const presence = view.getUint32(4, true);
+
+    let offset = HEADER_SIZE;
+    for (let bit = 0; bit < BINARY_FIELDS.length; bit++) {
+        const [name, code, scale] = BINARY_FIELDS[bit];
+        const [size, getter] = FIELD_TYPES[code];
+        if (presence & (1 << bit)) {
+            const value = view[getter](offset, true);
+            if (code === 'B') {
+                target[name] = value !== 0;
+            } else {
+                target[name] = scale === 1 ? value : value / scale;
+            }
+        } else {
+            target[name] = null;
+        }
+        offset += size;
+    }
+    return sequence;
+}
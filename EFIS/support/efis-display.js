@@ -39,6 +39,7 @@ import { SoftButtons } from './softButtons.mjs';
 import { MenuOverlay } from './menuOverlay.mjs';
 import { HSI } from './hsi.mjs';
 import { RouteOverlay } from './routeOverlay.mjs';
+import { decodeBinaryFrame } from './binaryFrame.mjs';
 
 
 
@@ -163,13 +164,18 @@ dataObject.magz = 0.0;
 // --- objects.                                                             ---
 // ----------------------------------------------------------------------------
 
+var lastSequence = null;         // sequence number of the last update applied
+var keyframeRequested = false;   // true while waiting for a requested keyframe
+var USE_BINARY_FRAMES = true;    // ask for the high-rate fields as binary frames
+
 var webSocketURL = "ws://" + location.host + "/ws";
 var myWebSocket = new WebSocket(webSocketURL);
+myWebSocket.binaryType = 'arraybuffer';
 
 // listen for the 'open' event and respond with "ready"
 myWebSocket.addEventListener('open', function(event){
     // Let the server know we are ready for data
-    myWebSocket.send("ready")
+    myWebSocket.send(USE_BINARY_FRAMES ? "ready binary" : "ready")
 })
 
 // ----------------------------------------------------------------------------
@@ -238,9 +244,45 @@ myWebSocket.onmessage = RecieveWebSocketMessage;
 // ----------------------------------------------------------------------------
 
 function RecieveWebSocketMessage(event) {
+    if (event.data instanceof ArrayBuffer) {
+        // Binary frame with the high-rate fields (see binaryFrame.mjs)
+        decodeBinaryFrame(event.data, dataObject);
+        return;
+    }
+
     // parse the event.data into a data object
     // this will contain the data from the CAN bus
-    dataObject = JSON.parse(event.data);
+    let message = JSON.parse(event.data);
+
+    if (message.input !== undefined) {
+        // Encoder/button change pushed as soon as it is read. Merge it into
+        // the current data so the next animation frame acts on it.
+        dataObject.position = message.input.position;
+        dataObject.pressed = message.input.pressed;
+        return;
+    }
+
+    if (message.seq !== undefined) {
+        // Delta mode: keyframes carry every field, deltas only the fields
+        // that changed. A missing sequence number means a delta was lost,
+        // so ask for a keyframe and ignore deltas until it arrives.
+        if (message.key) {
+            // Merge rather than replace so fields received in binary
+            // frames are kept
+            Object.assign(dataObject, message.data);
+            lastSequence = message.seq;
+            keyframeRequested = false;
+        } else if (lastSequence !== null && message.seq === lastSequence + 1) {
+            Object.assign(dataObject, message.data);
+            lastSequence = message.seq;
+        } else if (!keyframeRequested) {
+            keyframeRequested = true;
+            lastSequence = null;
+            myWebSocket.send("keyframe");
+        }
+        return;
+    }
+    dataObject = message;
 }
 
 
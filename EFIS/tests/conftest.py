@@ -0,0 +1,39 @@
+"""pytest configuration for the EFIS server tests.
+
+Run from the EFIS directory:
+
+    python -m pytest -q tests
+
+The tests import the server modules from the parent directory, need no CAN
+interface, encoder or backlight, and are not copied to the Pi by
+copytopiefis.sh. Tests that need a virtual CAN interface are skipped unless
+one is up (EFIS_VCAN, default vcan0):
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import efis_log  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture(autouse=True)
+def quiet_logs():
+    """Keep expected warnings (missing plans, cleared fields) out of the output."""
+    efis_log.set_level('all', 'ERROR')
+
+
+@pytest.fixture
+def vcan_channel():
+    """Name of an up virtual CAN interface; skips the test without one."""
+    channel = os.environ.get('EFIS_VCAN', 'vcan0')
+    if not Path(f"/sys/class/net/{channel}").exists():
+        pytest.skip(f"virtual CAN interface {channel} is not up")
+    pytest.importorskip('can')
+    return channel
@@ -0,0 +1,17 @@
+// Decode binary frames with support/binaryFrame.mjs for test_binary_frame.py
+//
+// stdin:  JSON list of frames, each a hex string
+// stdout: JSON {"fields": BINARY_FIELDS, "frames": [[sequence, {field: value}], ...]}
+'use strict';
+
+import { readFileSync } from 'node:fs';
+import { BINARY_FIELDS, decodeBinaryFrame } from '../support/binaryFrame.mjs';
+
+const frames = JSON.parse(readFileSync(0, 'utf8')).map((hex) => {
+    const bytes = Buffer.from(hex, 'hex');
+    const buffer = bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length);
+    const target = {};
+    const sequence = decodeBinaryFrame(buffer, target);
+    return [sequence, target];
+});
+process.stdout.write(JSON.stringify({ fields: BINARY_FIELDS, frames }));
@@ -0,0 +1,75 @@
+"""AvionicsData change tracking: versions, changed-groups mask, snapshots."""
+
+import json
+import random
+
+import pytest
+
+import aio_server
+from benchmark import synthetic_payload
+from can_reader import CanFrame
+from avionics_data import (ALL_GROUPS, FIELD_GROUPS, FIELDS, GROUP_BITS, AvionicsData,
+                           group_mask)
+
+
+def test_snapshot_refreshed_only_after_mark_changed():
+    data = AvionicsData()
+    assert data.snapshot()['direct_to_active'] is False
+    start_version = data.version
+    first = data.snapshot_json()
+    data.pitch = 2.5
+    data.latitude = 43_130_000
+    assert data.snapshot()['pitch'] is None
+    assert data.snapshot_json() is first
+    data.mark_changed()
+    assert data.version == start_version + 1
+    assert data.snapshot()['pitch'] == 2.5 and data.snapshot()['latitude'] == 43_130_000
+    assert data.snapshot_json() is data.snapshot_json()
+    assert json.loads(data.snapshot_json()) == {field: getattr(data, field) for field in FIELDS}
+
+
+def test_only_the_marked_groups_are_refreshed():
+    data = AvionicsData()
+    data.pitch = 2.5
+    data.latitude = 43_130_000
+    data.mark_changed(GROUP_BITS['attitude'])
+    assert data.snapshot()['pitch'] == 2.5
+    assert data.snapshot()['latitude'] is None      # gps group not marked
+    data.mark_changed(GROUP_BITS['gps'])
+    assert data.snapshot()['latitude'] == 43_130_000
+
+
+def test_group_versions_and_dirty_mask():
+    data = AvionicsData()
+    data.mark_changed(GROUP_BITS['attitude'])
+    data.mark_changed(GROUP_BITS['gps'] | GROUP_BITS['time'])
+    assert data.group_version('attitude') == 1
+    assert data.group_version('gps') == data.group_version('time') == 2
+    assert data.group_version('navigation') == 0
+    assert data.take_dirty() == GROUP_BITS['attitude'] | GROUP_BITS['gps'] | GROUP_BITS['time']
+    assert data.dirty == 0
+    data.mark_changed()
+    assert data.take_dirty() == ALL_GROUPS
+    assert all(data.group_version(name) == 3 for name in FIELD_GROUPS)
+
+
+def test_group_mask():
+    assert group_mask(['yaw', 'accz']) == GROUP_BITS['attitude']
+    assert group_mask(['wpt_id', 'position']) == GROUP_BITS['navigation'] | GROUP_BITS['input']
+    with pytest.raises(KeyError):
+        group_mask(['no_such_field'])
+
+
+def test_a_decoded_frame_reaches_the_snapshot():
+    """dispatch_can_message marks the groups of every field the decoder
+    writes, so each decoded value shows up in the next snapshot."""
+    rng = random.Random(3)
+    for entry in aio_server.CAN_MESSAGE_SCHEMA:
+        data = AvionicsData()
+        data.snapshot()
+        payload = synthetic_payload(entry.msg_id, rng)
+        msg = CanFrame(0.0, entry.msg_id, False, False, False, len(payload), payload)
+        assert aio_server.dispatch_can_message(msg, data, {})
+        snapshot = data.snapshot()
+        assert {attr: snapshot[attr] for attr in entry.attrs} == entry.decode(payload), entry.name
+        assert data.take_dirty() == group_mask(entry.attrs)
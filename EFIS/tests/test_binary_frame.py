@@ -0,0 +1,83 @@
+"""Binary websocket frames: Python round trip and the JavaScript decoder."""
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from binary_frame import (BINARY_FIELD_NAMES, BINARY_FIELDS, BinaryFrameEncoder,
+                          decode_binary_frame, split_snapshot)
+
+JS_DECODER = Path(__file__).with_name('decode_binary_frame.mjs')
+
+SAMPLE = {
+    'yaw': 271.3, 'pitch': -2.5, 'roll': 15.7, 'turn_rate': -0.4,
+    'accx': -3, 'accy': 12, 'accz': 981, 'airspeed': 124, 'altitude': 5525,
+    'vsi': -250, 'static_pressure': 9512, 'differential_pressure': 612,
+    'temperature': 11, 'oat': 8.5, 'aoa': None, 'latitude': 43_130_512,
+    'longitude': -80_340_777, 'gps_speed': 128, 'gps_altitude': 5490,
+    'true_track': 92, 'dtk': 91.0, 'bearing': 91.4, 'xtrack': -0.12,
+    'dist': 37.9, 'position': -17, 'pressed': False,
+    # JSON-only fields
+    'can_qnh': 2992.0, 'gps_satellites': 9, 'wpt_id': 'KBUF',
+    'route_waypoints': [{'id': 'WPT00', 'type': 'USER WAYPOINT'}],
+}
+
+# Out-of-range values saturate, NaN / infinity are sent as absent
+EXTREME = dict(SAMPLE, vsi=-40_000, pitch=4000.0, altitude=3e9,
+               roll=float('nan'), yaw=float('inf'), pressed=True)
+EXTREME_DECODED = dict(
+    {name: SAMPLE[name] for name in BINARY_FIELD_NAMES},
+    vsi=-32768, pitch=3276.7, altitude=0x7FFFFFFF, roll=None, yaw=None, pressed=True)
+
+
+def _frames():
+    encoder = BinaryFrameEncoder()
+    return [encoder.encode(SAMPLE), encoder.encode(EXTREME)]
+
+
+def test_round_trip():
+    sequence, decoded = decode_binary_frame(_frames()[0])
+    assert sequence == 1
+    assert decoded == {name: SAMPLE[name] for name in BINARY_FIELD_NAMES}
+    assert set(split_snapshot(SAMPLE)) == {'can_qnh', 'gps_satellites', 'wpt_id',
+                                           'route_waypoints'}
+
+
+def test_saturated_and_not_finite_values():
+    sequence, decoded = decode_binary_frame(_frames()[1])
+    assert sequence == 2
+    assert decoded == EXTREME_DECODED
+
+
+def test_sequence_wraps():
+    encoder = BinaryFrameEncoder()
+    encoder.sequence = 0xFFFF
+    assert decode_binary_frame(encoder.encode(SAMPLE))[0] == 0
+
+
+def test_unknown_version_is_rejected():
+    frame = b'\x02' + _frames()[0][1:]
+    with pytest.raises(ValueError):
+        decode_binary_frame(frame)
+
+
+def test_javascript_decoder_matches():
+    """Frames encoded here decode to the same values in binaryFrame.mjs."""
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip("node is not installed")
+    frames = _frames() + [b'\x02' + _frames()[0][1:]]
+    result = subprocess.run([node, str(JS_DECODER)],
+                            input=json.dumps([frame.hex() for frame in frames]),
+                            capture_output=True, text=True, check=True, timeout=30)
+    decoded = json.loads(result.stdout)
+    assert [tuple(field) for field in decoded['fields']] == list(BINARY_FIELDS)
+    (sequence, normal), (extreme_sequence, extreme), (bad_sequence, bad) = decoded['frames']
+    assert sequence == 1
+    assert normal == {name: SAMPLE[name] for name in BINARY_FIELD_NAMES}
+    assert extreme_sequence == 2
+    assert extreme == EXTREME_DECODED
+    assert bad_sequence == -1 and bad == {}
@@ -0,0 +1,49 @@
+"""Bulk log decoding gives exactly the values of the live decoders."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark import write_random_log
+from can_recorder import LOG_SUFFIX, iter_records
+from can_schema import CAN_MESSAGE_SCHEMA, build_handlers
+
+np = pytest.importorskip('numpy')
+can_decode = pytest.importorskip('can_decode')
+
+
+def test_columns_match_the_live_decoders(tmp_path):
+    path = tmp_path / f"random{LOG_SUFFIX}"
+    write_random_log(path, 50_000)
+    decoded = can_decode.decode_log(path)
+
+    handlers = build_handlers()
+    names = {entry.msg_id: entry.name for entry in CAN_MESSAGE_SCHEMA}
+    rows = {name: 0 for name in names.values()}
+    short = 0
+    for timestamp, msg_id, _, _, data in iter_records(path):
+        target = SimpleNamespace()
+        if not handlers[msg_id](SimpleNamespace(data=data), target, None):
+            short += 1          # rejected live, and not in the columns either
+            continue
+        name = names[msg_id]
+        columns = decoded[name]
+        index = rows[name]
+        assert columns['timestamp'][index] == timestamp
+        for attr, value in vars(target).items():
+            column_value = columns[attr][index].item()
+            assert column_value == value or (value != value and column_value != column_value), \
+                (name, attr, index, column_value, value)
+        rows[name] += 1
+    assert short == 50
+    assert rows == {name: len(columns['timestamp']) for name, columns in decoded.items()}
+
+
+def test_directory_of_logs_and_npz(tmp_path):
+    write_random_log(tmp_path / f"a{LOG_SUFFIX}", 1000, seed=1)
+    write_random_log(tmp_path / f"b{LOG_SUFFIX}", 1000, seed=2)
+    decoded = can_decode.decode_log(tmp_path)
+    assert sum(len(columns['timestamp']) for columns in decoded.values()) == 2 * 999
+    can_decode.save_npz(decoded, tmp_path / 'columns.npz')
+    with np.load(tmp_path / 'columns.npz') as saved:
+        assert np.array_equal(saved['AHRS_ORIENT.yaw'], decoded['AHRS_ORIENT']['yaw'])
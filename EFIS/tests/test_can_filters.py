@@ -0,0 +1,56 @@
+"""Kernel acceptance filters and the rejected traffic audit."""
+
+import asyncio
+
+import pytest
+
+import aio_server
+
+
+def test_filters_accept_exactly_the_handled_ids():
+    filters = aio_server.build_can_filters({0x48: None, 0x28: None})
+    assert filters == [{'can_id': 0x28, 'can_mask': 0x7FF, 'extended': False},
+                       {'can_id': 0x48, 'can_mask': 0x7FF, 'extended': False}]
+    assert {f['can_id'] for f in aio_server.build_can_filters()} == \
+        set(aio_server.CAN_MESSAGE_HANDLERS)
+
+
+def _run_audit(monkeypatch, by_id, rounds=3):
+    """Run the audit for a few intervals on a bus where the interface sees
+    100 frames per interval and 60 of them reach process_can_messages."""
+    stats = aio_server.CanStatistics()
+    counter = {'rx': 1000}
+    sampled = []
+
+    def rx_packets(_channel):
+        return counter['rx']
+
+    async def count_frames_by_id(_channel, _duration):
+        sampled.append(True)
+        return {0x48: 10, 0x7E0: 4}
+
+    async def fake_sleep(_seconds):
+        if len(sampled) >= rounds or counter['rx'] >= 1000 + 100 * rounds:
+            raise asyncio.CancelledError
+        counter['rx'] += 100
+        stats.frames_received += 60
+
+    monkeypatch.setattr(aio_server, 'read_interface_rx_packets', rx_packets)
+    monkeypatch.setattr(aio_server, 'count_frames_by_id', count_frames_by_id)
+    monkeypatch.setattr(aio_server, 'CAN_FILTER_AUDIT_BY_ID', by_id)
+    monkeypatch.setattr(aio_server.asyncio, 'sleep', fake_sleep)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(aio_server.audit_can_filters(stats, 'can0'))
+    return stats, sampled
+
+
+def test_audit_uses_only_the_interface_counter_by_default(monkeypatch):
+    stats, sampled = _run_audit(monkeypatch, by_id=False)
+    assert not sampled                      # no unfiltered socket opened
+    assert stats.rejected_total == 3 * 40 and stats.rejected_by_id == {}
+
+
+def test_per_id_audit_samples_the_unfiltered_bus(monkeypatch):
+    stats, sampled = _run_audit(monkeypatch, by_id=True)
+    assert len(sampled) == 3
+    assert stats.rejected_by_id == {0x7E0: 12}   # handled IDs are not counted
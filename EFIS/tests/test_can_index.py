@@ -0,0 +1,86 @@
+"""Sidecar index of CAN recordings and GPS UTC / relative range queries."""
+
+import io
+import itertools
+import tracemalloc
+
+import pytest
+
+from benchmark import GPS_RECORDING_CLOCK_ERROR, GPS_RECORDING_UTC_START, record_gps_flight
+from can_index import (IndexBuilder, LogIndex, build_index, index_path, load_index, parse_time,
+                       query, recording_start, write_csv)
+from can_recorder import iter_records, log_files
+
+RATE = 2200
+SECONDS = 120
+
+
+class Discard:
+    """Text stream that throws the output away."""
+
+    def write(self, text):
+        return len(text)
+
+
+@pytest.fixture(scope='module')
+def recording(tmp_path_factory):
+    """Two minutes of full bus load in several files, GPS time in TIME_SYNC
+    frames and the Pi's clock 400 days off."""
+    directory = tmp_path_factory.mktemp('recording')
+    recorder = record_gps_flight(directory, SECONDS, RATE, max_file_bytes=2 * 1024 * 1024)
+    assert recorder.frames_dropped == 0
+    return directory
+
+
+def test_every_file_is_indexed(recording):
+    paths = log_files(recording)
+    assert len(paths) > 1
+    assert all(index_path(path).exists() for path in paths)
+    assert sum(load_index(path).records for path in paths) == RATE * SECONDS
+
+
+def test_recorder_index_matches_a_rebuilt_one(recording):
+    path = log_files(recording)[0]
+    recorded = LogIndex.load(index_path(path))
+    rebuilt = build_index(path)
+    assert (recorded.blocks, recorded.id_counts) == (rebuilt.blocks, rebuilt.id_counts)
+    per_record = IndexBuilder()
+    for timestamp, can_id, _, dlc, data in iter_records(path):
+        per_record.add(timestamp, can_id, dlc, data)
+    per_record = per_record.finish(recorded.log_size)
+    assert (recorded.blocks, recorded.id_counts) == (per_record.blocks, per_record.id_counts)
+
+
+def test_utc_range_is_exact_despite_the_wrong_clock(recording):
+    event = GPS_RECORDING_UTC_START + 60          # 12:01:00 UTC
+    frames = list(query(recording, event - 15, event + 15, utc=True))
+    assert len(frames) == 30 * RATE
+    scanned = sum(1 for path in log_files(recording) for record in iter_records(path)
+                  if event - 15 <= record[0] - GPS_RECORDING_CLOCK_ERROR < event + 15)
+    assert scanned == len(frames)
+    output = io.StringIO()
+    write_csv(itertools.islice(iter(frames), 1), output)
+    assert ',2025-10-09T12:00:45.000Z,' in output.getvalue()
+
+
+def test_relative_range(recording):
+    origin = recording_start(recording)
+    frames = list(query(recording, origin + 60, origin + 61))
+    assert len(frames) == RATE and frames[0][0] == origin + 60
+
+
+def test_memory_does_not_grow_with_the_range(recording):
+    peaks = []
+    for length in (1, 4, 16):
+        tracemalloc.start()
+        write_csv(query(recording, GPS_RECORDING_UTC_START + 10,
+                        GPS_RECORDING_UTC_START + 10 + length, utc=True), Discard())
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    assert max(peaks) < 2 * min(peaks), peaks
+
+
+def test_parse_time():
+    assert parse_time('+90') == (90.0, False)
+    assert parse_time('2025-10-09T12:00:30Z') == (GPS_RECORDING_UTC_START + 30, True)
+    assert parse_time('2025-10-09T14:00:30+02:00') == (GPS_RECORDING_UTC_START + 30, True)
@@ -0,0 +1,77 @@
+"""SocketCANReader: frame parsing, batched draining and a vcan round trip."""
+
+import asyncio
+import socket
+import time
+
+import pytest
+
+from can_reader import (CAN_EFF_FLAG, CAN_FRAME_STRUCT, CAN_RTR_FLAG, SO_TIMESTAMPNS,
+                        TIMESPEC_STRUCT, SocketCANReader, parse_can_frame)
+
+
+def raw_frame(can_id, data):
+    return CAN_FRAME_STRUCT.pack(can_id, len(data), data.ljust(8, b'\0'))
+
+
+def test_parse_standard_frame_uses_the_kernel_timestamp():
+    ancdata = [(socket.SOL_SOCKET, SO_TIMESTAMPNS, TIMESPEC_STRUCT.pack(1_700_000_000, 250_000_000))]
+    frame = parse_can_frame(raw_frame(0x48, b'\x01\x02\x03'), ancdata)
+    assert frame.arbitration_id == 0x48 and not frame.is_extended_id
+    assert frame.dlc == 3 and frame.data == b'\x01\x02\x03'
+    assert frame.timestamp == pytest.approx(1_700_000_000.25)
+
+
+def test_parse_extended_and_remote_frames():
+    frame = parse_can_frame(raw_frame(CAN_EFF_FLAG | 0x1ABCDEF0, b''), [])
+    assert frame.is_extended_id and frame.arbitration_id == 0x1ABCDEF0
+    assert abs(frame.timestamp - time.time()) < 1.0   # no kernel timestamp
+    frame = parse_can_frame(raw_frame(CAN_RTR_FLAG | 0x7FF, b''), [])
+    assert frame.is_remote_frame and frame.arbitration_id == 0x7FF
+
+
+def test_reader_drains_in_batches_and_skips_short_frames():
+    async def run():
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        reader = SocketCANReader(ours, batch_size=4)
+        reader.start()
+        try:
+            theirs.send(b'\0' * 8)    # a truncated frame - ignored
+            for index in range(10):
+                theirs.send(raw_frame(0x28 + index, bytes([index] * 8)))
+            frames = [await asyncio.wait_for(reader.get_message(), 1.0) for _ in range(10)]
+        finally:
+            reader.stop()
+            ours.close()
+            theirs.close()
+        return reader, frames
+
+    reader, frames = asyncio.run(run())
+    assert [frame.arbitration_id for frame in frames] == list(range(0x28, 0x32))
+    assert frames[9].data == bytes([9] * 8)
+    assert reader.frames_received == 10 and reader.max_batch == 4 and reader.batches >= 3
+
+
+def test_vcan_round_trip(vcan_channel, frames=2000):
+    import can  # pylint: disable=import-outside-toplevel,import-error
+
+    async def run():
+        bus = can.Bus(interface='socketcan', channel=vcan_channel)
+        reader = SocketCANReader.from_bus(bus)
+        reader.start()
+        try:
+            with can.Bus(interface='socketcan', channel=vcan_channel) as tx_bus:
+                for index in range(frames):
+                    tx_bus.send(can.Message(arbitration_id=0x48, is_extended_id=False,
+                                            data=index.to_bytes(2, 'little')))
+                    if index % 64 == 63:
+                        await asyncio.sleep(0)   # let the reader drain
+            return [await asyncio.wait_for(reader.get_message(), 2.0) for _ in range(frames)]
+        finally:
+            reader.stop()
+            bus.shutdown()
+
+    received = asyncio.run(run())
+    assert [int.from_bytes(frame.data, 'little') for frame in received] == list(range(frames))
+    assert all(later.timestamp >= earlier.timestamp
+               for earlier, later in zip(received, received[1:]))
@@ -0,0 +1,75 @@
+"""CanRecorder: every frame written, bounded files, drops instead of blocking."""
+
+import asyncio
+import threading
+
+from benchmark import record_synthetic, record_vcan
+from can_index import load_index
+from can_reader import CanFrame
+from can_recorder import RECORD, CanRecorder, iter_records, log_files
+
+
+def _frame(index, extended=False):
+    return CanFrame(1_700_000_000 + index / 1000, 0x1234567 if extended else 0x48,
+                    extended, False, False, 3, bytes((index % 256, 2, 3)))
+
+
+def test_full_load_is_written_without_drops(tmp_path):
+    frames, _, recorder = record_synthetic(5.0, tmp_path)
+    written = sum(1 for path in log_files(tmp_path) for _ in iter_records(path))
+    assert recorder.frames_dropped == 0 and recorder.write_errors == 0
+    assert written == frames == recorder.frames_recorded == recorder.frames_written
+
+
+def test_records_round_trip(tmp_path):
+    recorder = CanRecorder(tmp_path, chunk_records=4)
+    recorder.start()
+    recorder.record_batch([_frame(index, extended=index % 2) for index in range(10)])
+    recorder.stop()
+    (path,) = log_files(tmp_path)
+    records = list(iter_records(path))
+    assert records == [(frame.timestamp, frame.arbitration_id, frame.is_extended_id,
+                        frame.dlc, frame.data)
+                       for frame in (_frame(index, extended=index % 2) for index in range(10))]
+    assert load_index(path).records == 10
+
+
+def test_files_rotate_and_the_oldest_are_deleted(tmp_path):
+    chunk = 16
+    recorder = CanRecorder(tmp_path, chunk_records=chunk,
+                           max_file_bytes=2 * chunk * RECORD.size + 64,
+                           max_total_bytes=5 * chunk * RECORD.size)
+    recorder.start()
+    for index in range(10 * chunk):
+        recorder.record(_frame(index))
+    recorder.stop()
+    assert recorder.files_opened == 5 and recorder.files_deleted >= 2
+    kept = sum(1 for path in log_files(tmp_path) for _ in iter_records(path))
+    assert 0 < kept < 10 * chunk
+    assert recorder.frames_written == 10 * chunk
+
+
+def test_a_slow_writer_drops_chunks_instead_of_blocking(tmp_path):
+    recorder = CanRecorder(tmp_path, chunk_records=4, max_pending_chunks=2)
+    release = threading.Event()
+    write = recorder._write
+    recorder._write = lambda chunk: (release.wait(5.0), write(chunk))
+    recorder.start()
+    for index in range(4 * 10):
+        recorder.record(_frame(index))          # returns at once
+    release.set()
+    recorder.stop()
+    assert recorder.frames_dropped == 4 * 8
+    assert recorder.frames_written == 4 * 2
+    assert recorder.frames_recorded == 40
+
+
+def test_vcan_full_load_is_recorded(vcan_channel, tmp_path):
+    """Saturated virtual bus for a few seconds: every frame the reader
+    delivered is on disk (the CPU overhead is measured by
+    "python benchmark.py --vcan")."""
+    frames, _, recorder = asyncio.run(record_vcan(vcan_channel, 3.0, tmp_path, True))
+    written = sum(1 for path in log_files(tmp_path) for _ in iter_records(path))
+    assert frames > 0
+    assert recorder.frames_dropped == 0
+    assert written == frames == recorder.frames_recorded
@@ -0,0 +1,24 @@
+"""CanReplay reproduces the same state whatever the replay speed."""
+
+from benchmark import REPLAY_START, replay_flight
+
+
+def test_replay_is_deterministic_at_every_speed():
+    fast, again, paced = replay_flight(60.0, (None, None, 120.0))
+    assert fast.digest() == again.digest() == paced.digest()
+    assert fast.checkpoints == paced.checkpoints
+    assert fast.transmitted == again.transmitted == paced.transmitted
+    stats = paced.stats()
+    assert stats['frames_failed'] == 0
+    assert stats['frames'] == fast.stats()['frames'] > 0
+
+
+def test_replay_runs_timeouts_navigation_and_qnh_on_log_time():
+    (engine,) = replay_flight(60.0, (None,))
+    stats = engine.stats()
+    # the AHRS is silent for one second of the flight
+    assert stats['expirations'] == {'ahrs_orient': 1, 'ahrs_accel': 1}
+    # 600 kt north from 43.0: WPT1 (6 NM) is passed after 36 s
+    assert engine.data.wpt_id == 'WPT2' and engine.data.active_leg == 2
+    assert engine.data.nav_time is not None and engine.data.nav_time > REPLAY_START + 59
+    assert stats['transmitted'] > 0
@@ -0,0 +1,69 @@
+"""CAN message schema: encode/decode round trips and the generated decoders."""
+
+import struct
+import traceback
+from types import SimpleNamespace
+
+import pytest
+
+from avionics_data import AvionicsData
+from can_schema import CAN_MESSAGE_SCHEMA, CAN_SCHEMA_BY_NAME, build_handlers, make_decoder
+
+
+@pytest.mark.parametrize('entry', CAN_MESSAGE_SCHEMA, ids=lambda entry: entry.name)
+def test_zero_payload_round_trip(entry):
+    payload = bytes(entry.size)
+    assert entry.encode(entry.decode(payload)) == payload
+
+
+def test_qnh_round_trip_keeps_the_accuracy_multiplier():
+    entry = CAN_SCHEMA_BY_NAME['QNH']
+    assert entry.decode(entry.encode({'can_qnh_hpa': 1013, 'can_qnh': 2992})) == \
+        {'can_qnh_hpa': 1013, 'can_qnh': 2992.0}
+
+
+def test_decoders_store_engineering_values():
+    handlers = build_handlers()
+    assert set(handlers) == {entry.msg_id for entry in CAN_MESSAGE_SCHEMA}
+    data = AvionicsData()
+    frames = {
+        'AHRS_ORIENT': struct.pack('<hhhh', 1234, -56, 789, 12),
+        'GPS3': struct.pack('<BBBxhh', 1, 3, 9, 123, 456),
+        'TIME_SYNC': struct.pack('<bbbbbb2x', 26, 10, 17, 21, 47, 5),
+        'OAT': struct.pack('<hB5x', 85, 40),
+    }
+    for name, payload in frames.items():
+        entry = CAN_SCHEMA_BY_NAME[name]
+        assert handlers[entry.msg_id](SimpleNamespace(data=payload), data, {}) is True
+    assert (data.yaw, data.pitch, data.roll, data.turn_rate) == (123.4, -5.6, 78.9, 1.2)
+    assert (data.gps_satellites, data.gps_hdop, data.gps_vdop) == (9, 1.2, 4.6)
+    assert (data.tm_year, data.tm_sec) == (2026, 5)
+    assert data.oat == 8.5
+
+
+def test_decoder_matches_the_entry_decode():
+    for entry in CAN_MESSAGE_SCHEMA:
+        payload = bytes(range(1, entry.size + 1))
+        data = SimpleNamespace()
+        make_decoder(entry)(SimpleNamespace(data=payload), data, {})
+        assert vars(data) == entry.decode(payload), entry.name
+
+
+def test_short_payload_is_rejected_and_post_hook_result_returned():
+    entry = CAN_SCHEMA_BY_NAME['GPS1']
+    seen = []
+    decoder = make_decoder(entry, post=lambda msg, data: seen.append(data.latitude) or False)
+    data = SimpleNamespace()
+    assert decoder(SimpleNamespace(data=bytes(4)), data, {}) is False and not vars(data)
+    assert decoder(SimpleNamespace(data=struct.pack('<ll', 43_000_000, -80_000_000)),
+                   data, {}) is False
+    assert seen == [43_000_000]
+
+
+def test_generated_source_shows_in_tracebacks():
+    decoder = make_decoder(CAN_SCHEMA_BY_NAME['AHRS_ORIENT'])
+    with pytest.raises(AttributeError) as error:
+        decoder(SimpleNamespace(data=bytes(8)), object(), {})
+    text = ''.join(traceback.format_tb(error.tb))
+    assert '<can_schema AHRS_ORIENT>' in text and 'data.yaw = v0 / 10' in text
+    assert 'data.yaw = v0 / 10' in decoder.source
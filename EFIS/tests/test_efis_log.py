@@ -0,0 +1,111 @@
+"""efis_log: formatting, category levels, the dropping queue, the rate
+limiter, and CAN debug logging at full bus load with a stalled stdout."""
+
+import asyncio
+import io
+import json
+import logging
+
+import pytest
+
+import efis_log
+from benchmark import StalledStream, logging_load
+
+
+def _record(msg, *args, **extra):
+    record = logging.LogRecord('efis.can', logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_text_lines_carry_category_and_fields():
+    line = efis_log.StructuredFormatter().format(
+        _record("frame 0x%02X", 0x48, fields={'dlc': 8}))
+    assert ' INFO    can: frame 0x48 dlc=8' in line
+
+
+def test_json_lines_carry_category_and_fields():
+    entry = json.loads(efis_log.StructuredFormatter(json_lines=True).format(
+        _record("frame", fields={'dlc': 8})))
+    assert entry['category'] == 'can'
+    assert entry['message'] == 'frame'
+    assert entry['dlc'] == 8
+
+
+def test_category_levels():
+    efis_log.set_level('can', 'debug')
+    try:
+        assert efis_log.levels()['can'] == 'DEBUG'
+        assert efis_log.get_logger('can').isEnabledFor(logging.DEBUG)
+    finally:
+        efis_log.set_level('can', None)
+    assert efis_log.levels()['can'] is None
+    with pytest.raises(ValueError):
+        efis_log.set_level('no_such_category', 'INFO')
+    with pytest.raises(ValueError):
+        efis_log.set_level('can', 'LOUD')
+
+
+def test_full_queue_drops_instead_of_blocking():
+    pipeline = efis_log.LogPipeline(stream=io.StringIO(), queue_size=3)
+    log = logging.getLogger('efis.test_drop')
+    log.addHandler(pipeline.handler)
+    log.propagate = False
+    try:
+        for index in range(5):
+            log.error("record %d", index)
+    finally:
+        log.removeHandler(pipeline.handler)
+    assert pipeline.stats() == {'queued': 3, 'queue_size': 3, 'dropped': 2}
+    pipeline.listener.start()
+    pipeline.listener.stop()
+    assert pipeline.output.stream.getvalue().count('\n') == 3
+
+
+def test_pipeline_writes_on_stop():
+    stream = io.StringIO()
+    pipeline = efis_log.start_logging(stream=stream)
+    try:
+        efis_log.get_logger('server').info("started", extra=efis_log.fields(port=8080))
+    finally:
+        pipeline.stop()
+        efis_log.set_level('all', 'ERROR')
+    assert 'server: started port=8080' in stream.getvalue()
+    assert logging.getLogger(efis_log.ROOT).propagate
+
+
+def test_rate_limiter_reports_suppressed_repeats():
+    now = [0.0]
+    limiter = efis_log.RateLimiter(interval=10.0, clock=lambda: now[0])
+    stream = io.StringIO()
+    log = logging.getLogger('efis.test_rate')
+    handler = logging.StreamHandler(stream)
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    try:
+        assert limiter.log(log, logging.WARNING, 'read', "read failed")
+        for _ in range(3):
+            now[0] += 1.0
+            assert not limiter.log(log, logging.WARNING, 'read', "read failed")
+        assert limiter.log(log, logging.WARNING, 'other', "other failed")
+        now[0] += 10.0
+        assert limiter.log(log, logging.WARNING, 'read', "read failed")
+        assert not limiter.log(log, logging.DEBUG, 'debug', "not enabled")
+    finally:
+        log.removeHandler(handler)
+    assert stream.getvalue().splitlines() == [
+        "read failed", "other failed", "read failed (3 similar suppressed)"]
+
+
+def test_debug_logging_at_full_load_does_not_stall_frames():
+    pipeline = efis_log.LogPipeline(stream=StalledStream(0.002), queue_size=1000)
+    pipeline.listener.start()
+    try:
+        sent, behind, lag = asyncio.run(logging_load(pipeline.handler, 1.5))
+    finally:
+        pipeline.listener.stop()
+    assert sent > 3000
+    assert pipeline.handler.dropped > 0      # the stalled stdout cannot keep up
+    assert behind < 0.1, "frames stalled behind the log output"
+    assert lag < 0.1, f"loop lag {lag * 1e3:.1f} ms with queued logging"
@@ -0,0 +1,65 @@
+"""EncoderPoller: reads on its own thread, only changes reach the loop."""
+
+import asyncio
+
+from encoder_poller import EncoderPoller
+
+
+class ScriptedEncoder:
+    """Encoder and button returning scripted readings (the last one repeats).
+    A reading of None raises like a failed I2C transaction."""
+
+    def __init__(self, positions, pressed=None):
+        self._positions = list(positions)
+        self._pressed = list(pressed or [False])
+
+    @staticmethod
+    def _next(readings):
+        value = readings.pop(0) if len(readings) > 1 else readings[0]
+        if value is None:
+            raise OSError("I2C read failed")
+        return value
+
+    @property
+    def position(self):
+        return -self._next(self._positions)
+
+    @property
+    def value(self):
+        return not self._next(self._pressed)
+
+
+def _events(encoder, count, **kwargs):
+    async def run():
+        poller = EncoderPoller(encoder, encoder, asyncio.get_running_loop(),
+                               rate_hz=1000, **kwargs)
+        poller.start()
+        try:
+            events = [await asyncio.wait_for(poller.events.get(), 2.0)
+                      for _ in range(count)]
+            await asyncio.sleep(0.05)
+            return events, poller.events.qsize(), poller
+        finally:
+            poller.stop()
+    return asyncio.run(run())
+
+
+def test_only_changes_are_queued():
+    encoder = ScriptedEncoder([0, 0, 1, 2, 2], [False, False, False, False, True])
+    events, left, poller = _events(encoder, 4)
+    assert [(e.position, e.pressed) for e in events] == \
+        [(0, False), (1, False), (2, False), (2, True)]
+    assert left == 0 and poller.reads > 4
+
+
+def test_position_glitch_is_ignored():
+    encoder = ScriptedEncoder([5, 500, 6])
+    events, _, _ = _events(encoder, 2, threshold=100)
+    assert [e.position for e in events] == [5, 6]
+
+
+def test_read_errors_do_not_stop_the_poller():
+    encoder = ScriptedEncoder([1, None, None, 2])
+    events, _, poller = _events(encoder, 2)
+    assert [e.position for e in events] == [1, 2]
+    assert poller.errors == 2
@@ -0,0 +1,141 @@
+"""FlightPlan geometry: the precomputed per-waypoint and per-leg values
+against the reference great-circle functions, the whole-route table, and
+the streaming FPL parser and plan loading off the event loop."""
+
+import asyncio
+import random
+
+import pytest
+
+import aio_server
+from benchmark import (loop_lag_while, precomputed_navigation, reference_navigation,
+                       reference_parse_fpl, synthetic_flight_plan)
+from flightplan import (GPS_SCALE, FlightPlan, LegGeometry, PointGeometry, compute_navigation,
+                        compute_route_table, parse_fpl)
+
+
+def _plan(count, spacing=0.5):
+    plan = FlightPlan()
+    plan.waypoints = [{'id': f"W{index}", 'type': 'USER WAYPOINT',
+                       'lat': 43.0 + index * spacing, 'lon': -80.0, 'alt': None}
+                      for index in range(count)]
+    return plan
+
+
+def test_precomputed_geometry_matches_the_reference_functions():
+    rng = random.Random(20)
+    for _ in range(20000):
+        # legs and positions up to a few hundred NM apart
+        lat1, lon1 = rng.uniform(-75, 75), rng.uniform(-180, 180)
+        prev = {'lat': lat1, 'lon': lon1}
+        wpt = {'lat': lat1 + rng.uniform(-5, 5), 'lon': lon1 + rng.uniform(-5, 5)}
+        lat, lon = lat1 + rng.uniform(-5, 5), lon1 + rng.uniform(-5, 5)
+        leg = LegGeometry(PointGeometry(prev['lat'], prev['lon']),
+                          PointGeometry(wpt['lat'], wpt['lon']))
+        bearing, dist, dtk, xtrack = precomputed_navigation(lat, lon, leg)
+        expected = reference_navigation(lat, lon, prev, wpt)
+        assert abs((bearing - expected[0] + 180) % 360 - 180) < 1e-9
+        assert dist == pytest.approx(expected[1], abs=1e-9)
+        assert dtk == pytest.approx(expected[2], abs=1e-9)
+        assert xtrack == pytest.approx(expected[3], abs=1e-9)
+
+
+def test_leg_geometry_is_cached_until_the_leg_changes():
+    plan = _plan(4)
+    plan.active_leg = 2
+    leg = plan.leg_geometry()
+    assert plan.leg_geometry() is leg
+    assert leg.origin is plan.waypoint_geometry()[1]
+    plan.active_leg = 3
+    assert plan.leg_geometry() is not leg
+    assert plan.leg_geometry().origin is plan.waypoint_geometry()[2]
+
+
+def test_direct_to_starts_the_leg_at_the_activation_position():
+    plan = _plan(4)
+    plan.active_leg = 2
+    plan.activate_direct_to(3, 43.2, -80.3)
+    assert plan.leg_geometry().origin.lat == 43.2
+    assert compute_navigation(43_200_000, -80_300_000, plan)['xtrack'] == 0.0
+    plan.cancel_direct_to()
+    assert plan.leg_geometry().origin is plan.waypoint_geometry()[2]
+
+
+def test_new_waypoints_recompute_the_geometry():
+    plan = _plan(4)
+    points = plan.waypoint_geometry()
+    assert plan.waypoint_geometry() is points
+    plan.waypoints = _plan(3, spacing=0.2).waypoints
+    assert len(plan.waypoint_geometry()) == 3
+    assert plan.waypoint_geometry()[1].lat == pytest.approx(43.2)
+
+
+def test_route_table_matches_the_per_waypoint_computation():
+    pytest.importorskip('numpy')
+    plan = FlightPlan()
+    plan.waypoints = [{'id': f"W{index}", 'type': 'USER WAYPOINT',
+                       'lat': 43.0 + index * 0.05, 'lon': -80.0 + (index % 7) * 0.03, 'alt': None}
+                      for index in range(500)]
+    plan.active_leg = 10
+    lat_raw, lon_raw = 43_480_000, -79_950_000
+    table = compute_route_table(lat_raw, lon_raw, 120, plan, 1_700_000_000)
+    position = PointGeometry(lat_raw / GPS_SCALE, lon_raw / GPS_SCALE)
+    points = plan.waypoint_geometry()
+    expected_to_go = position.distance_to(points[10])
+    for row, point in enumerate(points[10:]):
+        if row:
+            expected_to_go += points[9 + row].distance_to(point)
+        assert abs(table['dist'][row] - round(position.distance_to(point), 1)) <= 0.1
+        assert abs(table['bearing'][row] - round(position.bearing_to(point), 1)) <= 0.1
+        assert abs(table['to_go'][row] - expected_to_go) <= 0.1
+    assert table['ids'][0] == 'W10'
+    assert len(table['ids']) == 490
+    assert abs(table['ete'][-1] - table['to_go'][-1] / 120 * 3600) < 5
+    assert table['eta'][-1] == table['ete'][-1] + 1_700_000_000
+    assert table['to_dest'] == table['to_go'][-1]
+    assert plan.route_distances() is plan.route_distances()
+
+
+def test_route_table_has_no_times_when_stopped():
+    pytest.importorskip('numpy')
+    plan = _plan(4)
+    plan.active_leg = 1
+    table = compute_route_table(43_000_000, -80_000_000, 5, plan, 0)
+    assert table['ete'][0] is None
+    assert table['eta'][0] is None
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-16'])
+def test_streaming_parser_matches_the_former_parser(tmp_path, encoding):
+    path = tmp_path / f'{encoding}.fpl'
+    synthetic_flight_plan(path, 20, encoding=encoding)
+    text = path.read_text(encoding=encoding)
+    text = text.replace('<waypoint><identifier>W0003</identifier>',
+                        '<waypoint><identifier>GONE</identifier>')
+    path.write_text(text, encoding=encoding)
+    assert parse_fpl(path, chunk_size=100) == reference_parse_fpl(path)
+    assert parse_fpl(path)[2] == [('W0003', 'USER WAYPOINT')]
+
+
+def test_large_waypoint_table_parses_like_the_former_parser(tmp_path):
+    path = tmp_path / 'table.fpl'
+    synthetic_flight_plan(path, 100, table_size=5000)
+    name, waypoints, missing = parse_fpl(path)
+    assert (name, waypoints, missing) == reference_parse_fpl(path)
+    assert len(waypoints) == 100
+    assert not missing
+
+
+def test_plans_load_off_the_event_loop(tmp_path):
+    path = tmp_path / 'table.fpl'
+    synthetic_flight_plan(path, 100, table_size=10000)
+    plan, _, probes = asyncio.run(loop_lag_while(lambda: aio_server.load_flight_plan(path)))
+    assert len(plan.waypoints) == 100
+    assert probes >= 2, "the loop did not run while the plan was parsed"
+
+
+def test_unreadable_plan_loads_as_none(tmp_path):
+    path = tmp_path / 'broken.fpl'
+    path.write_text('<flight-plan', encoding='utf-8')
+    assert asyncio.run(aio_server.load_flight_plan(path)) is None
+    assert asyncio.run(aio_server.load_flight_plan(tmp_path / 'missing.fpl')) is None
@@ -0,0 +1,108 @@
+"""FlightPlanCache: the binary cache format, switching between plans from
+memory and the cache directory, and change detection."""
+
+import pytest
+
+from benchmark import synthetic_flight_plan
+from flightplan import FlightPlan
+from flightplan_cache import FlightPlanCache, decode_plan, encode_plan
+
+
+@pytest.fixture
+def plans(tmp_path):
+    """Three plans of 50 waypoints behind a 500 entry waypoint table."""
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"plan_{index}.fpl"
+        synthetic_flight_plan(path, 50, start=(45.0 + index, -75.0), table_size=500)
+        paths.append(path)
+    return paths
+
+
+def _parsed(path):
+    plan = FlightPlan()
+    assert plan.load(path)
+    return plan
+
+
+def test_binary_format_round_trip(plans):
+    reference = _parsed(plans[0])
+    reference.waypoints[1]['alt'] = None
+    assert decode_plan(encode_plan('x.fpl', (1, 2), reference.route_name, reference.waypoints)) \
+        == ('x.fpl', (1, 2), reference.route_name, reference.waypoints)
+
+
+def test_plans_are_parsed_once_then_served_from_memory(tmp_path, plans):
+    cache = FlightPlanCache(tmp_path / 'cache', capacity=3)
+    for _ in range(3):
+        for path in plans:
+            assert cache.load(path).waypoints == _parsed(path).waypoints
+    assert cache.parses == 3
+    assert cache.memory_hits == 6
+
+
+def test_restart_reads_the_cache_directory(tmp_path, plans):
+    cache_dir = tmp_path / 'cache'
+    cache = FlightPlanCache(cache_dir)
+    for path in plans:
+        cache.load(path)
+
+    restarted = FlightPlanCache(cache_dir)
+    assert restarted.read_index() == 3
+    assert [entry['file'] for entry in restarted.catalog(tmp_path)] == \
+        ['plan_0.fpl', 'plan_1.fpl', 'plan_2.fpl']
+    for path in plans:
+        plan = restarted.load(path)
+        original = _parsed(path)
+        assert plan.waypoints == original.waypoints
+        assert plan.route_name == original.route_name
+        assert plan._points_for is plan.waypoints   # geometry precomputed
+    assert restarted.parses == 0
+    assert restarted.disk_hits == 3
+
+
+def test_reselected_plan_starts_on_its_first_leg(plans):
+    cache = FlightPlanCache()
+    flown = cache.load(plans[2])
+    flown.activate_direct_to(3, 45.0, -75.0)
+    again = cache.load(plans[2])
+    assert again is not flown
+    assert again.waypoints is flown.waypoints
+    assert again.active_leg == 1
+    assert not again.direct_to_active
+    assert flown.active_leg == 3
+    assert flown.direct_to_active
+
+
+def test_changed_file_is_parsed_again(tmp_path, plans):
+    cache_dir = tmp_path / 'cache'
+    cache = FlightPlanCache(cache_dir)
+    for path in plans:
+        cache.load(path)
+    synthetic_flight_plan(plans[0], 51, table_size=500)
+    assert len(cache.load(plans[0]).waypoints) == 51
+    assert cache.parses == 4
+    assert len(cache.load(plans[1]).waypoints) == 50
+    assert cache.parses == 4
+
+    # the cache file was rewritten for the new contents
+    restarted = FlightPlanCache(cache_dir)
+    restarted.read_index()
+    assert len(restarted.load(plans[0]).waypoints) == 51
+    assert restarted.parses == 0
+
+
+def test_least_recently_used_plan_leaves_memory(plans):
+    cache = FlightPlanCache(None, capacity=2)
+    for path in plans:
+        cache.load(path)
+    assert cache.cached(plans[0]) is None
+    assert cache.cached(plans[2]) is not None
+
+
+def test_missing_or_broken_plans_load_as_none(tmp_path):
+    cache = FlightPlanCache(tmp_path / 'cache')
+    assert cache.load(tmp_path / 'missing.fpl') is None
+    broken = tmp_path / 'broken.fpl'
+    broken.write_text('<flight-plan', encoding='utf-8')
+    assert cache.load(broken) is None
@@ -0,0 +1,106 @@
+"""FlightPlanWatcher: the directory index, and new plans reported once,
+after their last write, through inotify and by polling."""
+
+import asyncio
+import os
+
+import pytest
+
+from benchmark import former_plan_poll, plan_pickup
+from flightplan_watcher import FlightPlanWatcher, _Inotify
+
+
+def _write_plans(directory, count):
+    for index in range(count):
+        path = directory / f"plan_{index:02d}.fpl"
+        path.write_text("<flight-plan/>\n", encoding='utf-8')
+        os.utime(path, (1_600_000_000 + index, 1_600_000_000 + index))
+
+
+def _inotify_available():
+    try:
+        _Inotify().close()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+needs_inotify = pytest.mark.skipif(not _inotify_available(), reason="inotify is not available")
+
+
+def test_scan_finds_the_newest_plan_like_the_former_poll(tmp_path):
+    _write_plans(tmp_path, 10)
+    (tmp_path / 'notes.txt').write_text("not a plan\n", encoding='utf-8')
+    watcher = FlightPlanWatcher(tmp_path)
+    assert watcher.scan()
+    assert len(watcher.files) == 10
+    assert watcher.newest() == former_plan_poll(tmp_path)
+    (tmp_path / 'folder.fpl').mkdir()   # newer, but not a file
+    watcher.scan()
+    assert watcher.newest()[0].name == 'plan_09.fpl'
+
+
+def test_missing_directory_has_no_plan(tmp_path):
+    watcher = FlightPlanWatcher(tmp_path / 'missing')
+    assert not watcher.scan()
+    assert watcher.newest() is None
+
+
+@pytest.mark.parametrize('use_inotify', [pytest.param(True, marks=needs_inotify), False],
+                         ids=['inotify', 'poll'])
+def test_new_plans_are_reported_once_after_their_last_write(tmp_path, use_inotify):
+    _write_plans(tmp_path, 20)
+    watcher = FlightPlanWatcher(tmp_path, poll_interval=0.1, use_inotify=use_inotify)
+    try:
+        latencies, reports = asyncio.run(plan_pickup(watcher, tmp_path, writes=3))
+    finally:
+        watcher.close()
+    assert reports == len(latencies) == 3, "partial writes were reported"
+    if use_inotify:
+        assert max(latencies) < 0.5
+        assert watcher.events > 0
+    else:
+        assert watcher.scans > 1
+
+
+@needs_inotify
+def test_deleting_the_newest_plan_reports_the_previous_one(tmp_path):
+    _write_plans(tmp_path, 3)
+    watcher = FlightPlanWatcher(tmp_path)
+
+    async def run():
+        changes = watcher.changes()
+        first = await changes.__anext__()
+        first[0].unlink()
+        second = await asyncio.wait_for(changes.__anext__(), 2.0)
+        await changes.aclose()
+        return first, second
+
+    try:
+        first, second = asyncio.run(run())
+    finally:
+        watcher.close()
+    assert first[0].name == 'plan_02.fpl'
+    assert second[0].name == 'plan_01.fpl'
+
+
+@needs_inotify
+def test_directory_created_later_is_watched(tmp_path):
+    directory = tmp_path / 'plans'
+    watcher = FlightPlanWatcher(directory, poll_interval=0.05)
+
+    async def run():
+        changes = watcher.changes()
+        assert await changes.__anext__() is None
+        directory.mkdir()
+        await asyncio.sleep(0.2)
+        (directory / 'new.fpl').write_text("<flight-plan/>\n", encoding='utf-8')
+        newest = await asyncio.wait_for(changes.__anext__(), 2.0)
+        await changes.aclose()
+        return newest
+
+    try:
+        newest = asyncio.run(run())
+    finally:
+        watcher.close()
+    assert newest[0] == directory / 'new.fpl'
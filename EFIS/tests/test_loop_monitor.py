@@ -0,0 +1,56 @@
+"""LoopMonitor finds a task that blocks the event loop and captures its stack."""
+
+import asyncio
+import time
+
+from loop_monitor import LoopMonitor
+
+
+async def _busy_task(period, work):
+    """Do work seconds of CPU per period without yielding."""
+    while True:
+        end = time.perf_counter() + work
+        while time.perf_counter() < end:
+            pass
+        await asyncio.sleep(period)
+
+
+def _blocking_io(seconds):
+    time.sleep(seconds)     # stands in for an I2C or sysfs call
+
+
+async def _blocking_task(period, seconds):
+    while True:
+        await asyncio.sleep(period)
+        _blocking_io(seconds)
+
+
+def _run_monitor(seconds):
+    async def run():
+        monitor = LoopMonitor(interval=0.02, slow_threshold=0.02, stack_threshold=0.1)
+        tasks = [asyncio.create_task(monitor.run()),
+                 asyncio.create_task(monitor.track(_busy_task(0.01, 0.001), 'busy')),
+                 asyncio.create_task(monitor.track(_blocking_task(0.5, 0.25), 'blocking'))]
+        await asyncio.sleep(seconds)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return monitor
+    return asyncio.run(run())
+
+
+def test_blocking_task_is_found_and_its_stack_captured():
+    monitor = _run_monitor(1.8)
+    assert monitor.tasks['blocking'].slow_steps >= 2
+    assert monitor.tasks['busy'].slow_steps == 0
+    assert monitor.lag.maximum >= 0.2
+    assert monitor.stacks
+    assert all(stack['task'] == 'blocking' for stack in monitor.stacks)
+    assert any('_blocking_io' in line for line in monitor.stacks[-1]['stack'])
+
+
+def test_summary_names_the_blocked_task():
+    monitor = _run_monitor(0.9)
+    summary = monitor.summary()
+    assert 'blocking' in summary
+    assert 'last blocked' in summary
@@ -0,0 +1,155 @@
+"""Deadline-based message group timeouts, driven by a fake clock."""
+
+import asyncio
+import heapq
+
+import aio_server
+from avionics_data import AvionicsData
+from message_timeouts import MessageGroup, MessageTimeoutMonitor
+from push_scheduler import PushGroup, PushScheduler
+from websocket_delta import DeltaEncoder
+
+
+class FakeTimer:
+    """Stand-in for asyncio.TimerHandle."""
+
+    def __init__(self, callback, args):
+        self.callback = callback
+        self.args = args
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def cancelled(self):
+        return self._cancelled
+
+
+class FakeLoop:
+    """Minimal loop with a manually advanced clock and a timer heap."""
+
+    def __init__(self):
+        self._now = 0.0
+        self._timers = []
+        self._sequence = 0
+
+    def time(self):
+        return self._now
+
+    def call_at(self, when, callback, *args):
+        timer = FakeTimer(callback, args)
+        self._sequence += 1
+        heapq.heappush(self._timers, (when, self._sequence, timer))
+        return timer
+
+    def advance(self, seconds):
+        """Move the clock forward, running every timer that falls due."""
+        end = self._now + seconds
+        while self._timers and self._timers[0][0] <= end:
+            when, _, timer = heapq.heappop(self._timers)
+            self._now = when
+            if not timer.cancelled():
+                timer.callback(*timer.args)
+        self._now = end
+
+
+def _monitor():
+    loop = FakeLoop()
+    data = AvionicsData()
+    monitor = MessageTimeoutMonitor(data, [
+        MessageGroup('ahrs', [0x48], ['yaw', 'pitch'], 0.2),
+        MessageGroup('gps', [0x63], ['latitude'], 3.0),
+    ], loop=loop)
+    return loop, data, monitor
+
+
+def test_no_work_while_idle():
+    loop, _, monitor = _monitor()
+    loop.advance(60.0)
+    assert monitor.wakeups == 0
+
+
+def test_wakeups_follow_timeouts_not_frames():
+    loop, data, monitor = _monitor()
+    # 10 s of AHRS at 50 Hz: 500 frames, but the timer only wakes about once
+    # per timeout period (each wakeup re-arms to the newest deadline)
+    for _ in range(500):
+        data.yaw = data.pitch = 1.0
+        monitor.received(0x48)
+        loop.advance(0.02)
+    assert data.yaw == 1.0
+    assert monitor.wakeups <= 10 / (0.2 - 0.02) + 1
+    assert monitor.last_received_times[0x48] == loop.time() - 0.02
+
+
+def test_group_cleared_once_at_its_deadline():
+    loop, data, monitor = _monitor()
+    data.yaw = data.pitch = 1.0
+    monitor.received(0x48)
+    loop.advance(0.19)
+    assert data.yaw == 1.0
+    loop.advance(0.02)
+    assert data.yaw is None and data.pitch is None
+    assert monitor.groups['ahrs'].stale and monitor.groups['ahrs'].expirations == 1
+    wakeups_at_expiry = monitor.wakeups
+    loop.advance(600.0)
+    assert monitor.wakeups == wakeups_at_expiry
+
+
+def test_groups_are_independent():
+    loop, data, monitor = _monitor()
+    data.yaw = 1.0
+    data.latitude = 43_130_000
+    monitor.received(0x63)
+    loop.advance(2.9)
+    assert data.latitude == 43_130_000 and data.yaw == 1.0
+    loop.advance(0.2)
+    assert data.latitude is None and data.yaw == 1.0
+
+
+def test_ahrs_timeout_clears_the_baseline_fields():
+    loop = FakeLoop()
+    data = AvionicsData()
+    monitor = aio_server.create_timeout_monitor(data, {}, loop=loop)
+    data.yaw = data.pitch = data.roll = data.turn_rate = 1.0
+    data.accx = data.accy = data.accz = data.calib = 1
+    monitor.received(aio_server.CAN_MSG_ID.AHRS_ORIENT.value)
+    monitor.received(aio_server.CAN_MSG_ID.AHRS_ACCEL.value)
+    loop.advance(1.0)
+    assert (data.yaw, data.pitch, data.roll) == (None, None, None)
+    assert (data.accx, data.accy, data.accz) == (None, None, None)
+    assert data.turn_rate == 1.0 and data.calib == 1
+
+
+def test_cleared_fields_are_in_the_next_update():
+    """AHRS frames stop: the cleared fields go out in the next update, not
+    at the next keyframe."""
+
+    async def run(timeout=0.05, rate=50):
+        data = AvionicsData()
+        scheduler = PushScheduler([
+            PushGroup('attitude', ('roll', 'pitch'), rate, msg_ids=[0x48]),
+            PushGroup('other', None, 2, periodic=True)])
+        monitor = MessageTimeoutMonitor(
+            data, [MessageGroup('ahrs', [0x48], ['roll', 'pitch'], timeout)],
+            on_expire=lambda group: scheduler.mark_fields(group.attrs))
+        encoder = DeltaEncoder(keyframe_interval=60.0)
+
+        for _ in range(10):
+            data.roll = data.pitch = 1.0
+            data.mark_changed()
+            monitor.received(0x48)
+            scheduler.mark_dirty_id(0x48)
+            await asyncio.sleep(1 / rate)
+        while True:
+            groups = await asyncio.wait_for(scheduler.next_update(), 1.0)
+            snapshot = data.snapshot()
+            text = encoder.encode(snapshot, scheduler.fields_of(groups, snapshot))
+            scheduler.sent(groups)
+            if data.roll is None:
+                break
+        monitor.stop()
+        return text
+
+    text = asyncio.run(run())
+    assert '"roll": null' in text and '"pitch": null' in text
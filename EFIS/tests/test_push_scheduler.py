@@ -0,0 +1,105 @@
+"""PushScheduler wakeups, coalescing and rate limits, and the latency
+histogram it records into."""
+
+import asyncio
+import time
+
+import aio_server
+from avionics_data import AvionicsData
+from metrics import LatencyHistogram
+from push_scheduler import PushGroup, PushScheduler
+
+
+def _scheduler(**kwargs):
+    return PushScheduler([PushGroup('attitude', ('roll', 'pitch'), 50, msg_ids=[0x48]),
+                          PushGroup('gps', ('latitude',), 2, msg_ids=[0x63]),
+                          PushGroup('other', None, 2)], **kwargs)
+
+
+def _names(groups):
+    return sorted(group.name for group in groups)
+
+
+def test_changes_arriving_together_go_out_together():
+    async def run():
+        scheduler = _scheduler(coalesce_window=0.02)
+        update = asyncio.ensure_future(scheduler.next_update())
+        await asyncio.sleep(0)
+        scheduler.mark_dirty_id(0x48)
+        await asyncio.sleep(0.005)
+        scheduler.mark_dirty_id(0x63)
+        scheduler.mark_dirty_id(0x99)     # no group - ignored
+        return await asyncio.wait_for(update, 1.0), scheduler
+    groups, scheduler = asyncio.run(run())
+    assert _names(groups) == ['attitude', 'gps']
+    assert scheduler.updates == 1
+
+
+def test_rate_limit_holds_a_group_until_its_slot():
+    async def run():
+        scheduler = _scheduler(coalesce_window=0)
+        scheduler.mark_dirty('gps')
+        scheduler.sent(await scheduler.next_update())
+        scheduler.mark_dirty('gps')
+        scheduler.mark_dirty('attitude')
+        start = asyncio.get_running_loop().time()
+        first = await scheduler.next_update()
+        scheduler.sent(first)
+        second = await scheduler.next_update()
+        return first, second, asyncio.get_running_loop().time() - start
+    first, second, elapsed = asyncio.run(run())
+    assert _names(first) == ['attitude']
+    assert _names(second) == ['gps']
+    assert elapsed >= 0.5 / 2             # next 2 Hz slot, not at once
+
+
+def test_flush_ignores_the_rate_limits():
+    async def run():
+        scheduler = _scheduler(coalesce_window=0)
+        scheduler.mark_dirty('gps')
+        scheduler.sent(await scheduler.next_update())
+        scheduler.request_flush()
+        return await asyncio.wait_for(scheduler.next_update(), 0.1)
+    assert _names(asyncio.run(run())) == ['attitude', 'gps', 'other']
+
+
+def test_mark_fields_and_fields_of():
+    scheduler = _scheduler()
+    scheduler.mark_fields(['latitude'])
+    scheduler.mark_fields(['wpt_id'])     # claimed by no group - catch-all
+    assert [name for name, group in scheduler.groups.items() if group.dirty] == \
+        ['gps', 'other']
+    groups = [scheduler.groups['gps'], scheduler.groups['other']]
+    assert scheduler.fields_of(groups, ['roll', 'latitude', 'wpt_id']) == \
+        {'latitude', 'wpt_id'}
+
+
+def test_latency_is_measured_from_the_oldest_change():
+    scheduler = _scheduler()
+    scheduler.mark_dirty('gps', timestamp=time.time() - 0.3)
+    scheduler.mark_dirty('gps')
+    group = scheduler.groups['gps']
+    assert scheduler.oldest_change([group]) < time.time() - 0.25
+    scheduler.sent([group])
+    assert group.latency.count == 1 and group.latency.maximum >= 0.3
+    assert not group.dirty and group.marks == 2
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram(buckets=(0.001, 0.01, 0.1))
+    for seconds in [0.0005] * 90 + [0.05] * 9 + [2.0]:
+        histogram.record(seconds)
+    assert histogram.percentile(0.5) == 0.001
+    assert histogram.percentile(0.99) == 0.1
+    assert histogram.percentile(1.0) == 2.0
+    assert histogram.cumulative()[-1] == (float('inf'), 100)
+    histogram.reset()
+    assert histogram.count == 0 and histogram.percentile(0.5) == 0.0
+
+
+def test_navigation_changes_mark_the_navigation_group():
+    scheduler = aio_server.create_push_scheduler()
+    data = AvionicsData()
+    aio_server.navigation_changed(data, scheduler)
+    assert scheduler.groups['navigation'].dirty
+    assert data.wpt_id is None and data.direct_to_active is None
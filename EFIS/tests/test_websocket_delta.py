@@ -0,0 +1,82 @@
+"""DeltaEncoder messages and the reference client merge."""
+
+import json
+
+from benchmark import synthetic_snapshots
+from websocket_delta import DeltaEncoder, apply_message
+
+
+def _encoder(**kwargs):
+    now = [0.0]
+    encoder = DeltaEncoder(clock=lambda: now[0], **kwargs)
+    return encoder, now
+
+
+def test_keyframe_then_changed_fields_only():
+    encoder, _ = _encoder()
+    first = json.loads(encoder.encode({'roll': 1.0, 'wpt_id': 'KBUF'}))
+    assert first == {'seq': 1, 'key': True, 'data': {'roll': 1.0, 'wpt_id': 'KBUF'}}
+    assert encoder.encode({'roll': 1.0, 'wpt_id': 'KBUF'}) is None
+    assert json.loads(encoder.encode({'roll': 2.0, 'wpt_id': 'KBUF'})) == \
+        {'seq': 2, 'data': {'roll': 2.0}}
+
+
+def test_deadband_is_measured_from_the_value_sent():
+    encoder, _ = _encoder(deadbands={'vsi': 10})
+    encoder.encode({'vsi': 0})
+    assert encoder.encode({'vsi': 6}) is None
+    assert encoder.encode({'vsi': -6}) is None
+    assert json.loads(encoder.encode({'vsi': 12}))['data'] == {'vsi': 12}
+    # None <-> number is always a change
+    assert json.loads(encoder.encode({'vsi': None}))['data'] == {'vsi': None}
+
+
+def test_fields_argument_holds_other_changes_back():
+    encoder, _ = _encoder()
+    encoder.encode({'roll': 1.0, 'dist': 5.0})
+    text = encoder.encode({'roll': 2.0, 'dist': 4.0}, fields=('roll',))
+    assert json.loads(text)['data'] == {'roll': 2.0}
+    assert json.loads(encoder.encode({'roll': 2.0, 'dist': 4.0}))['data'] == {'dist': 4.0}
+
+
+def test_periodic_and_requested_keyframes():
+    encoder, now = _encoder(keyframe_interval=5.0)
+    encoder.encode({'roll': 1.0})
+    now[0] = 4.9
+    assert 'key' not in json.loads(encoder.encode({'roll': 2.0}))
+    now[0] = 5.0
+    assert json.loads(encoder.encode({'roll': 2.0}))['key']
+    encoder.request_keyframe()
+    assert json.loads(encoder.encode({'roll': 2.0}))['key']
+    assert encoder.keyframes == 3
+
+
+def test_gap_is_detected_by_the_client():
+    state = {}
+    assert not apply_message(state, {'seq': 4, 'data': {'roll': 1.0}})
+    assert apply_message(state, {'seq': 4, 'key': True, 'data': {'roll': 1.0}})
+    assert not apply_message(state, {'seq': 6, 'data': {'roll': 2.0}})
+    assert state == {'roll': 1.0, 'seq': 4}
+
+
+def test_lossy_client_resynchronizes_with_its_own_keyframe():
+    """One minute at 20 Hz: a client dropping every 50th message catches up
+    from client_keyframe() and ends in the same state, without extra
+    keyframes for everyone else."""
+    encoder, now = _encoder(deadbands={'vsi': 10, 'magx': 1.0, 'magy': 1.0, 'magz': 1.0})
+    client, lossy_client = {}, {}
+    resyncs = 0
+    for tick, snapshot in enumerate(synthetic_snapshots(20 * 60)):
+        now[0] = tick / 20
+        text = encoder.encode(snapshot)
+        if text is None:
+            continue
+        assert apply_message(client, json.loads(text))
+        if encoder.messages % 50 == 25:
+            continue  # lost
+        if not apply_message(lossy_client, json.loads(text)):
+            assert apply_message(lossy_client, json.loads(encoder.client_keyframe()))
+            resyncs += 1
+    assert lossy_client == client
+    assert resyncs > 0
+    assert encoder.keyframes == 12     # the periodic ones only
@@ -0,0 +1,62 @@
+"""BroadcastHub: per-client queues, so a slow client only delays itself."""
+
+import asyncio
+
+from benchmark import SimulatedSocket, simulate_clients
+from websocket_hub import BroadcastHub
+
+
+class FailingSocket(SimulatedSocket):
+    """Socket whose sends fail like a reset connection."""
+
+    async def send_str(self, _payload):
+        raise ConnectionResetError("reset by peer")
+
+
+def test_one_slow_client_does_not_hold_up_nine_fast_ones():
+    serializations, _, _, stats, sockets = asyncio.run(simulate_clients(10, seconds=1.0))
+    assert [socket.received for socket in sockets[1:]] == [serializations] * 9
+    assert all(client['dropped'] == 0 for client in stats[1:])
+    slow = stats[0]
+    assert slow['name'] == 'slow0'
+    assert slow['dropped'] > 0 and slow['max_queue'] == 8
+    assert slow['sent'] + slow['dropped'] + slow['queue_depth'] <= serializations + 1
+
+
+def test_publish_filters_clients():
+    async def run():
+        hub = BroadcastHub()
+        sockets = [SimulatedSocket(0) for _ in range(3)]
+        text, binary, route = (hub.add(socket, name) for socket, name in
+                               zip(sockets, ('text', 'binary', 'route')))
+        binary.binary = True
+        route.topics.add('route')
+        hub.publish('{}', binary=False)
+        hub.publish(b'\x01', binary=True)
+        hub.publish('{"route": []}', topic='route')
+        hub.publish('{"key": true}', client=text)
+        assert hub.has_clients(binary=True) and hub.has_clients(topic='route')
+        assert not hub.has_clients(topic='other')
+        await asyncio.sleep(0.05)
+        counts = [socket.received for socket in sockets]
+        queued = [client.stats()['queued'] for client in (text, binary, route)]
+        await hub.close()
+        return counts, queued, hub.clients
+    counts, queued, clients = asyncio.run(run())
+    assert counts == [2, 1, 2] and queued == counts
+    assert clients == []
+
+
+def test_failed_send_stops_the_client_only():
+    async def run():
+        hub = BroadcastHub()
+        broken = hub.add(FailingSocket(0), 'broken')
+        good_socket = SimulatedSocket(0)
+        hub.add(good_socket, 'good')
+        hub.publish('one')
+        hub.publish('two')
+        await asyncio.sleep(0.05)
+        result = broken.errors, broken.sent, good_socket.received
+        await hub.close()
+        return result
+    assert asyncio.run(run()) == (1, 0, 2)
@@ -0,0 +1,162 @@
+"""Delta encoding of the AvionicsData updates sent over the websocket.
+
+Instead of serializing every field on every tick, DeltaEncoder sends:
+
+  keyframe  {"seq": n, "key": true, "data": {...every field...}}
+  delta     {"seq": n, "data": {...only the changed fields...}}
+
+A keyframe is sent to every client when requested (new client) and every
+keyframe_interval seconds. A client that detected a gap in the sequence
+numbers is sent client_keyframe() on its own: the state the other clients
+are in, under the current sequence number, so the next delta applies. Numeric
+fields only count as changed once they move by at least their dead-band
+(display precision) from the value last sent, so sensor noise below what the
+display can show does not generate traffic. Ticks with no changes send
+nothing and do not consume a sequence number.
+"""
+
+import json
+import time
+
+# Seconds between unconditional keyframes
+DEFAULT_KEYFRAME_INTERVAL = 5.0
+
+_NEVER_SENT = object()
+
+
+class DeltaEncoder:
+    """Build keyframe / delta messages from successive data snapshots.
+
+    Args:
+        keyframe_interval: seconds between keyframes
+        deadbands: dict of field name -> minimum change to send (fields not
+            listed are sent on any change)
+        clock: function returning the current time in seconds
+    """
+
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 deadbands=None, clock=time.monotonic):
+        self.keyframe_interval = keyframe_interval
+        self.deadbands = dict(deadbands or {})
+        self._clock = clock
+        self.seq = 0
+        self._last_sent = {}
+        self._next_keyframe = None
+        self._keyframe_requested = True
+        self._client_keyframe = None   # (seq, text) of the last client_keyframe()
+        # Statistics
+        self.ticks = 0
+        self.messages = 0
+        self.keyframes = 0
+        self.bytes_sent = 0
+        self.encode_seconds = 0.0
+
+    def request_keyframe(self):
+        """Send a full keyframe on the next tick."""
+        self._keyframe_requested = True
+
+    def client_keyframe(self):
+        """Return a keyframe of the state the messages sent so far leave a
+        client in, tagged with the current sequence number (it does not
+        consume one), or None before the first message. Sent to a single
+        client that lost an update, so the other clients carry on with
+        deltas."""
+        if not self.seq:
+            return None
+        cached = self._client_keyframe
+        if cached is not None and cached[0] == self.seq:
+            return cached[1]
+        text = json.dumps({'seq': self.seq, 'key': True, 'data': self._last_sent})
+        self._client_keyframe = (self.seq, text)
+        return text
+
+    def _changed_fields(self, snapshot, fields):
+        last_sent = self._last_sent
+        deadbands = self.deadbands
+        changed = {}
+        if fields is None:
+            items = snapshot.items()
+        else:
+            items = ((key, snapshot[key]) for key in fields if key in snapshot)
+        for key, value in items:
+            last = last_sent.get(key, _NEVER_SENT)
+            if value == last and type(value) is type(last):
+                continue
+            deadband = deadbands.get(key)
+            if (deadband and
+                    isinstance(value, (int, float)) and isinstance(last, (int, float)) and
+                    abs(value - last) < deadband):
+                continue  # change smaller than the display can show
+            changed[key] = value
+        return changed
+
+    def encode(self, snapshot, fields=None):
+        """Return the JSON text to send for this tick, or None if nothing
+        needs to be sent.
+
+        Args:
+            snapshot: dict of field name -> value (JSON serializable)
+            fields: optional collection of the fields that may go out in a
+                delta; changes to other fields are held back. Keyframes
+                always carry the whole snapshot.
+        """
+        start = time.perf_counter()
+        self.ticks += 1
+        now = self._clock()
+
+        if (self._keyframe_requested or self._next_keyframe is None or
+                now >= self._next_keyframe):
+            self._keyframe_requested = False
+            self._next_keyframe = now + self.keyframe_interval
+            self.seq += 1
+            self._last_sent = dict(snapshot)
+            text = json.dumps({'seq': self.seq, 'key': True, 'data': snapshot})
+            self.keyframes += 1
+        else:
+            changed = self._changed_fields(snapshot, fields)
+            if not changed:
+                self.encode_seconds += time.perf_counter() - start
+                return None
+            self.seq += 1
+            self._last_sent.update(changed)
+            text = json.dumps({'seq': self.seq, 'data': changed})
+
+        self.messages += 1
+        self.bytes_sent += len(text)
+        self.encode_seconds += time.perf_counter() - start
+        return text
+
+    def stats(self):
+        """Return the encoder statistics as a dict."""
+        return {
+            'ticks': self.ticks,
+            'messages': self.messages,
+            'keyframes': self.keyframes,
+            'bytes_sent': self.bytes_sent,
+            'encode_us_per_tick': (self.encode_seconds / self.ticks * 1e6
+                                   if self.ticks else 0.0),
+        }
+
+
+def apply_message(state, message):
+    """Reference client-side merge (mirrors efis-display.js).
+
+    Args:
+        state: dict with the client's current data and 'seq' (or None)
+        message: decoded JSON message
+
+    Returns:
+        bool: True if applied, False if a gap was detected and a keyframe
+        must be requested
+    """
+    if message.get('key'):
+        state.clear()
+        state.update(message['data'])
+        state['seq'] = message['seq']
+        return True
+    if state.get('seq') is None or message['seq'] != state['seq'] + 1:
+        return False
+    state.update(message['data'])
+    state['seq'] = message['seq']
+    return True
+
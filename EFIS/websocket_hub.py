@@ -0,0 +1,201 @@
+"""Fan-out of websocket updates to several display clients.
+
+send_json serializes each update once and hands the payload to the
+BroadcastHub. Every connected client has its own bounded queue and sender
+task, so a slow client (e.g. a maintenance laptop on poor WiFi) only ever
+delays itself: when its queue is full the oldest queued update is dropped.
+Dropped delta updates show up at the client as a sequence gap, and the
+client asks for a keyframe as it would after any lost update; that
+keyframe is published to the client alone (``publish(..., client=...)``).
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+import efis_log
+from metrics import LatencyHistogram
+
+log = efis_log.get_logger('hub')
+
+DEFAULT_QUEUE_SIZE = 8  # updates held per client before the oldest is dropped
+
+
+class ClientConnection:
+    """One connected websocket client and its send queue.
+
+    Args:
+        web_socket: prepared aiohttp WebSocketResponse (or anything with
+            send_str/send_bytes coroutines and a ``closed`` attribute)
+        name: label used in statistics (e.g. the remote address)
+        queue_size: maximum queued updates
+        loop: event loop
+        data_age: optional {binary flag: LatencyHistogram} shared by the
+            hub, recording the age of the CAN data when its send completes
+    """
+
+    def __init__(self, web_socket, name, queue_size, loop, data_age=None):
+        self.web_socket = web_socket
+        self.name = name
+        self.binary = False       # client asked for binary frames
+        self.topics = set()       # optional payloads the client asked for
+        self._loop = loop
+        self._queue = collections.deque()
+        self._queue_size = queue_size
+        self._ready = asyncio.Event()
+        self._task = None
+        # Statistics
+        self.connected_at = loop.time()
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.keyframes = 0        # keyframes sent to this client alone
+        self.max_queue = 0
+        self.lag = LatencyHistogram()   # seconds from publish to send complete
+        self._data_age = data_age
+
+    def enqueue(self, payload, published_at, received_at=None):
+        """Queue a payload, dropping the oldest queued one when full.
+
+        Args:
+            payload: str or bytes
+            published_at: loop time of the publish
+            received_at: time.time() receive timestamp of the oldest CAN
+                frame in the payload, or None
+        """
+        queue = self._queue
+        if len(queue) >= self._queue_size:
+            queue.popleft()
+            self.dropped += 1
+        queue.append((published_at, payload, received_at))
+        self.queued += 1
+        if len(queue) > self.max_queue:
+            self.max_queue = len(queue)
+        self._ready.set()
+
+    async def _run(self):
+        queue = self._queue
+        web_socket = self.web_socket
+        while not web_socket.closed:
+            if not queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            published_at, payload, received_at = queue.popleft()
+            try:
+                if isinstance(payload, str):
+                    await web_socket.send_str(payload)
+                else:
+                    await web_socket.send_bytes(payload)
+            except Exception as e: #pylint: disable=broad-except
+                # Connection went away (reset, closing transport, ...)
+                self.errors += 1
+                log.debug("Websocket client %s send failed: %s", self.name, e)
+                break
+            self.sent += 1
+            self.lag.record(self._loop.time() - published_at)
+            if received_at is not None and self._data_age is not None:
+                self._data_age[self.binary].record(max(0.0, time.time() - received_at))
+
+    def stats(self):
+        """Return the client statistics as a dict."""
+        return {
+            'name': self.name,
+            'binary': self.binary,
+            'topics': sorted(self.topics),
+            'connected_seconds': round(self._loop.time() - self.connected_at, 1),
+            'queued': self.queued,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'keyframes': self.keyframes,
+            'queue_depth': len(self._queue),
+            'max_queue': self.max_queue,
+            'lag': self.lag.summary(),
+        }
+
+
+class BroadcastHub:
+    """Deliver each published payload to every connected client.
+
+    Args:
+        queue_size: per-client queue length (drop-oldest beyond this)
+        loop: event loop (default: the running loop)
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, loop=None):
+        self.queue_size = queue_size
+        self._loop = loop
+        self.clients = []
+        self.published = 0
+        # CAN receive to websocket send complete, per client mode
+        self.data_age = {False: LatencyHistogram(), True: LatencyHistogram()}
+
+    def add(self, web_socket, name='client'):
+        """Register a connected websocket and start its sender task.
+
+        Returns:
+            ClientConnection
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        client = ClientConnection(web_socket, name, self.queue_size, self._loop,
+                                  self.data_age)
+        client._task = self._loop.create_task(client._run())
+        self.clients.append(client)
+        log.debug("Websocket client %s connected (%d clients)", name, len(self.clients))
+        return client
+
+    async def remove(self, client):
+        """Unregister a client and stop its sender task."""
+        if client in self.clients:
+            self.clients.remove(client)
+        if client._task is not None:
+            client._task.cancel()
+            await asyncio.gather(client._task, return_exceptions=True)
+            client._task = None
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Websocket client %s disconnected", client.name,
+                      extra=efis_log.fields(**client.stats()))
+
+    def has_clients(self, binary=None, topic=None):
+        """True if any client (of the given mode and subscribed to the given
+        topic, if not None) is connected."""
+        return any((binary is None or client.binary == binary)
+                   and (topic is None or topic in client.topics)
+                   for client in self.clients if not client.web_socket.closed)
+
+    def publish(self, payload, binary=None, received_at=None, topic=None, client=None):
+        """Queue an already serialized payload for delivery.
+
+        Args:
+            payload: str (sent as text) or bytes (sent as binary)
+            binary: None for every client, or only the clients whose
+                ``binary`` flag matches
+            received_at: time.time() receive timestamp of the oldest CAN
+                frame in the payload (recorded in data_age once sent)
+            topic: None for every client, or only the clients that have it
+                in ``topics``
+            client: None, or the one ClientConnection to send to (e.g. a
+                keyframe for a client that lost an update)
+        """
+        published_at = self._loop.time() if self._loop is not None else 0.0
+        self.published += 1
+        for connection in (self.clients if client is None else (client,)):
+            if ((binary is None or connection.binary == binary)
+                    and (topic is None or topic in connection.topics)
+                    and not connection.web_socket.closed):
+                connection.enqueue(payload, published_at, received_at)
+
+    async def close(self):
+        """Close every client connection."""
+        for client in list(self.clients):
+            await client.web_socket.close()
+            await self.remove(client)
+
+    def stats(self):
+        """Return the statistics of every connected client."""
+        return [client.stats() for client in self.clients]
+